@@ -0,0 +1 @@
+""" Benchmarks for scraping, cleaning and scoring (run modules with python -m benchmarks.<name>) """
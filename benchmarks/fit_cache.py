@@ -0,0 +1,153 @@
+""" Benchmark the fit cache: cost of hits and misses against uncached fits, and its effect on scoring driver jobs """
+
+import argparse
+import hashlib
+import shutil
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+import driver
+from benchmarks.pipeline import use_stores
+from benchmarks.synthetic import generate_season
+from yafsa.score import DCGScorer, DifferenceScorer, FitCache
+
+
+def make_points(n_players, n_weeks, random_state):
+    """
+    Synthetic weekly points of a position indexed by player name
+    :param n_players:
+    :param n_weeks:
+    :param random_state: np.random.RandomState
+    :return: DataFrame (players x weeks)
+    """
+    players = pd.Index([u'First%i Last%i' % (i, i) for i in xrange(n_players)], name='Player')
+    points = np.round(random_state.gamma(2., 5., (n_players, n_weeks)), 1)
+    points[random_state.rand(n_players, n_weeks) < 0.1] = np.nan
+    return pd.DataFrame(points, index=players, columns=['Week %i' % week for week in xrange(1, n_weeks + 1)])
+
+
+def content_hash(scorer, data):
+    """
+    Content hash of fitted data, as the fit cache was first keyed (kept to show what keying by identity saves)
+    :param scorer:
+    :param data: Series or DataFrame
+    :return:
+    """
+    fingerprint = hashlib.sha1()
+    fingerprint.update(type(scorer).__name__)
+    fingerprint.update(repr(sorted(scorer.fit_params().items())))
+    values = np.ascontiguousarray(np.asarray(data, dtype=float))
+    fingerprint.update(repr(values.shape))
+    fingerprint.update(values.tostring())
+    fingerprint.update(u'\x00'.join(unicode(label) for label in data.index).encode('utf-8'))
+    return fingerprint.hexdigest()
+
+
+def mean_time(func, repeat):
+    """
+    Mean seconds per call over repeat calls of func
+    :param func:
+    :param repeat:
+    :return:
+    """
+    start = time.time()
+    for _ in xrange(repeat):
+        func()
+    return (time.time() - start) / repeat
+
+
+def time_fits(n_players, n_weeks, repeat, seed=0):
+    """
+    Time a DCGScorer fit to one week and a DifferenceScorer fit to every week: uncached, cache misses (fit and
+    store under a new key), cache hits, and the content hash the cache used to be keyed by
+    :param n_players:
+    :param n_weeks:
+    :param repeat:
+    :param seed:
+    :return: list of (scorer, uncached, miss, hit, content hash) tuples of microseconds per fit
+    """
+    points = make_points(n_players, n_weeks, np.random.RandomState(seed))
+    cases = [('DCG', lambda cache: DCGScorer(k=25, numerator='exp', fit_cache=cache), points['Week 1']),
+             ('Diff', lambda cache: DifferenceScorer(k=25, standardize=True, fit_cache=cache), points)]
+    results = []
+    for name, make_scorer, data in cases:
+        uncached = mean_time(lambda: make_scorer(None).fit(data), repeat)
+        scorer = make_scorer(FitCache(max_size=repeat + 1))
+        keys = iter(xrange(repeat))
+        miss = mean_time(lambda: scorer.fit(data, fit_key=next(keys)), repeat)
+        hit = mean_time(lambda: scorer.fit(data, fit_key=0), repeat)
+        hashed = mean_time(lambda: content_hash(scorer, data), repeat)
+        results.append((name, 1e6 * uncached, 1e6 * miss, 1e6 * hit, 1e6 * hashed))
+    return results
+
+
+def time_jobs(n_players, n_experts, n_weeks, positions, repeat, seed=0):
+    """
+    Time scoring the jobs of a synthetic season (loaded once, as driver.iter_jobs loads them) with the driver's fit
+    cache, emptied before each run, and without it
+    :param n_players:
+    :param n_experts:
+    :param n_weeks:
+    :param positions:
+    :param repeat: number of timed runs (best is kept)
+    :param seed:
+    :return: dict mapping 'cached'/'uncached' to seconds, and 'hits'/'misses' of a cached run
+    """
+    directory = tempfile.mkdtemp(prefix='yafsa-benchmark-')
+    scorers = [driver.dcg_scorer, driver.diff_scorer]
+    try:
+        generate_season(directory, driver.YEAR, positions, n_players, n_experts, n_weeks,
+                        n_sources=len(driver.SOURCES), seed=seed)
+        use_stores(directory, n_weeks)
+        points = driver.load_points(driver.YEAR, positions)
+        jobs = list(driver.iter_jobs(driver.YEAR, range(1, n_weeks + 1), positions, driver.SOURCES, points))
+        driver._init_worker(points)
+        results = {}
+        for mode, cache in (('uncached', None), ('cached', driver.fit_cache)):
+            for scorer in scorers:
+                scorer.fit_cache = cache
+            best = float('inf')
+            for _ in xrange(repeat):
+                driver.fit_cache.clear()
+                driver.fit_cache.hits = driver.fit_cache.misses = 0
+                start = time.time()
+                for job in jobs:
+                    driver._score_job(job)
+                best = min(best, time.time() - start)
+            results[mode] = best
+        results['hits'], results['misses'] = driver.fit_cache.hits, driver.fit_cache.misses
+        return results
+    finally:
+        for scorer in scorers:
+            scorer.fit_cache = driver.fit_cache
+        driver._init_worker({})
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def parse_args():
+    """
+    Parse command line arguments
+    :return:
+    """
+    parser = argparse.ArgumentParser(description='Benchmark fit cache hits and misses against uncached fits')
+    parser.add_argument('--players', type=int, default=400, help='number of players of each position')
+    parser.add_argument('--weeks', type=int, default=17, help='number of weeks')
+    parser.add_argument('--experts', type=int, default=16, help='number of experts (jobs benchmark)')
+    parser.add_argument('--positions', nargs='+', default=['WR', 'TE'], help='positions (jobs benchmark)')
+    parser.add_argument('--repeat', type=int, default=200, help='number of timed fits')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic data')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+
+    args = parse_args()
+    print 'microseconds per fit (%i players, %i weeks)' % (args.players, args.weeks)
+    print '%-6s %10s %10s %10s %14s' % ('scorer', 'uncached', 'miss', 'hit', 'content hash')
+    for name, uncached, miss, hit, hashed in time_fits(args.players, args.weeks, args.repeat, args.seed):
+        print '%-6s %10.1f %10.1f %10.1f %14.1f' % (name, uncached, miss, hit, hashed)
+    jobs = time_jobs(args.players, args.experts, args.weeks, args.positions, 5, args.seed)
+    print 'scoring %i jobs: %.3f s uncached, %.3f s cached (%i hits, %i misses)' % (
+        args.weeks * len(args.positions), jobs['uncached'], jobs['cached'], jobs['hits'], jobs['misses'])
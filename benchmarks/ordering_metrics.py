@@ -0,0 +1,95 @@
+""" Time the vectorized ordering metrics on synthetic weeks (tests/test_ordering.py checks their values) """
+
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from yafsa.score import AveragePrecisionScorer, FootruleScorer, KendallTauScorer, PrecisionScorer, RBOScorer
+
+
+SCORERS = [
+    ('Precision', PrecisionScorer),
+    ('AP', AveragePrecisionScorer),
+    ('RBO', RBOScorer),
+    ('Footrule', FootruleScorer),
+    ('KendallTau', KendallTauScorer),
+]
+
+
+def make_season(n_players, n_experts, n_weeks, random_state):
+    """
+    Synthetic compact arrays: points with ties and missing players, rankings of a random subset of players
+    :param n_players:
+    :param n_experts:
+    :param n_weeks:
+    :param random_state: np.random.RandomState
+    :return: tuple (rank_array, points_array)
+    """
+    points_array = np.round(random_state.gamma(2., 5., (n_players, n_weeks)))
+    points_array[random_state.rand(n_players, n_weeks) < 0.1] = np.nan
+    rank_array = np.full((n_players, n_experts, n_weeks), np.nan)
+    n_ranked = max(2, n_players / 2)
+    for expert in xrange(n_experts):
+        for week in xrange(n_weeks):
+            ranked = random_state.choice(n_players, n_ranked, replace=False)
+            rank_array[ranked, expert, week] = np.arange(1, n_ranked + 1)
+    return rank_array, points_array
+
+
+def best_time(func, repeat):
+    """
+    Best time over repeat calls of func
+    :param func:
+    :param repeat:
+    :return: seconds
+    """
+    best = float('inf')
+    for _ in xrange(repeat):
+        start = time.time()
+        func()
+        best = min(best, time.time() - start)
+    return best
+
+
+def run(n_players, n_experts, n_weeks, k, repeat, seed):
+    """
+    Time each scorer on a synthetic season, batched and one expert and week at a time
+    :param n_players:
+    :param n_experts:
+    :param n_weeks:
+    :param k: list depth
+    :param repeat:
+    :param seed:
+    :return: DataFrame of timings indexed by metric
+    """
+    random_state = np.random.RandomState(seed)
+    rank_array, points_array = make_season(n_players, n_experts, n_weeks, random_state)
+    rows = []
+    for name, scorer_class in SCORERS:
+        scorer = scorer_class(k=k)
+        batched = best_time(lambda: scorer.score_arrays(rank_array, points_array), repeat)
+        columns = best_time(lambda: [scorer.fit(points_array[:, week]).score(rank_array[:, :, week])
+                                     for week in xrange(n_weeks)], repeat)
+        rows.append({'metric': name, 'season_batched': batched, 'weekly': columns})
+    return pd.DataFrame(rows).set_index('metric')[['season_batched', 'weekly']]
+
+
+def parse_args():
+    """
+    Parse command line arguments
+    :return:
+    """
+    parser = argparse.ArgumentParser(description='Time the ordering metrics')
+    parser.add_argument('--players', type=int, default=300, help='number of players')
+    parser.add_argument('--experts', type=int, default=20, help='number of experts')
+    parser.add_argument('--weeks', type=int, default=17, help='number of weeks')
+    parser.add_argument('--k', type=int, default=25, help='list depth')
+    parser.add_argument('--repeat', type=int, default=5, help='number of timed runs (best is reported)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic data')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+
+    args = parse_args()
+    print run(args.players, args.experts, args.weeks, args.k, args.repeat, args.seed).to_string(float_format='%.5f')
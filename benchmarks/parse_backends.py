@@ -0,0 +1,131 @@
+""" Benchmark TableScraper parser backends on fixture pages from fantasypros and thehuddle, saved or synthetic """
+
+import argparse
+import os
+import time
+from contextlib import closing
+from urllib2 import urlopen
+from benchmarks.synthetic import rankings_page, stats_page
+from yafsa.scrape import PARSERS, TableScraper
+
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'fixtures')
+
+# fixture name -> (url used to save the fixture, header rows to skip, generator of synthetic pages in the same markup)
+FIXTURES = {
+    'fantasypros': ('http://partners.fantasypros.com/external/widget/nfl-staff-rankings.php?'
+                    '&year=2016&scoring=STD&position=WR&week=1&source=1', 0, rankings_page),
+    'thehuddle': ('http://thehuddle.com/stats/2016/plays_weekly.php?ccs=5&pos=WR&week=1', 1, stats_page),
+}
+
+
+def save_fixtures(fixture_dir):
+    """
+    Download a page for each fixture
+    :param fixture_dir:
+    :return:
+    """
+    if not os.path.exists(fixture_dir):
+        os.makedirs(fixture_dir)
+    for name, (url, _, _) in sorted(FIXTURES.items()):
+        with closing(urlopen(url)) as urlhandle, open(os.path.join(fixture_dir, '%s.html' % name), 'w') as f:
+            f.write(urlhandle.read())
+
+
+def load_page(name, fixture_dir, n_players=None, seed=0):
+    """
+    Page of a fixture: the page saved in fixture_dir, or a synthetic page if there is none (or if n_players is given)
+    :param name: fixture name
+    :param fixture_dir:
+    :param n_players: number of rows of a synthetic page (defaults to the size of the real pages)
+    :param seed: seed of a synthetic page
+    :return: tuple (string of html, whether the page is synthetic)
+    """
+    path = os.path.join(fixture_dir, '%s.html' % name)
+    if n_players is None and os.path.exists(path):
+        with open(path) as f:
+            return f.read(), False
+    generate = FIXTURES[name][2]
+    return (generate(seed=seed) if n_players is None else generate(n_players, seed=seed)), True
+
+
+def available_parsers():
+    """
+    Parser backends that can be constructed in this environment
+    :return:
+    """
+    parsers = []
+    for parser in PARSERS:
+        try:
+            TableScraper(parser=parser)
+            parsers.append(parser)
+        except ValueError:
+            pass
+    return parsers
+
+
+def time_parser(page, parser, header_rows_to_skip, repeat):
+    """
+    Best time over repeat parses of a page
+    :param page: string of html
+    :param parser: parser backend
+    :param header_rows_to_skip:
+    :param repeat:
+    :return: tuple (records, seconds)
+    """
+    ts = TableScraper(header_rows_to_skip=header_rows_to_skip, parser=parser)
+    best = float('inf')
+    records = None
+    for _ in xrange(repeat):
+        start = time.time()
+        records = ts.parse_page(page)
+        best = min(best, time.time() - start)
+    return records, best
+
+
+def run(fixture_dir, repeat, n_players=None):
+    """
+    Time every available backend on every fixture, checking that all backends return the same records
+    :param fixture_dir:
+    :param repeat:
+    :param n_players: number of rows of synthetic pages used instead of the saved pages (see load_page)
+    :return: list of (fixture, parser, records, records/sec, whether the page is synthetic) tuples
+    """
+    results = []
+    for name, (_, header_rows_to_skip, _) in sorted(FIXTURES.items()):
+        page, synthetic = load_page(name, fixture_dir, n_players)
+        expected = None
+        for parser in available_parsers():
+            records, seconds = time_parser(page, parser, header_rows_to_skip, repeat)
+            if expected is None:
+                expected = records
+            elif records != expected:
+                raise AssertionError('%s parser returned different records for %s' % (parser, name))
+            results.append((name, parser, len(records), len(records) / seconds if seconds else float('inf'),
+                            synthetic))
+    return results
+
+
+def parse_args():
+    """
+    Parse command line arguments
+    :return:
+    """
+    parser = argparse.ArgumentParser(description='Compare records/sec of TableScraper parser backends')
+    parser.add_argument('--fixture-dir', default=FIXTURE_DIR, help='directory of <fixture>.html pages')
+    parser.add_argument('--repeat', type=int, default=5, help='number of timed parses per backend (best is kept)')
+    parser.add_argument('--save', action='store_true', help='download fixture pages before benchmarking')
+    parser.add_argument('--synthetic', type=int, default=None, metavar='PLAYERS',
+                        help='benchmark synthetic pages of this many rows instead of the saved pages (synthetic '
+                             'pages of the size of the real ones are used for fixtures that were not saved)')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+
+    args = parse_args()
+    if args.save:
+        save_fixtures(args.fixture_dir)
+    print '%-12s %-12s %8s %14s %10s' % ('fixture', 'parser', 'records', 'records/sec', 'page')
+    for name, parser, n_records, rate, synthetic in run(args.fixture_dir, args.repeat, args.synthetic):
+        print '%-12s %-12s %8i %14.0f %10s' % (name, parser, n_records, rate, 'synthetic' if synthetic else 'saved')
@@ -0,0 +1,224 @@
+""" Benchmark the driver pipeline (store reads, clean_data, scorers and composite ordering) on synthetic seasons
+
+Run a benchmark and write the results to a JSON file:
+
+    python -m benchmarks.pipeline --players 300 --experts 40 --seasons 2 --output new.json
+
+and compare two results files, flagging regressions beyond a relative threshold (exits 1 if any):
+
+    python -m benchmarks.pipeline --compare base.json new.json --threshold 0.1
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+import driver
+from benchmarks.synthetic import RANKINGS_DIR, STATS_DIR, generate_season
+from yafsa.clean import PlayerRegistry
+from yafsa.store import SeasonStore
+
+
+# metrics compared by --compare (lower is better, except for rates)
+COMPARED_METRICS = ['load_seconds', 'score_seconds', 'pipeline_seconds', 'jobs_per_second', 'rankings_per_second',
+                    'latency_ms.p50', 'latency_ms.p90', 'latency_ms.p99', 'latency_ms.max', 'peak_memory_mb']
+# metrics shown by --compare but never flagged (generating the synthetic data is not part of the pipeline)
+INFORMATIONAL_METRICS = ['generate_seconds']
+
+
+def peak_memory_mb():
+    """
+    Peak resident memory of this process and of its terminated children (ru_maxrss is in kilobytes on Linux)
+    :return: tuple (self, children) in megabytes
+    """
+    scale = 1024. ** 2 if sys.platform == 'darwin' else 1024.
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale)
+
+
+def use_stores(directory, n_weeks):
+    """
+    Point the driver at the synthetic stores under directory (fresh stores, so that nothing is read from cache)
+    :param directory:
+    :param n_weeks:
+    :return:
+    """
+    driver.stats_store = SeasonStore(os.path.join(directory, STATS_DIR))
+    driver.rank_store = SeasonStore(os.path.join(directory, RANKINGS_DIR))
+    driver.WEEKS = range(1, n_weeks + 1)
+    driver.player_registry = PlayerRegistry()
+    driver.fit_cache.clear()
+
+
+def run(n_players, n_experts, n_weeks, positions, n_seasons, seed=0, processes=1, metrics=driver.COMPOSITE_METRICS,
+        directory=None):
+    """
+    Generate synthetic seasons and time the driver pipeline on them
+    :param n_players: number of players of each position
+    :param n_experts: number of experts
+    :param n_weeks: number of weeks of each season
+    :param positions: list of positions
+    :param n_seasons: number of seasons
+    :param seed: seed of the synthetic data
+    :param processes: number of worker processes of the end to end run (1 runs serially)
+    :param metrics: names of the driver scorers combined into the composite ordering
+    :param directory: directory for the synthetic stores (defaults to a temporary directory, removed afterwards)
+    :return: dict of results
+    """
+    n_sources = len(driver.SOURCES)
+    years = range(driver.YEAR - n_seasons + 1, driver.YEAR + 1)
+    weeks = range(1, n_weeks + 1)
+    remove = directory is None
+    directory = directory or tempfile.mkdtemp(prefix='yafsa-benchmark-')
+    try:
+        start = time.time()
+        n_stats = n_ranks = 0
+        for year in years:
+            season_stats, season_ranks = generate_season(directory, year, positions, n_players, n_experts, n_weeks,
+                                                         n_sources=n_sources, seed=seed)
+            n_stats += season_stats
+            n_ranks += season_ranks
+        generate_seconds = time.time() - start
+
+        # load and score each job serially, so that latencies are those of single jobs
+        load_seconds = score_seconds = 0.
+        latencies = []
+        n_rankings = 0
+        for year in years:
+            use_stores(directory, n_weeks)
+            start = time.time()
+            points = driver.load_points(year, positions)
+            jobs = list(driver.iter_jobs(year, weeks, positions, driver.SOURCES, points, metrics))
+            load_seconds += time.time() - start
+            driver._init_worker(points)
+            for job in jobs:
+                start = time.time()
+                driver._score_job(job)
+                latencies.append(time.time() - start)
+                n_rankings += job[3].shape[1]
+            driver._init_worker({})
+            score_seconds += sum(latencies[-len(jobs):])
+
+        # end to end, as driver.py runs it
+        pipeline_seconds = 0.
+        for year in years:
+            use_stores(directory, n_weeks)
+            start = time.time()
+            driver.score_season(year, weeks, positions, processes=processes, metrics=metrics)
+            pipeline_seconds += time.time() - start
+    finally:
+        if remove:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    latencies_ms = 1000. * np.array(latencies)
+    memory_self, memory_children = peak_memory_mb()
+    return {
+        'config': {'players': n_players, 'experts': n_experts, 'weeks': n_weeks, 'positions': list(positions),
+                   'seasons': n_seasons, 'seed': seed, 'processes': processes, 'metrics': list(metrics)},
+        'environment': {'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+                        'platform': platform.platform()},
+        'records': {'stats': n_stats, 'rankings': n_ranks},
+        'jobs': len(latencies),
+        'generate_seconds': generate_seconds,
+        'load_seconds': load_seconds,
+        'score_seconds': score_seconds,
+        'pipeline_seconds': pipeline_seconds,
+        'jobs_per_second': len(latencies) / (load_seconds + score_seconds),
+        'rankings_per_second': n_rankings / (load_seconds + score_seconds),
+        'latency_ms': {'p50': np.percentile(latencies_ms, 50), 'p90': np.percentile(latencies_ms, 90),
+                       'p99': np.percentile(latencies_ms, 99), 'max': latencies_ms.max()},
+        'peak_memory_mb': max(memory_self, memory_children),
+    }
+
+
+def _lookup(results, metric):
+    """
+    Value of a (dotted) metric in results, or None if missing
+    :param results:
+    :param metric: e.g., 'latency_ms.p90'
+    :return:
+    """
+    for key in metric.split('.'):
+        if not isinstance(results, dict) or key not in results:
+            return None
+        results = results[key]
+    return results
+
+
+def compare(base, new, threshold=0.1):
+    """
+    Compare two benchmark results
+    :param base: dict of baseline results
+    :param new: dict of new results
+    :param threshold: relative change beyond which a worse metric is a regression
+    :return: DataFrame indexed by metric with base, new, relative change and regression flag (always False for
+        the informational metrics)
+    """
+    rows = []
+    for metric in COMPARED_METRICS + INFORMATIONAL_METRICS:
+        base_value, new_value = _lookup(base, metric), _lookup(new, metric)
+        if base_value is None or new_value is None:
+            continue
+        change = (new_value - base_value) / float(base_value) if base_value else 0.
+        # rates are better higher, everything else (durations, memory) is better lower
+        worse = -change if metric.endswith('per_second') else change
+        rows.append({'metric': metric, 'base': base_value, 'new': new_value, 'change': change,
+                     'regression': metric in COMPARED_METRICS and worse > threshold})
+    return pd.DataFrame(rows, columns=['metric', 'base', 'new', 'change', 'regression']).set_index('metric')
+
+
+def parse_args():
+    """
+    Parse command line arguments
+    :return:
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the scoring pipeline on synthetic seasons')
+    parser.add_argument('--players', type=int, default=150, help='number of players of each position')
+    parser.add_argument('--experts', type=int, default=30, help='number of experts')
+    parser.add_argument('--weeks', type=int, default=17, help='number of weeks of each season')
+    parser.add_argument('--positions', nargs='+', default=driver.POSITIONS, help='positions')
+    parser.add_argument('--seasons', type=int, default=1, help='number of seasons')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic data')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='number of worker processes of the end to end run (1 runs serially)')
+    parser.add_argument('--metrics', nargs='+', default=driver.COMPOSITE_METRICS, choices=sorted(driver.SCORERS),
+                        help='metrics combined into the composite ranking')
+    parser.add_argument('--data-dir', default=None,
+                        help='directory to keep the synthetic stores in (defaults to a removed temporary directory)')
+    parser.add_argument('--output', default=None, help='JSON file to write the results to (defaults to stdout)')
+    parser.add_argument('--compare', nargs=2, default=None, metavar=('BASE', 'NEW'),
+                        help='compare two results files instead of running the benchmark')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative change beyond which a worse metric is flagged as a regression')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+
+    args = parse_args()
+    if args.compare:
+        with open(args.compare[0]) as base_file, open(args.compare[1]) as new_file:
+            comparison = compare(json.load(base_file), json.load(new_file), args.threshold)
+        print comparison.to_string(float_format='%.4f')
+        regressions = comparison.index[comparison['regression']].tolist()
+        if regressions:
+            print 'Regressions beyond %.0f%%: %s' % (100 * args.threshold, ', '.join(regressions))
+            sys.exit(1)
+        print 'No regressions beyond %.0f%%' % (100 * args.threshold)
+    else:
+        results = run(args.players, args.experts, args.weeks, args.positions, args.seasons, args.seed,
+                      args.processes, args.metrics, args.data_dir)
+        output = json.dumps(results, indent=2, sort_keys=True)
+        if args.output:
+            with open(args.output, 'w') as output_file:
+                output_file.write(output + '\n')
+        else:
+            print output
@@ -0,0 +1,144 @@
+""" Generate synthetic seasons of scraped stats and rankings, in the format of the scraped tables, for offline benchmarks """
+
+import os
+import numpy as np
+from yafsa.store import SeasonStore
+
+
+STATS_DIR = 'stats'
+RANKINGS_DIR = 'rankings'
+
+
+def expert_names(n_experts):
+    """
+    Names of the synthetic experts (letters only, since scraped labels end with a date that clean_data strips)
+    :param n_experts:
+    :return:
+    """
+    names = []
+    for i in xrange(n_experts):
+        letters = ''
+        while True:
+            i, letter = divmod(i, 26)
+            letters = chr(ord('A') + letter) + letters
+            if i == 0:
+                break
+            i -= 1
+        names.append('Expert%s' % letters)
+    return names
+
+
+def split_sources(experts, n_sources):
+    """
+    Spread experts over ranking sources, as fantasypros spreads them over pages
+    :param experts: list of expert names
+    :param n_sources: maximum number of sources
+    :return: list of lists of expert names, one for each source
+    """
+    n_sources = max(1, min(n_sources, len(experts)))
+    return [experts[i::n_sources] for i in xrange(n_sources)]
+
+
+def generate_season(directory, year, positions, n_players=150, n_experts=16, n_weeks=17, n_ranked=None,
+                    n_sources=4, seed=0):
+    """
+    Write a synthetic season to season stores under directory: stats tables (thehuddle format) with a player column
+    and text FPTS, and ranking tables (fantasypros format) with one column of text ranks for each expert
+    :param directory: root directory of the stats and rankings stores
+    :param year:
+    :param positions: list of positions
+    :param n_players: number of players of each position
+    :param n_experts: number of experts
+    :param n_weeks: number of weeks
+    :param n_ranked: number of players ranked each week (defaults to two thirds of the players)
+    :param n_sources: number of ranking sources the experts are spread over
+    :param seed: seed of the random data
+    :return: tuple (number of stats records, number of ranking records)
+    """
+    random_state = np.random.RandomState([seed, year])
+    n_ranked = min(n_players, n_ranked or 2 * n_players // 3)
+    sources = split_sources(expert_names(n_experts), n_sources)
+    stats_store = SeasonStore(os.path.join(directory, STATS_DIR))
+    rank_store = SeasonStore(os.path.join(directory, RANKINGS_DIR))
+    n_stats = n_ranks = 0
+
+    for position in positions:
+        names = ['First%i Last%s%i' % (i, position, i) for i in xrange(n_players)]
+        suffixes = random_state.choice(['', ' Jr.', ' III'], n_players, p=[0.9, 0.08, 0.02])
+        # each player's underlying quality, so that experts can rank better than chance
+        quality = random_state.gamma(2., 5., n_players)
+        for week in xrange(1, n_weeks + 1):
+            points = np.maximum(0, quality + random_state.normal(0, 6., n_players))
+            played = random_state.rand(n_players) > 0.1
+            records = [{'PLAYER': '%s%s, NYG' % (names[i], suffixes[i]), 'FPTS': '%.1f' % points[i],
+                        'YDS': str(int(10 * points[i]))} for i in np.flatnonzero(played)]
+            n_stats += stats_store.write(records, year, week, position)
+
+            # consensus order of the ranked players, and each expert's noisy version of it
+            consensus = np.argsort(-(quality + random_state.normal(0, 3., n_players)))[:n_ranked]
+            date = '9/%i' % week
+            for source, experts in enumerate(sources, 1):
+                ranks = {}
+                for expert in experts:
+                    opinion = np.argsort(np.arange(n_ranked) + random_state.normal(0, n_ranked / 8., n_ranked))
+                    expert_ranks = np.empty(n_ranked, dtype=int)
+                    expert_ranks[opinion] = np.arange(1, n_ranked + 1)
+                    ranks[expert] = expert_ranks
+                records = []
+                for row, player in enumerate(consensus):
+                    record = {'Rank': str(row + 1), 'FantasyProsAll Experts': str(row + 1),
+                              'Player (matchup)': '%s%s NYG vs DAL' % (names[player], suffixes[player])}
+                    for expert in experts:
+                        # experts occasionally leave players unranked
+                        unranked = random_state.rand() < 0.03
+                        record['%s%s' % (expert, date)] = '' if unranked else str(ranks[expert][row])
+                    records.append(record)
+                n_ranks += rank_store.write(records, year, week, position, source)
+
+    stats_store.flush()
+    rank_store.flush()
+    return n_stats, n_ranks
+
+
+def rankings_page(n_players=300, n_experts=16, seed=0):
+    """
+    Html page with a synthetic rankings table in the markup of the fantasypros staff rankings widget (expert
+    headers ending with a date in a span, linked players with a matchup, a few unranked players, and markup
+    around the table), to be scraped with header_rows_to_skip=0
+    :param n_players: number of rows
+    :param n_experts: number of expert columns
+    :param seed: seed of the random data
+    :return: string of html
+    """
+    random_state = np.random.RandomState([seed, n_players, n_experts])
+    experts = expert_names(n_experts)
+    headers = ''.join('<th><a href="/experts/%s">%s <span>9/%i</span></a></th>'
+                      % (expert.lower(), expert, i % 7 + 1) for i, expert in enumerate(experts))
+    rows = []
+    for row in xrange(n_players):
+        ranks = random_state.permutation(n_players)[:n_experts] + 1
+        unranked = random_state.rand(n_experts) < 0.03
+        cells = ''.join('<td>%s</td>' % ('' if skip else rank) for rank, skip in zip(ranks, unranked))
+        rows.append('<tr class="player-row"><td>%i</td><td><a href="/players/%i">First%i O&#39;Last%i Jr.</a> '
+                    '<small>NYG vs DAL</small></td>%s<td>%i</td></tr>' % (row + 1, row, row, row, cells, row + 1))
+    return ('<html><head><title>Staff rankings &amp; notes</title></head><body><div class="notes">Week 1</div>\n'
+            '<table class="rankings"><thead><tr><th>Rank</th><th>Player (matchup)</th>%s'
+            '<th>FantasyPros<br/>All Experts</th></tr></thead><tbody>\n%s\n</tbody></table>\n'
+            '<table><tr><td>footer</td></tr></table></body></html>\n' % (headers, '\n'.join(rows)))
+
+
+def stats_page(n_players=400, seed=0):
+    """
+    Html page with a synthetic weekly stats table in the markup of thehuddle (a title row above the header row,
+    escaped apostrophes in names), to be scraped with header_rows_to_skip=1
+    :param n_players: number of rows
+    :param seed: seed of the random data
+    :return: string of html
+    """
+    random_state = np.random.RandomState([seed, n_players])
+    points = np.maximum(0, random_state.gamma(2., 5., n_players) + random_state.normal(0, 6., n_players))
+    rows = ['<tr><td>First%i O&#39;Last%i, NYG</td><td>NYG</td><td>%i</td><td>%i</td><td>%.1f</td></tr>'
+            % (i, i, int(10 * points[i]), random_state.randint(0, 3), points[i]) for i in xrange(n_players)]
+    return ('<html><body>\n<table>\n<tr><td colspan="5">Weekly stats</td></tr>\n'
+            '<tr><th>PLAYER</th><th>TEAM</th><th>YDS</th><th>TD</th><th>FPTS</th></tr>\n%s\n</table>\n'
+            '</body></html>\n' % '\n'.join(rows))
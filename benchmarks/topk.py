@@ -0,0 +1,154 @@
+""" Benchmark the top-k partial-sort path of the ranking metrics against full sorts as the player pool grows """
+
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from yafsa.score import BatchDCGScorer, DCGScorer
+from yafsa.score.metrics import BaseScorer
+
+
+def make_week(n_players, n_experts, random_state):
+    """
+    Synthetic week of points and expert rankings of the top half of the players
+    :param n_players:
+    :param n_experts:
+    :param random_state: np.random.RandomState
+    :return: tuple (ranks DataFrame, points Series)
+    """
+    players = pd.Index(['Player %i' % i for i in xrange(n_players)], name='Player')
+    points = pd.Series(np.round(random_state.gamma(2., 5., n_players), 1), index=players, name='points')
+    points[random_state.rand(n_players) < 0.1] = np.nan
+    n_ranked = max(1, n_players / 2)
+    ranks = pd.DataFrame(np.nan, index=players, columns=['Expert %i' % j for j in xrange(n_experts)])
+    for expert in ranks.columns:
+        ranked = random_state.choice(n_players, n_ranked, replace=False)
+        ranks.loc[players[ranked], expert] = np.arange(1, n_ranked + 1)
+    return ranks, points
+
+
+def best_time(func, repeat):
+    """
+    Best time over repeat calls of func
+    :param func:
+    :param repeat:
+    :return: tuple (result, seconds)
+    """
+    best = float('inf')
+    result = None
+    for _ in xrange(repeat):
+        start = time.time()
+        result = func()
+        best = min(best, time.time() - start)
+    return result, best
+
+
+def full_sort_dcg(scorer, ranks, points):
+    """
+    DCG of every expert computed by fully sorting each ranking and the points (the path without top-k selection)
+    :param scorer: DCGScorer
+    :param ranks: DataFrame of ranks
+    :param points: Series of points
+    :return: array of scores
+    """
+    valid = points.values[~np.isnan(points.values)]
+    max_score = scorer._dcg(-np.sort(-valid))
+    return np.array([scorer._dcg(np.asarray(BaseScorer.sort_points_by_rank(ranks[expert], points))) / max_score
+                     for expert in ranks.columns])
+
+
+def full_sort_batch(scorer, rank_array, points_array):
+    """
+    Batched DCG with every column fully sorted
+    :param scorer: BatchDCGScorer
+    :param rank_array: array of ranks (players x experts x weeks)
+    :param points_array: array of points (players x weeks)
+    :return:
+    """
+    full_scorer = BatchDCGScorer(k=None, numerator=scorer.numerator, normalize=False)
+    k = int(min(scorer.k, points_array.shape[0]))
+    valid = np.broadcast_to(~np.isnan(points_array)[:, None, :], rank_array.shape)
+    # unranked players follow the ranked players in ID order (the stable sort keeps ID order among them)
+    ranks = np.where(valid, np.where(np.isnan(rank_array), np.nanmax(rank_array) + 1, rank_array), np.inf)
+    order = np.argsort(ranks, axis=0, kind='mergesort')[:k]
+    expert_idx = np.arange(rank_array.shape[1])[None, :, None]
+    week_idx = np.arange(rank_array.shape[2])[None, None, :]
+    gains = points_array[order, week_idx]
+    scored = valid[order, expert_idx, week_idx]
+    return full_scorer._batch_dcg(gains, scored)
+
+
+def run(pool_sizes, n_experts, n_weeks, k, repeat, seed):
+    """
+    Time full-sort and top-k paths for each pool size (sorting compact arrays of points by rank, scoring a week's
+    DataFrame of rankings, and batched scoring of a season), checking that the results are identical
+    :param pool_sizes: list of numbers of players
+    :param n_experts:
+    :param n_weeks: number of weeks scored by the batched scorer
+    :param k: rank depth
+    :param repeat:
+    :param seed:
+    :return: DataFrame of timings indexed by pool size
+    """
+    random_state = np.random.RandomState(seed)
+    rows = []
+    for n_players in pool_sizes:
+        ranks, points = make_week(n_players, n_experts, random_state)
+        scorer = DCGScorer(k=k, numerator='exp')
+
+        full, full_time = best_time(lambda: full_sort_dcg(scorer, ranks, points), repeat)
+        top_k, top_k_time = best_time(lambda: scorer.fit(points).score(ranks).values, repeat)
+        if not np.allclose(full, top_k):
+            raise AssertionError('Top-k scores differ from full-sort scores for %i players' % n_players)
+
+        rank_values, points_values = ranks.values, points.values
+        sort_full, sort_full_time = best_time(
+            lambda: [BaseScorer.sort_points_by_rank(rank_values[:, j], points_values)[:k]
+                     for j in xrange(n_experts)], repeat)
+        sort_top_k, sort_top_k_time = best_time(
+            lambda: [BaseScorer.sort_points_by_rank(rank_values[:, j], points_values, k)
+                     for j in xrange(n_experts)], repeat)
+        if not all(np.array_equal(a, b) for a, b in zip(sort_full, sort_top_k)):
+            raise AssertionError('Top-k sorted points differ from full-sort points for %i players' % n_players)
+
+        rank_array = np.dstack([make_week(n_players, n_experts, random_state)[0].values for _ in xrange(n_weeks)])
+        points_array = np.column_stack([make_week(n_players, 1, random_state)[1].values for _ in xrange(n_weeks)])
+        batch_scorer = BatchDCGScorer(k=k, numerator='exp', normalize=False)
+        batch_full, batch_full_time = best_time(lambda: full_sort_batch(batch_scorer, rank_array, points_array),
+                                                repeat)
+        batch_top_k, batch_top_k_time = best_time(lambda: batch_scorer.score_arrays(rank_array, points_array),
+                                                  repeat)
+        if not np.allclose(batch_full, batch_top_k):
+            raise AssertionError('Batched top-k scores differ from full-sort scores for %i players' % n_players)
+
+        rows.append({'players': n_players, 'sort_full': sort_full_time, 'sort_top_k': sort_top_k_time,
+                     'score_full': full_time, 'score_top_k': top_k_time,
+                     'batch_full': batch_full_time, 'batch_top_k': batch_top_k_time})
+
+    timings = pd.DataFrame(rows).set_index('players')
+    for stage in ['sort', 'score', 'batch']:
+        timings['%s_speedup' % stage] = timings['%s_full' % stage] / timings['%s_top_k' % stage]
+    return timings[['%s_%s' % (stage, column) for stage in ['sort', 'score', 'batch']
+                    for column in ['full', 'top_k', 'speedup']]]
+
+
+def parse_args():
+    """
+    Parse command line arguments
+    :return:
+    """
+    parser = argparse.ArgumentParser(description='Benchmark top-k selection against full sorts in the scorers')
+    parser.add_argument('--players', type=int, nargs='+', default=[100, 300, 1000, 3000, 10000],
+                        help='player pool sizes')
+    parser.add_argument('--experts', type=int, default=20, help='number of experts')
+    parser.add_argument('--weeks', type=int, default=17, help='number of weeks scored by the batched scorer')
+    parser.add_argument('--k', type=int, default=25, help='rank depth')
+    parser.add_argument('--repeat', type=int, default=5, help='number of timed runs (best is reported)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic data')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+
+    args = parse_args()
+    print run(args.players, args.experts, args.weeks, args.k, args.repeat, args.seed).to_string(float_format='%.5f')
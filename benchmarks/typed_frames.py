@@ -0,0 +1,101 @@
+""" Compare the memory and scoring time of frames read as text and as compact dtypes (driver --typed) """
+
+import argparse
+import shutil
+import tempfile
+import time
+import pandas as pd
+
+import driver
+from benchmarks.pipeline import use_stores
+from benchmarks.synthetic import generate_season
+
+
+def frame_bytes(frame):
+    """
+    Memory used by a Series or DataFrame, including its index and the strings it holds
+    :param frame:
+    :return:
+    """
+    usage = frame.memory_usage(index=True, deep=True)
+    return usage if isinstance(frame, pd.Series) else usage.sum()
+
+
+def load_history(directory, years, n_weeks, positions, typed):
+    """
+    Load every week of rankings and points of several seasons, as driver.load_points and driver.iter_jobs do
+    :param directory: root directory of the synthetic stores
+    :param years:
+    :param n_weeks:
+    :param positions:
+    :param typed: read compact frames indexed by player ID
+    :return: tuple (list of jobs, dict of points the jobs refer to, seconds)
+    """
+    use_stores(directory, n_weeks)
+    driver.typed_frames = typed
+    start = time.time()
+    jobs, points = [], {}
+    try:
+        for year in years:
+            points.update(driver.load_points(year, positions))
+            jobs.extend(driver.iter_jobs(year, driver.WEEKS, positions, driver.SOURCES, points))
+    finally:
+        driver.typed_frames = False
+    return jobs, points, time.time() - start
+
+
+def run(n_players, n_experts, n_weeks, positions, n_seasons, seed):
+    """
+    Read synthetic seasons as text and as compact dtypes, and measure their memory and scoring time
+    :param n_players:
+    :param n_experts:
+    :param n_weeks:
+    :param positions:
+    :param n_seasons:
+    :param seed:
+    :return: DataFrame indexed by mode
+    """
+    years = range(driver.YEAR - n_seasons + 1, driver.YEAR + 1)
+    directory = tempfile.mkdtemp(prefix='yafsa-typed-')
+    rows = []
+    try:
+        for year in years:
+            generate_season(directory, year, positions, n_players, n_experts, n_weeks,
+                            n_sources=len(driver.SOURCES), seed=seed)
+        for mode, typed in [('text', False), ('typed', True)]:
+            jobs, points, load_seconds = load_history(directory, years, n_weeks, positions, typed)
+            # stats_by_week is shared by the jobs of a position
+            stats = [stats_by_week for stats_by_week, _, _ in points.values()]
+            driver._init_worker(points)
+            start = time.time()
+            for job in jobs:
+                driver._score_job(job)
+            driver._init_worker({})
+            rows.append({'mode': mode, 'load_seconds': load_seconds, 'score_seconds': time.time() - start,
+                         'ranks_mb': sum(frame_bytes(job[3]) for job in jobs) / 1024. ** 2,
+                         'stats_mb': sum(frame_bytes(frame) for frame in stats) / 1024. ** 2})
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return pd.DataFrame(rows).set_index('mode')[['ranks_mb', 'stats_mb', 'load_seconds', 'score_seconds']]
+
+
+def parse_args():
+    """
+    Parse command line arguments
+    :return:
+    """
+    parser = argparse.ArgumentParser(description='Compare frames read as text and as compact dtypes')
+    parser.add_argument('--players', type=int, default=150, help='number of players of each position')
+    parser.add_argument('--experts', type=int, default=30, help='number of experts')
+    parser.add_argument('--weeks', type=int, default=17, help='number of weeks of each season')
+    parser.add_argument('--positions', nargs='+', default=driver.POSITIONS, help='positions')
+    parser.add_argument('--seasons', type=int, default=3, help='number of seasons')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic data')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+
+    args = parse_args()
+    print run(args.players, args.experts, args.weeks, args.positions, args.seasons, args.seed).to_string(
+        float_format='%.3f')
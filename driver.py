@@ -1,58 +1,128 @@
 """ Driver script for analyzing rankings """
 
+import argparse
 import os
+import sys
+import numpy as np
 import pandas as pd
 
 from functools import partial
-from yafsa.clean import clean_data
-from yafsa.score import DCGScorer, DifferenceScorer
+from multiprocessing import Pool
+from yafsa import instrument
+from yafsa.clean import PlayerRegistry, clean_data
+from yafsa.db import Database
+from yafsa.history import build_history, open_seasons
+from yafsa.results import ResultsStore
+from yafsa.score import (AveragePrecisionScorer, DCGScorer, DifferenceScorer, FitCache, FootruleScorer,
+                         KendallTauScorer, PrecisionScorer, RBOScorer, consensus_frames, historical_weights)
+from yafsa.score.aggregate import METHODS as CONSENSUS_METHODS
+from yafsa.score.sweep import composite_curves, dcg_curves, difference_curves, ordering_changes
+from yafsa.store import SeasonStore
 
 
 BASE_DIR = os.path.dirname(__file__)
 STATS_PATH = os.path.join('data', 'stats')
 RANK_PATH = os.path.join('data', 'rankings')
+HISTORY_PATH = os.path.join('data', 'history')
+
+# columnar season stores (each season file is read once and cached)
+stats_store = SeasonStore(os.path.join(BASE_DIR, STATS_PATH))
+rank_store = SeasonStore(os.path.join(BASE_DIR, RANK_PATH))
+
+# memory-mapped points history the Diff scorer is fit to, over this many seasons, when set (see --history-seasons)
+history_dir = os.path.join(BASE_DIR, HISTORY_PATH)
+history_seasons = None
+
+# SQLite database read instead of the season stores when set (see --db)
+database = None
+
+# read season stores into compact dtypes, indexed by player ID, when set (see --typed)
+typed_frames = False
+
+# memoized player name normalization shared by every file read
+player_registry = PlayerRegistry()
 
 # file specifications
 YEAR = 2016
 SOURCES = range(1, 5)
 WEEKS = range(1, 18)
 POSITIONS = ['QB', 'RB', 'WR', 'TE']
+RANK_DROP_COLS = ['Rank', 'FantasyProsAll Experts']
 
 # define scorers
 RANK_DEPTH_TO_ANALYZE = 25
-dcg_scorer = DCGScorer(k=RANK_DEPTH_TO_ANALYZE, numerator='exp', normalize=True)
-diff_scorer = DifferenceScorer(k=RANK_DEPTH_TO_ANALYZE, standardize=True)
+fit_cache = FitCache(max_size=256)  # fitted state is reused when a scorer is refit on the same points
+dcg_scorer = DCGScorer(k=RANK_DEPTH_TO_ANALYZE, numerator='exp', normalize=True, fit_cache=fit_cache)
+diff_scorer = DifferenceScorer(k=RANK_DEPTH_TO_ANALYZE, standardize=True, fit_cache=fit_cache)
+
+# scorers that can be combined into the composite ranking (Diff is fit to every week, the others to the scored week)
+SCORERS = {
+    'DCG': dcg_scorer,
+    'Diff': diff_scorer,
+    'Precision': PrecisionScorer(k=RANK_DEPTH_TO_ANALYZE),
+    'AP': AveragePrecisionScorer(k=RANK_DEPTH_TO_ANALYZE),
+    'RBO': RBOScorer(k=RANK_DEPTH_TO_ANALYZE),
+    'Footrule': FootruleScorer(k=RANK_DEPTH_TO_ANALYZE),
+    'KendallTau': KendallTauScorer(k=RANK_DEPTH_TO_ANALYZE),
+}
+COMPOSITE_METRICS = ['DCG', 'Diff']
+# metrics whose scores at every depth can be swept at once (see --sweep)
+SWEEP_METRICS = ['DCG', 'Diff']
+
+# consensus rankings scored alongside the experts (see --consensus), and the metric whose scores over the previous
+# weeks weight the experts in additional weighted consensus rankings (see --consensus-weights)
+consensus_methods = []
+consensus_weights = None
+
+# points of the seasons being scored, set in each worker process (and in the main process when scoring serially)
+# by _init_worker, so that jobs refer to them by (year, position) rather than carrying them
+_worker_points = {}
 
 
 def get_stats(year, week, position):
     """
-    Read file specified by year, week, position, and return a series of scores
+    Read stats specified by year, week, position from the stats store (or the database), and return a series of
+    scores
     :param year:
     :param week:
     :param position:
     :return:
     """
-    stats_file = '%s_week=%s_pos=%s.json' % (YEAR, week, position)
-    stats = (pd.read_json(os.path.join(BASE_DIR, STATS_PATH, stats_file))
-               .pipe(clean_data, player_col='PLAYER', index_name='Player', select_cols='FPTS'))
+    if database is not None:
+        return database.get_stats(year, week, position)
+    with instrument.timer('read.stats'):
+        partitions = list(stats_store.read_partitions(year, week=week, position=position,
+                                                      columns=['PLAYER', 'FPTS'], typed=typed_frames))
+    stats = (pd.concat([df for _, df in partitions])
+               .pipe(clean_data, player_col='PLAYER', index_name='Player', select_cols='FPTS',
+                     registry=player_registry, player_ids=typed_frames))
+    if typed_frames:
+        # a week of whole points would otherwise be read as int16
+        stats['FPTS'] = stats['FPTS'].astype(np.float32)
     return stats['FPTS'].rename('Week %i' % week)
 
 
 def get_ranks(year, week, position, sources):
     """
-    Read files specified by year, week, position, and sources and concatenate results to return dataframe
+    Read rankings specified by year, week, position, and sources from the rankings store (or the database) and
+    concatenate results to return dataframe
     :param year:
     :param week:
     :param position:
     :param sources:
     :return:
     """
+    if database is not None:
+        return database.get_ranks(year, week, position, sources)
     ranks_list = []
-    for source in SOURCES:
-        rank_file = '%s_week=%s_position=%s_source=%s.json' % (YEAR, week, position, source)
-        ranks = (pd.read_json(os.path.join(BASE_DIR, RANK_PATH, rank_file))
-                   .pipe(clean_data, player_col='Player (matchup)', index_name='Player',
-                         drop_cols=['Rank', 'FantasyProsAll Experts'], fill=''))
+    with instrument.timer('read.ranks'):
+        partitions = list(rank_store.read_partitions(year, week=week, position=position, source=sources,
+                                                     exclude=RANK_DROP_COLS if typed_frames else None,
+                                                     typed=typed_frames))
+    for _, ranks in partitions:
+        ranks = (ranks
+                   .pipe(clean_data, player_col='Player (matchup)', index_name='Player', drop_cols=RANK_DROP_COLS,
+                         fill=None if typed_frames else '', registry=player_registry, player_ids=typed_frames))
         ranks_list.append(ranks)
     return pd.concat(ranks_list, axis=1)
 
@@ -66,26 +136,398 @@ def scores_to_ranks(series):
     return series.shape[0] - series.sort_values(ascending=False).argsort()
 
 
-if __name__ == '__main__':
+def points_key(year, position, stats_by_week):
+    """
+    Identity of the points of a season and position, keying the scorers fitted to them in the fit cache: the file
+    they were read from and its modification time (so that persisted entries are not reused once the stats are
+    scraped again), how they were read, and the weeks read
+    :param year:
+    :param position:
+    :param stats_by_week: DataFrame of points scored (players x weeks)
+    :return: tuple
+    """
+    path = database.path if database is not None else stats_store.path(year)
+    version = os.path.getmtime(path) if os.path.exists(path) else None
+    return path, version, typed_frames, year, position, tuple(stats_by_week.columns)
+
+
+def fit_metric(metric, stats_by_week, week, history=None, stats_key=None):
+    """
+    Fit the scorer of one metric for a week
+    :param metric: name of the scorer (key of SCORERS)
+    :param stats_by_week: DataFrame of points scored (players x weeks) used to fit the scorer
+    :param week: week being scored
+    :param history: PointsHistory the Diff scorer is fit to instead of stats_by_week
+    :param stats_key: identity of stats_by_week (see points_key) keying fitted state in the fit cache, None to fit
+        without the cache
+    :return: fitted scorer
+    """
+    scorer = SCORERS[metric]
+    if isinstance(scorer, DifferenceScorer):
+        if history is None:
+            points, fit_key = stats_by_week, stats_key
+        else:
+            points = history.points
+            fit_key = stats_key and (history.path, os.path.getmtime(history.path), history.weeks[0],
+                                     history.weeks[-1])
+    else:
+        points, fit_key = stats_by_week['Week %i' % week], stats_key and stats_key + (week,)
+    if getattr(scorer, 'fit_cache', None) is None:
+        return scorer.fit(points)
+    return scorer.fit(points, fit_key=fit_key)
+
+
+def score_metric(metric, ranks, stats_by_week, week, history=None, stats_key=None):
+    """
+    Score one week of expert rankings with one metric
+    :param metric: name of the scorer (key of SCORERS)
+    :param ranks: DataFrame of projected rankings for the week (players x experts)
+    :param stats_by_week: DataFrame of points scored (players x weeks) used to fit the scorer
+    :param week: week being scored
+    :param history: PointsHistory the Diff scorer is fit to instead of stats_by_week
+    :param stats_key: identity of stats_by_week keying fitted state in the fit cache (see fit_metric)
+    :return: Series of scores indexed by expert
+    """
+    scorer = fit_metric(metric, stats_by_week, week, history, stats_key)
+    return scorer.score(ranks, stats_by_week['Week %i' % week])
+
+
+@instrument.timer('sweep')
+def sweep_metric(metric, ranks, stats_by_week, week, max_k, history=None, stats_key=None):
+    """
+    Score one week of expert rankings with one metric at every depth k = 1..max_k
+    :param metric: DCG or Diff (keys of SWEEP_METRICS)
+    :param ranks: DataFrame of projected rankings for the week (players x experts)
+    :param stats_by_week: DataFrame of points scored (players x weeks) used to fit the scorer
+    :param week: week being scored
+    :param max_k: deepest depth
+    :param history: PointsHistory the Diff scorer is fit to instead of stats_by_week
+    :param stats_key: identity of stats_by_week keying fitted state in the fit cache (see fit_metric)
+    :return: DataFrame of scores (depths x experts)
+    """
+    scorer = fit_metric(metric, stats_by_week, week, history, stats_key)
+    if isinstance(scorer, DifferenceScorer):
+        return difference_curves(scorer, ranks, stats_by_week['Week %i' % week], max_k)
+    return dcg_curves(scorer, ranks, max_k)
 
-    position = POSITIONS[2]  # just score WR rankings for now
-    week_to_score = 1        # just score week 1 for now
 
-    # get stats and ranks
-    stats_by_week = pd.concat([get_stats(YEAR, week, position) for week in WEEKS], axis=1)
-    ranks = get_ranks(YEAR, week_to_score, position, SOURCES)
+@instrument.timer('consensus')
+def consensus_by_week(ranks_by_week, stats_by_week, history=None, stats_key=None):
+    """
+    Consensus rankings of every week of a position, computed for all weeks at once
+    :param ranks_by_week: dict mapping week to DataFrame of projected rankings (players x experts); weighted
+        consensus rankings of a week use the scores of the previous weeks in ranks_by_week
+    :param stats_by_week: DataFrame of points scored (players x weeks) used to fit the scorers
+    :param history: PointsHistory the Diff scorer is fit to instead of stats_by_week
+    :param stats_key: identity of stats_by_week keying fitted state in the fit cache (see fit_metric)
+    :return: dict mapping week to DataFrame of consensus rankings (players x consensus methods)
+    """
+    # the season stores hold ranks as text (unless read --typed): aggregate numeric copies, while the experts
+    # (and their weights) are scored on the ranks as loaded, as in a run without consensus rankings
+    numeric_by_week = {week: ranks.apply(pd.to_numeric, errors='coerce') for week, ranks in ranks_by_week.iteritems()}
+    consensus = consensus_frames(numeric_by_week, consensus_methods)
+    if consensus_weights:
+        scores = pd.concat({week: score_metric(consensus_weights, ranks, stats_by_week, week, history, stats_key)
+                            for week, ranks in ranks_by_week.iteritems()}, axis=1)
+        weights = historical_weights(scores[sorted(scores.columns)])
+        weighted = consensus_frames(numeric_by_week, consensus_methods, weights, prefix='Weighted')
+        consensus = {week: pd.concat([consensus[week], weighted[week]], axis=1) for week in consensus}
+    return consensus
 
-    # fit scorers
-    dcg_scorer = dcg_scorer.fit(stats_by_week['Week %i' % week_to_score])
-    diff_scorer = diff_scorer.fit(stats_by_week)
 
-    # scoring
-    dcg_scores = dcg_scorer.score(ranks)
-    diff_scores = diff_scorer.score(ranks, stats_by_week['Week %i' % week_to_score])
+def score_week(ranks, stats_by_week, week, metrics=COMPOSITE_METRICS, history=None, stats_key=None):
+    """
+    Score one week of expert rankings and order the experts by each metric
+    :param ranks: DataFrame of projected rankings for the week (players x experts)
+    :param stats_by_week: DataFrame of points scored (players x weeks) used to fit the scorers
+    :param week: week being scored
+    :param metrics: names of the scorers (keys of SCORERS) combined into the composite ordering
+    :param history: PointsHistory the Diff scorer is fit to instead of stats_by_week
+    :param stats_key: identity of stats_by_week keying fitted state in the fit cache (see fit_metric)
+    :return: DataFrame indexed by expert with scores, per-metric orderings and composite ordering
+    """
+    scores = [score_metric(metric, ranks, stats_by_week, week, history, stats_key) for metric in metrics]
 
-    order_rankings = pd.concat([
-        scores_to_ranks(dcg_scores).rename('DCG'),
-        scores_to_ranks(diff_scores).rename('Diff')
-    ], axis=1)
+    order_rankings = pd.concat([scores_to_ranks(metric_scores).rename(metric)
+                                for metric, metric_scores in zip(metrics, scores)], axis=1)
     order_rankings['Composite'] = order_rankings.apply(sum, axis=1)
-    print order_rankings.sort_values('Composite')
+    for metric, metric_scores in zip(metrics, scores):
+        order_rankings['%sScore' % metric] = metric_scores
+    return order_rankings
+
+
+def _init_worker(points, fit_cache_dir=None):
+    """
+    Set up a process to score jobs: the points of each (year, position) are received once here rather than with
+    every job, and the configuration that workers use is passed in rather than inherited from the main process (so
+    that workers need not be forked from it)
+    :param points: dict mapping (year, position) to tuple (stats_by_week, history, stats_key) (see load_points)
+    :param fit_cache_dir: directory persisting the fit cache (see --fit-cache-dir)
+    :return:
+    """
+    global _worker_points
+    _worker_points = points
+    fit_cache.directory = fit_cache_dir
+
+
+def _score_job(job):
+    """
+    Score a single (year, week, position) job in a worker process set up by _init_worker
+    :param job: tuple of (year, week, position, ranks, metrics) with pre-loaded ranks
+    :return: tuple (tidy DataFrame of results for the job, instrumentation recorded by the job)
+    """
+    year, week, position, ranks, metrics = job
+    stats_by_week, history, key = _worker_points[(year, position)]
+    results = (score_week(ranks, stats_by_week, week, metrics, history, key)
+               .rename_axis('Expert', axis=0).reset_index())
+    results.insert(0, 'Position', position)
+    results.insert(0, 'Week', week)
+    results.insert(0, 'Year', year)
+    return results, instrument.collect()
+
+
+def _sweep_job(max_k, job):
+    """
+    Score a single (year, week, position) job at every depth in a worker process
+    :param max_k: deepest depth
+    :param job: job tuple as for _score_job (metrics are restricted to SWEEP_METRICS)
+    :return: tuple ((position, dict mapping metric to DataFrame of scores (depths x experts)), instrumentation
+        recorded by the job)
+    """
+    year, week, position, ranks, metrics = job
+    stats_by_week, history, key = _worker_points[(year, position)]
+    curves = {metric: sweep_metric(metric, ranks, stats_by_week, week, max_k, history, key) for metric in metrics}
+    return (position, curves), instrument.collect()
+
+
+def _map_jobs(func, jobs, points, processes=None):
+    """
+    Run jobs, fanning them out to a process pool, and merge the instrumentation they recorded
+    :param func: function of a job returning a tuple (output, instrumentation)
+    :param jobs: iterable of jobs, consumed as the workers take them
+    :param points: points the jobs refer to (see load_points), sent to each worker once
+    :param processes: number of worker processes (defaults to the number of CPUs, 1 runs serially)
+    :return: list of outputs
+    """
+    if processes == 1:
+        _init_worker(points, fit_cache.directory)
+        try:
+            outputs = [func(job) for job in jobs]
+        finally:
+            _init_worker({}, fit_cache.directory)
+    else:
+        pool = Pool(processes, initializer=_init_worker, initargs=(points, fit_cache.directory))
+        try:
+            outputs = list(pool.imap(func, jobs))
+        finally:
+            pool.close()
+            pool.join()
+    for _, job_instrumentation in outputs:
+        instrument.merge(job_instrumentation)
+    return [output for output, _ in outputs]
+
+
+def load_points(year, positions):
+    """
+    Load the points of every position of a season, reading each position's stats only once
+    :param year:
+    :param positions:
+    :return: dict mapping (year, position) to tuple (stats_by_week, history, stats_key): the points scored (players
+        x weeks), the PointsHistory the Diff scorer is fit to (opened, not loaded, and memory-mapped by the workers;
+        None unless --history-seasons) and the identity of the points (see points_key)
+    """
+    points = {}
+    for position in positions:
+        if database is not None:
+            stats_by_week = database.get_points(year, WEEKS, position)
+        else:
+            stats_by_week = pd.concat([get_stats(year, week, position) for week in WEEKS], axis=1)
+        history = None
+        if history_seasons:
+            history = open_seasons(history_dir, position, year - history_seasons + 1, year)
+        points[(year, position)] = stats_by_week, history, points_key(year, position, stats_by_week)
+    return points
+
+
+def iter_jobs(year, weeks, positions, sources, points, metrics=COMPOSITE_METRICS):
+    """
+    Load the rankings of every (week, position) to be scored
+    :param year:
+    :param weeks:
+    :param positions:
+    :param sources:
+    :param points: points of the season (see load_points), which jobs refer to by (year, position)
+    :param metrics: names of the scorers combined into the composite ordering
+    :return: generator of jobs for _score_job
+    """
+    for position in positions:
+        stats_by_week, history, key = points[(year, position)]
+        if consensus_methods:
+            # weighted consensus rankings also need the rankings of the weeks before those scored
+            loaded = set(weeks) | set(week for week in WEEKS if consensus_weights and week < max(weeks))
+            ranks_by_week = {week: get_ranks(year, week, position, sources) for week in sorted(loaded)}
+            consensus = consensus_by_week(ranks_by_week, stats_by_week, history, key)
+        for week in weeks:
+            if consensus_methods:
+                ranks = pd.concat([ranks_by_week[week], consensus[week]], axis=1)
+            else:
+                ranks = get_ranks(year, week, position, sources)
+            yield year, week, position, ranks, metrics
+
+
+def score_season(year, weeks, positions, sources=SOURCES, processes=None, metrics=COMPOSITE_METRICS):
+    """
+    Score every (week, position) of a season, fanning the jobs out to a process pool
+    :param year:
+    :param weeks: weeks to score
+    :param positions: positions to score
+    :param sources: ranking sources to read for each week and position
+    :param processes: number of worker processes (defaults to the number of CPUs, 1 scores serially)
+    :param metrics: names of the scorers combined into the composite ordering
+    :return: tidy DataFrame with one row per (year, week, position, expert)
+    """
+    points = load_points(year, positions)
+    results = _map_jobs(_score_job, iter_jobs(year, weeks, positions, sources, points, metrics), points, processes)
+    return (pd.concat(results, ignore_index=True)
+              .sort_values(['Year', 'Week', 'Position', 'Composite'])
+              .reset_index(drop=True))
+
+
+def sweep_season(year, weeks, positions, max_k, sources=SOURCES, processes=None, metrics=SWEEP_METRICS):
+    """
+    Score every (week, position) of a season at every depth k = 1..max_k, from one sort of each ranking
+    :param year:
+    :param weeks: weeks to score
+    :param positions: positions to score
+    :param max_k: deepest depth
+    :param sources: ranking sources to read for each week and position
+    :param processes: number of worker processes (defaults to the number of CPUs, 1 scores serially)
+    :param metrics: names of the scorers (in SWEEP_METRICS) combined into the composite ordering
+    :return: tuple (DataFrame of mean scores over the weeks indexed by (position, metric, expert) with a column for
+        each depth, dict mapping position to the depths at which the season composite ordering changes)
+    """
+    points = load_points(year, positions)
+    jobs = iter_jobs(year, weeks, positions, sources, points, metrics)
+    outputs = _map_jobs(partial(_sweep_job, max_k), jobs, points, processes)
+    curves, changes = [], {}
+    for position in positions:
+        position_curves = [job_curves for job_position, job_curves in outputs if job_position == position]
+        # season composite: sum of the weekly composites
+        composite = sum(composite_curves(job_curves) for job_curves in position_curves)
+        changes[position] = ordering_changes(composite)
+        for metric in metrics:
+            mean = pd.concat([job_curves[metric].T for job_curves in position_curves]).groupby(level=0).mean()
+            mean.index = pd.MultiIndex.from_product([[position], [metric], mean.index],
+                                                    names=['Position', 'Metric', 'Expert'])
+            curves.append(mean)
+    return pd.concat(curves), changes
+
+
+def parse_args():
+    """
+    Parse command line arguments
+    :return:
+    """
+    parser = argparse.ArgumentParser(description='Score expert rankings against points scored')
+    parser.add_argument('--year', type=int, nargs='+', default=[YEAR], help='seasons to score')
+    parser.add_argument('--weeks', type=int, nargs='+', default=list(WEEKS), help='weeks to score')
+    parser.add_argument('--positions', nargs='+', default=POSITIONS, choices=POSITIONS, help='positions to score')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='number of worker processes (defaults to number of CPUs, 1 to run serially)')
+    parser.add_argument('--metrics', nargs='+', default=COMPOSITE_METRICS, choices=sorted(SCORERS),
+                        help='metrics combined into the composite ranking')
+    parser.add_argument('--fit-cache-dir', default=None,
+                        help='directory for persisting fitted scorer state across runs and worker processes')
+    parser.add_argument('--db', default=None, metavar='FILE',
+                        help='read points and rankings from a SQLite database (see yafsa.db) instead of the '
+                             'season stores')
+    parser.add_argument('--typed', action='store_true',
+                        help='read the season stores into compact numeric dtypes indexed by integer player IDs, '
+                             'so that ranks sort numerically and frames take less memory')
+    parser.add_argument('--history-seasons', type=int, default=None, metavar='N',
+                        help='fit the Diff scorer to the memory-mapped points history of the N seasons ending with '
+                             'each scored season (in %s) instead of the season alone' % HISTORY_PATH)
+    parser.add_argument('--build-history', action='store_true',
+                        help='first build the points history of the --history-seasons seasons from the stores')
+    parser.add_argument('--consensus', nargs='+', default=[], choices=sorted(CONSENSUS_METHODS),
+                        help='consensus rankings aggregated from the experts and scored alongside them')
+    parser.add_argument('--consensus-weights', default=None, choices=sorted(SCORERS), metavar='METRIC',
+                        help='also score consensus rankings weighting each expert by the METRIC scores of the '
+                             'previous weeks (one of %(choices)s)')
+    parser.add_argument('--results', default=None, metavar='FILE',
+                        help='record the scores in a SQLite results store (see yafsa.results), replacing weeks '
+                             'scored before, for leaderboard.py')
+    parser.add_argument('--sweep', type=int, default=None, metavar='K',
+                        help='instead of scoring at depth %i, score every depth k = 1..K and print the mean '
+                             'score of each expert at each depth and the depths at which the season composite '
+                             'ordering changes (metrics %s only)' % (RANK_DEPTH_TO_ANALYZE, ', '.join(SWEEP_METRICS)))
+    parser.add_argument('--timings', action='store_true',
+                        help='print a summary of the time spent in each stage to stderr')
+    parser.add_argument('--profile', default=None, metavar='FILE',
+                        help='profile the run with cProfile, dumping pstats to FILE (only the main process is '
+                             'profiled, so combine with --processes 1 to profile scoring)')
+    args = parser.parse_args()
+    if args.build_history and not args.history_seasons:
+        parser.error('--build-history requires --history-seasons')
+    if args.consensus_weights and not args.consensus:
+        parser.error('--consensus-weights requires --consensus')
+    if args.sweep is not None:
+        if args.sweep < 1:
+            parser.error('--sweep must be at least 1')
+        if not set(args.metrics) <= set(SWEEP_METRICS):
+            parser.error('--sweep supports the metrics %s only' % ', '.join(SWEEP_METRICS))
+        if args.results:
+            parser.error('--sweep does not record results')
+    return args
+
+
+if __name__ == '__main__':
+
+    args = parse_args()
+    fit_cache.directory = args.fit_cache_dir
+    if args.db:
+        database = Database(args.db)
+    typed_frames = args.typed
+    history_seasons = args.history_seasons
+    consensus_methods = args.consensus
+    consensus_weights = args.consensus_weights
+    if args.build_history:
+        history_years = range(min(args.year) - history_seasons + 1, max(args.year) + 1)
+        build_history(history_dir, args.positions, [(year, week) for year in history_years for week in WEEKS],
+                      get_stats)
+    if history_seasons:
+        # fail before scoring anything rather than fit the Diff scorer to a partial history
+        try:
+            for year in args.year:
+                for position in args.positions:
+                    open_seasons(history_dir, position, year - history_seasons + 1, year)
+        except ValueError as e:
+            sys.exit('%s; build it with --build-history' % e)
+    if args.sweep:
+        run_season = partial(sweep_season, weeks=args.weeks, positions=args.positions, max_k=args.sweep,
+                             processes=args.processes, metrics=args.metrics)
+    else:
+        run_season = partial(score_season, weeks=args.weeks, positions=args.positions, processes=args.processes,
+                             metrics=args.metrics)
+    if args.profile:
+        with instrument.profile(args.profile):
+            outputs = [run_season(year) for year in args.year]
+    else:
+        outputs = [run_season(year) for year in args.year]
+    if args.sweep:
+        for year, (curves, changes) in zip(args.year, outputs):
+            print curves.to_string(float_format='%.3f')
+            for position in args.positions:
+                print '%i %s composite ordering changes at k = %s' % (year, position,
+                                                                      ', '.join(str(k) for k in changes[position]))
+    else:
+        results = pd.concat(outputs, ignore_index=True)
+        if args.results:
+            results_store = ResultsStore(args.results)
+            results_store.record(results)
+            results_store.close()
+        print results.to_string(index=False)
+    if args.timings or args.profile:
+        print >> sys.stderr, instrument.report()
+    if args.profile:
+        instrument.print_profile(args.profile, stream=sys.stderr)
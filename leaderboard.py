@@ -0,0 +1,44 @@
+""" Leaderboards of the experts read from the rollups of a results store (see driver.py --results) """
+
+import argparse
+import sys
+
+from yafsa.results import ALL_POSITIONS, COMPOSITE, ResultsStore
+
+
+def parse_args():
+    """
+    Parse command line arguments
+    :return:
+    """
+    parser = argparse.ArgumentParser(description='Leaderboard of the experts from a results store')
+    parser.add_argument('results', metavar='FILE', help='results store written by driver.py --results')
+    parser.add_argument('--metric', default=COMPOSITE,
+                        help='metric to order the experts by (e.g., DCG or Diff, defaults to %(default)s)')
+    parser.add_argument('--position', default=None,
+                        help='position (defaults to every position together, %s)' % ALL_POSITIONS)
+    seasons = parser.add_mutually_exclusive_group()
+    seasons.add_argument('--years', type=int, nargs='+', default=None, help='seasons (defaults to every season)')
+    seasons.add_argument('--last-seasons', type=int, default=None, metavar='N', help='the last N recorded seasons')
+    seasons.add_argument('--window', type=int, default=None, metavar='N',
+                         help='the last N scored weeks (a rolling window maintained by the store)')
+    parser.add_argument('--by', default='score', choices=['score', 'rank'],
+                        help='order by mean score or by mean position in the weekly orderings')
+    parser.add_argument('--min-weeks', type=int, default=1, help='leave out experts scored in fewer weeks')
+    parser.add_argument('--limit', type=int, default=None, help='number of experts shown')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+
+    args = parse_args()
+    store = ResultsStore(args.results)
+    try:
+        board = store.leaderboard(args.metric, position=args.position, years=args.years,
+                                  last_seasons=args.last_seasons, window=args.window, by=args.by,
+                                  min_weeks=args.min_weeks, limit=args.limit)
+    except ValueError as e:
+        sys.exit(str(e))
+    finally:
+        store.close()
+    print board.to_string(float_format='%.3f')
@@ -2,7 +2,15 @@
 
 import os
 import time
-from yafsa.scrape import TableScraper, write_to_file
+from yafsa import instrument
+from yafsa.cache import ResponseCache, season_ttl, season_week
+from yafsa.db import Database
+from yafsa.manifest import Manifest, RecordDigest
+from yafsa.parallel import ParallelScraper
+from yafsa.schema import RANKINGS_SCHEMA
+from yafsa.scrape import TableScraper
+from yafsa.store import SeasonStore
+from yafsa.transport import HTTPTransport
 
 
 # URL specification
@@ -24,33 +32,129 @@ SOURCES = range(1, 5)
 HEADER_ROWS_TO_SKIP = 0  # skip this many leading rows of each table (URL specific)
 CHUNK_SIZE = None  # read each table in this many chunks
 
-# directory for writing data
+# response cache (pages of completed weeks never change, so they never expire)
+CACHE_DIR = os.path.join(os.path.dirname(__file__), 'data', 'cache')
+CURRENT_WEEK = season_week(YEAR, n_weeks=max(WEEKS))  # week in progress today (None once the season is complete)
+CURRENT_WEEK_TTL = 60 * 60  # seconds before pages of the week in progress and later weeks are revalidated
+
+# HTTP transport (connections to the host are kept alive and reused)
+TIMEOUT = 30  # seconds to wait for a connection or data
+
+# concurrent scraping (set MAX_WORKERS to None to scrape serially)
+MAX_WORKERS = 4  # number of requests in flight
+REQUESTS_PER_SECOND = 1.0  # rate limit for requests to URL_BASE
+
+# directory of the season store for writing data
 OUTDIR = os.path.join(os.path.dirname(__file__), 'data', 'rankings')
+MANIFEST_FILE = os.path.join(OUTDIR, 'manifest.json')
+
+# SQLite database the season is also ingested into (None to skip)
+DB_FILE = None
+
+
+def rankings_url(week, position, source):
+	"""
+	Build the url of the rankings table for a week, position and source
+	:param week:
+	:param position:
+	:param source:
+	:return:
+	"""
+	args = '&'.join(['', '%s=%s' % ('position', position), '%s=%s' % ('week', week), '%s=%s' % ('source', source)])
+	return '%s%s' % (URL, args)
+
+
+def scrape_serially(ts, keys):
+	"""
+	Scrape tables one at a time, skipping the remaining sources of a week and position after an empty source
+	:param ts: TableScraper
+	:param keys: list of (week, position, source) tuples to scrape
+	:return: generator of ((week, position, source), records), records None for tables that could not be fetched
+	"""
+	out_of_range = set()
+	for week, position, source in keys:
+		if (week, position) in out_of_range:
+			continue
+		data = ts.scrape_table(rankings_url(week, position, source))
+		yield (week, position, source), data
+		if data is not None and not data:  # source out of range (None is a failed fetch)
+			out_of_range.add((week, position))
+			continue
+
+		# optional sleep to avoid hitting URL_BASE too quickly
+		time.sleep(1)
+
+
+def scrape_concurrently(ts, keys):
+	"""
+	Scrape tables concurrently, rate limited per host
+	:param ts: TableScraper
+	:param keys: list of (week, position, source) tuples to scrape
+	:return: list of ((week, position, source), records) in the order of keys, records None for tables that could not
+		be fetched
+	"""
+	scraper = ParallelScraper(ts, max_workers=MAX_WORKERS, rate=REQUESTS_PER_SECOND)
+	return zip(keys, scraper.scrape_tables([rankings_url(*key) for key in keys]))
 
 
 if __name__ == '__main__':
 
-	ts = TableScraper(header_rows_to_skip=HEADER_ROWS_TO_SKIP, chunk_size=CHUNK_SIZE)
-
-	file_count = 0
-	for week in WEEKS:
-		wk = '%s=%s' % ('week', week)
-		for position in POSITIONS:
-			pos = '%s=%s' % ('position', position)
-			for source in SOURCES:
-				src = '%s=%s' % ('source', source)
-				args = '&'.join(['', pos, wk, src])
-				url = '%s%s' % (URL, args)
-
-				data = ts.scrape_table(url)
-				if not data:  # source out of range
-					break
-
-				# optional sleep to avoid hitting URL_BASE too quickly
-				time.sleep(1)
-
-				# write file
-				file_name = '_'.join([YEAR, wk, pos, src])
-				full_file_name = write_to_file(data, OUTDIR, file_name)
-				file_count += 1
-				print 'Wrote file %i: %s' % (file_count, full_file_name)
+	transport = HTTPTransport(timeout=TIMEOUT, max_idle_per_host=MAX_WORKERS or 1)
+	cache = ResponseCache(CACHE_DIR, ttl=season_ttl(CURRENT_WEEK, CURRENT_WEEK_TTL), opener=transport.open)
+	ts = TableScraper(header_rows_to_skip=HEADER_ROWS_TO_SKIP, chunk_size=CHUNK_SIZE, cache=cache, transport=transport,
+					  schema=RANKINGS_SCHEMA)
+	store = SeasonStore(OUTDIR)
+	manifest = Manifest(MANIFEST_FILE)
+
+	# fetch only missing partitions and those of the week in progress
+	refresh_weeks = [CURRENT_WEEK] if CURRENT_WEEK else []
+	planned = manifest.plan(YEAR, WEEKS, POSITIONS, SOURCES, refresh_weeks=refresh_weeks)
+	probed = set((week, position) for week, position, _ in planned
+				 if week in refresh_weeks or manifest.source_count(YEAR, week, position) is None)
+	print 'Planned %i tables' % len(planned)
+
+	table_count = 0
+	out_of_range = set()
+	# weeks and positions with a source that could not be fetched: their source count stays unknown (and the
+	# sources missing from the manifest are planned again) until a run fetches every source
+	failed = set()
+	try:
+		scraped = scrape_concurrently(ts, planned) if MAX_WORKERS else scrape_serially(ts, planned)
+		for (week, position, source), data in scraped:
+			if (week, position) in out_of_range:
+				continue
+			if data is None:
+				failed.add((week, position))
+				continue
+			if not data:  # source out of range
+				out_of_range.add((week, position))
+				if (week, position) not in failed:
+					manifest.set_source_count(YEAR, week, position, source - 1)
+				continue
+
+			# add table to the season store
+			digest = RecordDigest(data)
+			n_rows = store.write(digest, YEAR, week, position, source)
+			changed = manifest.record(YEAR, week, position, source, digest.hexdigest, n_rows)
+			table_count += 1
+			print 'Stored table %i: %s (%i rows%s)' % (table_count, rankings_url(week, position, source), n_rows,
+													   '' if changed else ', unchanged')
+
+		# every candidate source returned a table
+		for week, position in probed - out_of_range - failed:
+			manifest.set_source_count(YEAR, week, position, max(SOURCES))
+	finally:
+		for full_file_name in store.flush():
+			print 'Wrote file: %s' % full_file_name
+		manifest.save()
+		if DB_FILE:
+			database = Database(DB_FILE)
+			print 'Ingested %i ranks into %s' % (database.import_ranks(store, YEAR), DB_FILE)
+			database.close()
+		if failed:
+			print 'Could not fetch every source of %i weeks and positions' % len(failed)
+		print 'Response cache: %s' % cache.stats
+		cache.close()
+		print 'Transport: %s' % transport.stats
+		transport.close()
+		print instrument.report()
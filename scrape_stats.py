@@ -2,7 +2,15 @@
 
 import os
 import time
-from yafsa.scrape import TableScraper, write_to_file
+from yafsa import instrument
+from yafsa.cache import ResponseCache, season_ttl, season_week
+from yafsa.db import Database
+from yafsa.manifest import Manifest, RecordDigest
+from yafsa.parallel import ParallelScraper
+from yafsa.schema import STATS_SCHEMA
+from yafsa.scrape import ScrapeError, TableScraper
+from yafsa.store import SeasonStore
+from yafsa.transport import HTTPTransport
 
 
 # URL specification
@@ -20,30 +28,106 @@ CCS = '5'  # corresponds to Yahoo scoring
 HEADER_ROWS_TO_SKIP = 1  # skip this many leading rows of each table (URL specific)
 CHUNK_SIZE = None  # read each table in this many chunks
 
-# directory for writing data
+# response cache (pages of completed weeks never change, so they never expire)
+CACHE_DIR = os.path.join(os.path.dirname(__file__), 'data', 'cache')
+CURRENT_WEEK = season_week(YEAR, n_weeks=max(WEEKS))  # week in progress today (None once the season is complete)
+CURRENT_WEEK_TTL = 60 * 60  # seconds before pages of the week in progress and later weeks are revalidated
+
+# HTTP transport (connections to the host are kept alive and reused)
+TIMEOUT = 30  # seconds to wait for a connection or data
+
+# concurrent scraping (set MAX_WORKERS to None to scrape serially)
+MAX_WORKERS = 4  # number of requests in flight
+REQUESTS_PER_SECOND = 1.0  # rate limit for requests to URL_BASE
+
+# directory of the season store for writing data
 OUTDIR = os.path.join(os.path.dirname(__file__), 'data', 'stats')
+MANIFEST_FILE = os.path.join(OUTDIR, 'manifest.json')
 
+# SQLite database the season is also ingested into (None to skip)
+DB_FILE = None
+
+
+def stats_url(week, position):
+	"""
+	Build the url of the stats table for a week and position
+	:param week:
+	:param position:
+	:return:
+	"""
+	args = '&'.join(['%s%s' % ('ccs=', CCS), '%s%s' % ('pos=', position), '%s%s' % ('week=', week)])
+	return '%s%s' % (URL, args)
 
-if __name__ == '__main__':
 
-	ts = TableScraper(header_rows_to_skip=HEADER_ROWS_TO_SKIP, chunk_size=CHUNK_SIZE)
+def scrape_serially(ts, keys):
+	"""
+	Scrape tables one at a time, streaming each table's records to the consumer as they are parsed
+	:param ts: TableScraper
+	:param keys: list of (week, position) tuples to scrape
+	:return: generator of ((week, position), records), records raising ScrapeError for tables that could not be fetched
+	"""
+	for week, position in keys:
+		yield (week, position), ts.iter_table(stats_url(week, position))
 
-	file_count = 0
-	ccs = '%s%s' % ('ccs=', CCS)
-	for week in WEEKS:
-		wk = '%s%s' % ('week=', week)
-		for position in POSITIONS:
-			pos = '%s%s' % ('pos=', position)
-			args = '&'.join([ccs, pos, wk])
-			url = '%s%s' % (URL, args)
+		# optional sleep to avoid hitting URL_BASE too quickly
+		time.sleep(1)
+
+
+def scrape_concurrently(ts, keys):
+	"""
+	Scrape tables concurrently, rate limited per host
+	:param ts: TableScraper
+	:param keys: list of (week, position) tuples to scrape
+	:return: list of ((week, position), records) in the order of keys, records None for tables that could not be
+		fetched
+	"""
+	scraper = ParallelScraper(ts, max_workers=MAX_WORKERS, rate=REQUESTS_PER_SECOND)
+	return zip(keys, scraper.scrape_tables([stats_url(*key) for key in keys]))
+
+
+if __name__ == '__main__':
 
-			data = ts.scrape_table(url)
+	transport = HTTPTransport(timeout=TIMEOUT, max_idle_per_host=MAX_WORKERS or 1)
+	cache = ResponseCache(CACHE_DIR, ttl=season_ttl(CURRENT_WEEK, CURRENT_WEEK_TTL), opener=transport.open)
+	ts = TableScraper(header_rows_to_skip=HEADER_ROWS_TO_SKIP, chunk_size=CHUNK_SIZE, cache=cache, transport=transport,
+					  schema=STATS_SCHEMA)
+	store = SeasonStore(OUTDIR)
+	manifest = Manifest(MANIFEST_FILE)
 
-			# optional sleep to avoid hitting URL_BASE too quickly
-			time.sleep(1)
+	# fetch only missing partitions and those of the week in progress
+	refresh_weeks = [CURRENT_WEEK] if CURRENT_WEEK else []
+	planned = [(week, position) for week, position, _ in
+			   manifest.plan(YEAR, WEEKS, POSITIONS, refresh_weeks=refresh_weeks)]
+	print 'Planned %i tables' % len(planned)
 
-			# write file
-			file_name = '_'.join([YEAR, wk, pos])
-			full_file_name = write_to_file(data, OUTDIR, file_name)
-			file_count += 1
-			print 'Wrote file %i: %s' % (file_count, full_file_name)
+	table_count = 0
+	try:
+		scraped = scrape_concurrently(ts, planned) if MAX_WORKERS else scrape_serially(ts, planned)
+		for (week, position), data in scraped:
+			# a table that could not be fetched leaves the stored partition as it is (and is planned again)
+			if data is None:
+				continue
+			# add table to the season store
+			digest = RecordDigest(data)
+			try:
+				n_rows = store.write(digest, YEAR, week, position)
+			except ScrapeError as e:
+				print e
+				continue
+			changed = manifest.record(YEAR, week, position, None, digest.hexdigest, n_rows)
+			table_count += 1
+			print 'Stored table %i: %s (%i rows%s)' % (table_count, stats_url(week, position), n_rows,
+													   '' if changed else ', unchanged')
+	finally:
+		for full_file_name in store.flush():
+			print 'Wrote file: %s' % full_file_name
+		manifest.save()
+		if DB_FILE:
+			database = Database(DB_FILE)
+			print 'Ingested %i rows into %s' % (database.import_stats(store, YEAR), DB_FILE)
+			database.close()
+		print 'Response cache: %s' % cache.stats
+		cache.close()
+		print 'Transport: %s' % transport.stats
+		transport.close()
+		print instrument.report()
@@ -0,0 +1,126 @@
+""" Local stand-in HTTP server serving fixture pages, for tests of the scrapers and transports """
+
+import BaseHTTPServer
+import os
+import SocketServer
+import threading
+import time
+
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def fixture_page(name):
+    """
+    Read a fixture page
+    :param name: name of the page in tests/fixtures (without the .html extension)
+    :return: string of html
+    """
+    with open(os.path.join(FIXTURE_DIR, '%s.html' % name)) as f:
+        return f.read()
+
+
+class FixtureServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    """
+    Threaded HTTP/1.1 server on 127.0.0.1 (on a free port) serving pages by path, queries ignored
+
+    routes maps a path to a page body, or to a function of (handler, number of requests to the path so far) that
+    writes the whole response, so that tests can script failures.  Paths not in routes are 404s.  GETs and POSTs
+    are routed alike (the body of a POST is read into handler.body).  Every request is logged as (path, time).
+    """
+
+    daemon_threads = True
+
+    def __init__(self, routes):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), _FixtureHandler)
+        self.routes = routes
+        self.requests = []
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d' % self.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
+
+    def count(self, path):
+        """
+        Number of requests to a path
+        :param path:
+        :return:
+        """
+        with self._lock:
+            return sum(1 for requested, _ in self.requests if requested == path)
+
+    def times(self, path):
+        """
+        Times of the requests to a path
+        :param path:
+        :return: list of seconds since the epoch
+        """
+        with self._lock:
+            return [at for requested, at in self.requests if requested == path]
+
+    def process_request_thread(self, request, client_address):
+        with self._lock:
+            self.connections += 1
+        SocketServer.ThreadingMixIn.process_request_thread(self, request, client_address)
+
+    def _log(self, path):
+        with self._lock:
+            self.requests.append((path, time.time()))
+            return sum(1 for requested, _ in self.requests if requested == path)
+
+
+class _FixtureHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.body = None
+        self._route()
+
+    def do_POST(self):
+        self.body = self.rfile.read(int(self.headers.getheader('Content-Length', 0)))
+        self._route()
+
+    def _route(self):
+        path = self.path.split('?')[0]
+        attempt = self.server._log(path)
+        route = self.server.routes.get(path)
+        if route is None:
+            self.send_body('', code=404)
+        elif callable(route):
+            route(self, attempt)
+        else:
+            self.send_body(route)
+
+    def send_body(self, body, code=200, headers=None):
+        """
+        Send a complete response
+        :param body: string
+        :param code: status code
+        :param headers: dict of extra headers
+        :return:
+        """
+        self.send_response(code)
+        for name, value in (headers or {}).iteritems():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
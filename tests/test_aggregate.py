@@ -0,0 +1,135 @@
+""" Tests of the consensus rankings aggregated from expert rankings, checked against hand computations """
+
+import unittest
+import numpy as np
+import pandas as pd
+
+from yafsa.score import consensus_frames, consensus_ranks, historical_weights
+from yafsa.score.aggregate import borda, markov_chain, median_rank
+
+nan = np.nan
+
+# players A, B and C (rows) ranked by three experts (columns): two agree, the third ranks in reverse
+DISSENT = np.array([[1., 1., 3.],
+                    [2., 2., 2.],
+                    [3., 3., 1.]])
+
+
+class BordaTest(unittest.TestCase):
+
+    def test_unanimous(self):
+        ranks = np.array([[2., 2.], [1., 1.], [3., 3.]])
+        np.testing.assert_allclose(borda(ranks), [4. / 3, 2., 2. / 3])
+        for method in ('Borda', 'Median', 'Markov'):
+            np.testing.assert_array_equal(consensus_ranks(ranks, method), [2., 1., 3.])
+
+    def test_dissenting_expert(self):
+        # a list of 3 players awards 1, 2/3 and 1/3
+        np.testing.assert_allclose(borda(DISSENT), [1 + 1 + 1. / 3, 2. / 3 * 3, 1. / 3 + 1. / 3 + 1])
+        np.testing.assert_array_equal(consensus_ranks(DISSENT, 'Borda'), [1., 2., 3.])
+
+    def test_weights(self):
+        np.testing.assert_allclose(borda(DISSENT, weights=[1., 1., 3.]), [1 + 1 + 1, 2. / 3 * 5, 1. / 3 * 2 + 3])
+        np.testing.assert_array_equal(consensus_ranks(DISSENT, 'Borda', weights=[1., 1., 3.]), [3., 2., 1.])
+
+    def test_partial_lists(self):
+        # the second expert ranks two players only: 1 and 1/2 points, none for players outside the list
+        ranks = np.array([[1., nan], [2., 1.], [3., 2.], [4., nan]])
+        np.testing.assert_allclose(borda(ranks), [1., 0.75 + 1., 0.5 + 0.5, 0.25])
+        # an expert without any ranked player has no weight
+        np.testing.assert_allclose(borda(np.hstack([ranks, np.full((4, 1), nan)]), weights=[1., 1., 5.]),
+                                   borda(ranks))
+
+
+class MedianRankTest(unittest.TestCase):
+
+    def test_dissenting_expert(self):
+        np.testing.assert_array_equal(median_rank(DISSENT), [1., 2., 3.])
+
+    def test_weights_flip_median(self):
+        # the dissenting expert carries more than half of the weight
+        np.testing.assert_array_equal(median_rank(DISSENT, weights=[1., 1., 3.]), [3., 2., 1.])
+        np.testing.assert_array_equal(consensus_ranks(DISSENT, 'Median', weights=[1., 1., 3.]), [3., 2., 1.])
+
+    def test_lower_median_and_unranked(self):
+        # with two experts the lower median is taken; outside a list of 2 players is position 3
+        ranks = np.array([[1., nan], [2., 1.], [nan, 2.]])
+        np.testing.assert_array_equal(median_rank(ranks), [1., 1., 2.])
+
+
+class MarkovChainTest(unittest.TestCase):
+
+    def test_dissenting_expert(self):
+        # the majority prefers A to B and C, and B to C: from B the walk moves to A with probability 1/3, from C
+        # to A or B with probability 1/3 each
+        damping = 0.85
+        jump = (1 - damping) / 3
+        c = jump / (1 - damping / 3)
+        b = (jump + damping / 3 * c) / (1 - 2 * damping / 3)
+        np.testing.assert_allclose(markov_chain(DISSENT, damping=damping), [1 - b - c, b, c], atol=1e-8)
+        np.testing.assert_array_equal(consensus_ranks(DISSENT, 'Markov'), [1., 2., 3.])
+
+    def test_no_jumps(self):
+        # without random jumps every walk ends at the player the majority prefers to all others
+        np.testing.assert_allclose(markov_chain(DISSENT, damping=1.), [1., 0., 0.], atol=1e-8)
+
+    def test_weights_and_unranked(self):
+        ranks = np.vstack([DISSENT, np.full((1, 3), nan)])
+        probabilities = markov_chain(ranks, weights=[1., 1., 3.])
+        self.assertEqual(probabilities[3], 0.)
+        np.testing.assert_allclose(probabilities[:3], markov_chain(DISSENT)[::-1])
+        np.testing.assert_array_equal(consensus_ranks(ranks, 'Markov', weights=[1., 1., 3.]), [3., 2., 1., nan])
+
+    def test_batch(self):
+        # weeks along a trailing axis are aggregated independently
+        ranks = np.dstack([DISSENT, DISSENT[::-1]])
+        for method in ('Borda', 'Median', 'Markov'):
+            np.testing.assert_array_equal(consensus_ranks(ranks, method), [[1., 3.], [2., 2.], [3., 1.]])
+
+
+class HistoricalWeightsTest(unittest.TestCase):
+
+    def test_weights(self):
+        scores = pd.DataFrame([[3., 1., 5.], [1., nan, 5.], [2., 3., 5.], [nan, 2., 5.]],
+                              index=['A', 'B', 'C', 'D'], columns=[1, 2, 3])
+        weights = historical_weights(scores)
+        self.assertIsInstance(weights, pd.DataFrame)
+        # nothing is known before the first week
+        np.testing.assert_array_equal(weights[1], 1.)
+        # week 2: means 3, 1 and 2 (D has no history and gets the weight of an average expert)
+        spread = np.sqrt(2. / 3)
+        np.testing.assert_allclose(weights[2], np.exp([1. / spread, -1. / spread, 0., 0.]))
+        # week 3: means 2, 1, 2.5 and 2
+        means = np.array([2., 1., 2.5, 2.])
+        z = (means - means.mean()) / means.std()
+        np.testing.assert_allclose(weights[3], np.exp(z))
+        np.testing.assert_allclose(historical_weights(scores, temperature=2.)[3], np.exp(z / 2))
+
+    def test_no_look_ahead(self):
+        random_state = np.random.RandomState(0)
+        scores = random_state.rand(5, 8)
+        weights = historical_weights(scores)
+        for week in xrange(8):
+            changed = scores.copy()
+            changed[:, week:] = random_state.rand(5, 8 - week)
+            np.testing.assert_allclose(historical_weights(changed)[:, :week + 1], weights[:, :week + 1])
+
+
+class ConsensusFramesTest(unittest.TestCase):
+
+    def test_frames(self):
+        ranks_by_week = {1: pd.DataFrame(DISSENT, index=['A', 'B', 'C'], columns=['X', 'Y', 'Z']),
+                         2: pd.DataFrame([[1., 1., nan], [2., 2., nan]], index=['D', 'A'], columns=['X', 'Y', 'Z'])}
+        frames = consensus_frames(ranks_by_week, methods=('Borda', 'Median'))
+        self.assertEqual(list(frames[1].columns), ['ConsensusBorda', 'ConsensusMedian'])
+        np.testing.assert_array_equal(frames[1].values, [[1., 1.], [2., 2.], [3., 3.]])
+        np.testing.assert_array_equal(frames[2].values, [[1., 1.], [2., 2.]])
+        # weights by expert and week: Z outweighs X and Y together (Y has no weight and gets 1)
+        weights = pd.DataFrame({1: [1., 3.], 2: [1., 3.]}, index=['X', 'Z'])
+        frames = consensus_frames(ranks_by_week, methods=('Median',), weights=weights)
+        np.testing.assert_array_equal(frames[1]['ConsensusMedian'], [3., 2., 1.])
+        self.assertEqual(list(frames[2].index), ['D', 'A'])
+
+
+if __name__ == '__main__':
+    unittest.main()
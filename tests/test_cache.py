@@ -0,0 +1,141 @@
+""" Tests of the response cache and the season weeks that set its TTL """
+
+import datetime
+import os
+import shutil
+import tempfile
+import ujson as json
+import unittest
+from contextlib import closing
+
+from tests.server import FixtureServer, fixture_page
+from yafsa.cache import INDEX_FILE, ResponseCache, season_ttl, season_week
+
+
+def _etag_route(page, etag):
+    """
+    Route answering requests with a matching If-None-Match with a 304 and the others with page and its ETag
+    """
+    def route(handler, attempt):
+        if handler.headers.getheader('If-None-Match') == etag:
+            handler.send_body('', code=304)
+        else:
+            handler.send_body(page, headers={'ETag': etag})
+    return route
+
+
+class SeasonWeekTest(unittest.TestCase):
+
+    def test_weeks_of_the_2016_season(self):
+        # Labor Day was Monday 9/5, the opener Thursday 9/8
+        self.assertEqual(season_week(2016, datetime.date(2016, 7, 1)), 1)
+        self.assertEqual(season_week(2016, datetime.date(2016, 9, 6)), 1)
+        self.assertEqual(season_week(2016, datetime.date(2016, 9, 12)), 1)
+        self.assertEqual(season_week(2016, datetime.date(2016, 9, 13)), 2)
+        self.assertEqual(season_week('2016', datetime.date(2016, 12, 27)), 17)
+        self.assertIsNone(season_week(2016, datetime.date(2017, 1, 3)))
+        self.assertIsNone(season_week(2016, datetime.date(2018, 9, 1)))
+
+    def test_labor_day_on_the_first(self):
+        # 9/1/2014 was Labor Day
+        self.assertEqual(season_week(2014, datetime.date(2014, 9, 1)), 1)
+        self.assertEqual(season_week(2014, datetime.date(2014, 9, 9)), 2)
+
+    def test_season_ttl(self):
+        ttl = season_ttl(season_week(2016, datetime.date(2016, 10, 5)), 60)
+        self.assertIsNone(ttl('http://host/stats?week=4'))
+        self.assertEqual(ttl('http://host/stats?week=5'), 60)
+        self.assertEqual(ttl('http://host/stats?week=12'), 60)
+        self.assertIsNone(season_ttl(None, 60)('http://host/stats?week=12'))
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.page = fixture_page('thehuddle')
+        self.server = FixtureServer({'/page': self.page, '/etag': _etag_route(self.page, '"v1"')}).start()
+        self.directory = tempfile.mkdtemp()
+        self.index_file = os.path.join(self.directory, INDEX_FILE)
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def read_index(self):
+        with open(self.index_file) as f:
+            return json.loads(f.read())
+
+    def test_hits_are_served_without_requests(self):
+        cache = ResponseCache(self.directory)
+        url = '%s/page?week=1' % self.server.url
+        self.assertEqual(cache.fetch(url), self.page)
+        self.assertEqual(cache.fetch(url), self.page)
+        self.assertEqual(self.server.count('/page'), 1)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_hits_write_the_index_on_flush(self):
+        cache = ResponseCache(self.directory)
+        url = '%s/page?week=1' % self.server.url
+        cache.fetch(url)
+        written = self.read_index()[url]['accessed']
+        os.remove(self.index_file)
+        cache.fetch(url)
+        cache.fetch(url)
+        self.assertFalse(os.path.exists(self.index_file))
+        cache.close()
+        self.assertGreaterEqual(self.read_index()[url]['accessed'], written)
+        # nothing to write once flushed
+        os.remove(self.index_file)
+        cache.flush()
+        self.assertFalse(os.path.exists(self.index_file))
+
+    def test_stale_pages_are_revalidated(self):
+        cache = ResponseCache(self.directory, ttl=0)
+        url = '%s/etag?week=1' % self.server.url
+        self.assertEqual(cache.fetch(url), self.page)
+        self.assertEqual(cache.fetch(url), self.page)
+        self.assertEqual((cache.misses, cache.revalidated, cache.hits), (1, 1, 0))
+        self.assertEqual(self.server.count('/etag'), 2)
+        cache.close()
+        # a new cache reads the persisted index
+        reopened = ResponseCache(self.directory, ttl=None)
+        self.assertEqual(reopened.fetch(url), self.page)
+        self.assertEqual(self.server.count('/etag'), 2)
+
+    def test_least_recently_used_pages_are_evicted(self):
+        cache = ResponseCache(self.directory, max_bytes=2 * len(self.page))
+        urls = ['%s/page?week=%d' % (self.server.url, week) for week in (1, 2, 3)]
+        cache.fetch(urls[0])
+        cache.fetch(urls[1])
+        cache.fetch(urls[0])
+        cache.fetch(urls[2])
+        self.assertEqual(sorted(self.read_index()), sorted([urls[0], urls[2]]))
+
+    def test_streamed_pages_are_cached_once_read_to_the_end(self):
+        cache = ResponseCache(self.directory)
+        url = '%s/page?week=1' % self.server.url
+        f = cache.open(url)
+        first = f.read(100)
+        self.assertFalse(cache.is_fresh(url))
+        body = first + ''.join(iter(lambda: f.read(1000), ''))
+        f.close()
+        self.assertEqual(body, self.page)
+        self.assertTrue(cache.is_fresh(url))
+        self.assertEqual(self.read_index()[url]['size'], len(self.page))
+        with closing(cache.open(url)) as f:
+            self.assertEqual(f.read(), self.page)
+        self.assertEqual((cache.hits, cache.misses, self.server.count('/page')), (1, 1, 1))
+
+    def test_pages_closed_early_are_not_cached(self):
+        cache = ResponseCache(self.directory)
+        url = '%s/page?week=1' % self.server.url
+        with closing(cache.open(url)) as f:
+            f.read(100)
+        self.assertFalse(cache.is_fresh(url))
+        self.assertEqual(os.listdir(self.directory), [])
+        self.assertEqual(cache.fetch(url), self.page)
+        self.assertEqual(self.server.count('/page'), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+""" Tests of the SQLite database of points and rankings against the season store path of the driver """
+
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import pandas as pd
+
+import driver
+from yafsa.clean import PlayerRegistry
+from yafsa.db import Database
+from yafsa.store import SeasonStore
+
+
+YEAR = 2016
+
+STATS = {
+    1: [{'PLAYER': 'Antonio Brown, PIT', 'FPTS': '22.5', 'YDS': '150'},
+        {'PLAYER': 'Julio Jones, ATL', 'FPTS': '', 'YDS': '0'},
+        {'PLAYER': 'Odell Beckham Jr., NYG', 'FPTS': '9.1', 'YDS': '61'}],
+    2: [{'PLAYER': 'Odell Beckham Jr., NYG', 'FPTS': '30', 'YDS': '222'},
+        {'PLAYER': 'Mike Evans, TB', 'FPTS': '12.2', 'YDS': '92'},
+        {'PLAYER': 'Antonio Brown, PIT', 'FPTS': '4.4', 'YDS': '44'}],
+}
+
+
+def _ranking(players, date, **ranks_by_expert):
+    """
+    Records of a rankings table
+    :param players: raw player strings, in the order of the table
+    :param date: date suffix of the expert labels
+    :param ranks_by_expert: expert -> list of ranks (strings, '' for unranked players)
+    :return: list of dict records
+    """
+    records = []
+    for row, player in enumerate(players):
+        record = {'Rank': str(row + 1), 'FantasyProsAll Experts': str(row + 1), 'Player (matchup)': player}
+        for expert, ranks in ranks_by_expert.iteritems():
+            record['%s%s' % (expert, date)] = ranks[row]
+        records.append(record)
+    return records
+
+
+RANKS = {
+    (1, 1): _ranking(['Antonio Brown PIT vs. WAS', 'Julio Jones ATL vs. TB', 'Odell Beckham Jr. NYG vs. DAL'], '9/8',
+                     MikeClay=['1', '2', '3'], LizLoza=['2', '', '1']),
+    (1, 2): _ranking(['Odell Beckham Jr. NYG vs. DAL', 'Antonio Brown PIT vs. WAS'], '9/8', SeanKoerner=['1', '2']),
+    (2, 1): _ranking(['Antonio Brown PIT @ CIN', 'Mike Evans TB vs. ARI', 'Odell Beckham Jr. NYG @ NO'], '9/15',
+                     MikeClay=['1', '3', '2'], LizLoza=['3', '1', '2']),
+}
+
+
+class DatabaseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='yafsa-test-')
+        stats_store = SeasonStore(self.directory + '/stats')
+        rank_store = SeasonStore(self.directory + '/rankings')
+        self.database = Database(':memory:')
+        for week, records in STATS.iteritems():
+            stats_store.write(records, YEAR, week, 'WR')
+            self.assertEqual(self.database.write_stats(records, YEAR, week, 'WR'), 3)
+        for (week, source), records in RANKS.iteritems():
+            rank_store.write(records, YEAR, week, 'WR', source)
+            self.database.write_ranks(records, YEAR, week, 'WR', source)
+        stats_store.flush()
+        rank_store.flush()
+        # the driver reads the season stores
+        self.saved = {name: getattr(driver, name) for name in ('stats_store', 'rank_store', 'player_registry',
+                                                               'database', 'typed_frames')}
+        driver.stats_store, driver.rank_store = SeasonStore(stats_store.directory), SeasonStore(rank_store.directory)
+        driver.player_registry = PlayerRegistry()
+        driver.database = None
+        driver.typed_frames = False
+
+    def tearDown(self):
+        for name, value in self.saved.iteritems():
+            setattr(driver, name, value)
+        self.database.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def assert_stats_equal(self, database, week):
+        # the store keeps the scraped text, the database parses it
+        expected = pd.to_numeric(driver.get_stats(YEAR, week, 'WR'), errors='coerce')
+        pd.util.testing.assert_series_equal(database.get_stats(YEAR, week, 'WR'), expected)
+
+    def assert_ranks_equal(self, database, week, sources):
+        expected = driver.get_ranks(YEAR, week, 'WR', sources).apply(pd.to_numeric, errors='coerce')
+        # concatenating the frames of several sources drops the name of the index
+        pd.util.testing.assert_frame_equal(database.get_ranks(YEAR, week, 'WR', sources), expected, check_names=False)
+
+    def test_matches_store(self):
+        for week in STATS:
+            self.assert_stats_equal(self.database, week)
+        points = self.database.get_points(YEAR, [1, 2], 'WR')
+        expected = pd.concat([pd.to_numeric(driver.get_stats(YEAR, week, 'WR'), errors='coerce') for week in (1, 2)],
+                             axis=1, sort=False)
+        pd.util.testing.assert_frame_equal(points, expected, check_names=False)
+        self.assert_ranks_equal(self.database, 1, [1, 2])
+        self.assert_ranks_equal(self.database, 1, 2)
+        self.assert_ranks_equal(self.database, 2, [1, 2])
+        ranks = self.database.get_ranks(YEAR, 1, 'WR', [1, 2])
+        self.assertEqual(ranks.count().to_dict(), {'MikeClay': 3, 'LizLoza': 2, 'SeanKoerner': 2})
+
+    def test_import_matches_writes(self):
+        imported = Database(':memory:')
+        try:
+            self.assertEqual(imported.import_stats(driver.stats_store, YEAR), 6)
+            self.assertEqual(imported.import_ranks(driver.rank_store, YEAR), 13)
+            for week in STATS:
+                self.assert_stats_equal(imported, week)
+                self.assert_ranks_equal(imported, week, [1, 2])
+        finally:
+            imported.close()
+
+    def test_replace_partition(self):
+        self.database.write_stats(STATS[1][:1], YEAR, 1, 'WR')
+        self.database.write_ranks(RANKS[(1, 1)][1:], YEAR, 1, 'WR', 1)
+        self.assertEqual(self.database.get_stats(YEAR, 1, 'WR').index.tolist(), ['Antonio Brown'])
+        ranks = self.database.get_ranks(YEAR, 1, 'WR')
+        self.assertEqual(ranks.index.tolist(), ['Julio Jones', 'Odell Beckham', 'Antonio Brown'])
+        self.assertEqual(ranks['MikeClay'].tolist()[:2], [2., 3.])
+        # other weeks and sources are kept
+        self.assert_stats_equal(self.database, 2)
+        self.assert_ranks_equal(self.database, 1, 2)
+        self.assert_ranks_equal(self.database, 2, [1, 2])
+
+    def test_failed_transaction_rolled_back(self):
+        with self.assertRaises(ValueError):
+            with self.database.transaction():
+                self.database.write_stats([{'PLAYER': 'Tyreek Hill, KC', 'FPTS': '40'}], YEAR, 1, 'WR')
+                self.database.write_ranks(RANKS[(2, 1)], YEAR, 1, 'WR', 1)
+                raise ValueError('failed')
+        for week in STATS:
+            self.assert_stats_equal(self.database, week)
+            self.assert_ranks_equal(self.database, week, [1, 2])
+        names = [name for name, in self.database.connection.execute('SELECT name FROM players')]
+        self.assertNotIn('Tyreek Hill', names)
+        # IDs interned in the failed transaction are not reused
+        self.database.write_stats([{'PLAYER': 'Tyreek Hill, KC', 'FPTS': '40'}], YEAR, 3, 'WR')
+        self.assertEqual(self.database.get_stats(YEAR, 3, 'WR').tolist(), [40.])
+
+    def test_failed_write_rolled_back(self):
+        # the insert fails after the week's points were deleted
+        self.database.connection.execute('CREATE TRIGGER fail BEFORE INSERT ON points '
+                                         'BEGIN SELECT RAISE(ABORT, "failed"); END')
+        self.assertRaises(sqlite3.DatabaseError, self.database.write_stats, STATS[2], YEAR, 1, 'WR')
+        self.assert_stats_equal(self.database, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+""" Tests of the fit cache keyed by caller-supplied identities of the fitted data """
+
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+
+from yafsa.score import DCGScorer, DifferenceScorer, FitCache
+
+
+class FitCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        random_state = np.random.RandomState(0)
+        players = pd.Index(['Player %i' % i for i in xrange(40)], name='Player')
+        self.points = pd.DataFrame(np.round(random_state.gamma(2., 5., (40, 4)), 1), index=players,
+                                   columns=['Week %i' % week for week in xrange(1, 5)])
+        self.ranks = pd.DataFrame({'A': np.arange(1., 41.), 'B': random_state.permutation(40) + 1.}, index=players)
+
+    def test_hit_restores_the_fit(self):
+        cache = FitCache()
+        week = self.points['Week 1']
+        expected = DCGScorer(k=10).fit(week).score(self.ranks, week)
+        DCGScorer(k=10, fit_cache=cache).fit(week, fit_key=(2016, 'WR', 1))
+        # a hit restores the state fitted to the keyed points, whatever points are passed
+        scorer = DCGScorer(k=10, fit_cache=cache).fit(self.points['Week 2'], fit_key=(2016, 'WR', 1))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        pd.util.testing.assert_series_equal(scorer.score(self.ranks, week), expected)
+
+    def test_fit_params_and_classes_are_part_of_the_key(self):
+        cache = FitCache()
+        DCGScorer(k=10, fit_cache=cache).fit(self.points['Week 1'], fit_key='week 1')
+        DCGScorer(k=20, fit_cache=cache).fit(self.points['Week 1'], fit_key='week 1')
+        DifferenceScorer(k=10, fit_cache=cache).fit(self.points, fit_key='week 1')
+        self.assertEqual((cache.hits, cache.misses), (0, 3))
+        # k does not change the fit of a DifferenceScorer
+        DifferenceScorer(k=20, fit_cache=cache).fit(self.points, fit_key='week 1')
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+
+    def test_fits_without_a_key_bypass_the_cache(self):
+        cache = FitCache()
+        DifferenceScorer(fit_cache=cache).fit(self.points)
+        DifferenceScorer(fit_cache=cache).fit(self.points)
+        self.assertEqual((len(cache), cache.hits, cache.misses), (0, 0, 0))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = FitCache(max_size=2)
+        scorer = DCGScorer(fit_cache=cache)
+        for week in (1, 2, 1, 3):
+            scorer.fit(self.points['Week %i' % week], fit_key=week)
+        self.assertEqual(len(cache), 2)
+        scorer.fit(self.points['Week 1'], fit_key=1)
+        scorer.fit(self.points['Week 2'], fit_key=2)
+        self.assertEqual((cache.hits, cache.misses), (2, 4))
+
+    def test_entries_are_persisted(self):
+        directory = tempfile.mkdtemp()
+        try:
+            DifferenceScorer(standardize=True, fit_cache=FitCache(directory=directory)).fit(self.points, fit_key=1)
+            cache = FitCache(directory=directory)
+            scorer = DifferenceScorer(standardize=True, fit_cache=cache).fit(self.points.iloc[:5], fit_key=1)
+            self.assertEqual(cache.hits, 1)
+            expected = DifferenceScorer(standardize=True).fit(self.points)
+            np.testing.assert_array_equal(scorer.points_mean_by_rank_, expected.points_mean_by_rank_)
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
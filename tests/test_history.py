@@ -0,0 +1,44 @@
+""" Tests of the memory-mapped points history """
+
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from yafsa.history import PointsHistory, open_seasons, write_history
+
+
+class OpenSeasonsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='yafsa-test-')
+        weeks = [(year, week) for year in (2014, 2015) for week in (1, 2, 3)]
+        self.points = np.arange(12.).reshape(2, 6)
+        write_history(self.directory, 'WR', self.points, ['A', 'B'], weeks)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_held_seasons(self):
+        history = open_seasons(self.directory, 'WR', 2014, 2015)
+        self.assertEqual(history.shape, (2, 6))
+        np.testing.assert_array_equal(history.points, self.points)
+        history = open_seasons(self.directory, 'WR', 2015, 2015)
+        self.assertEqual(history.weeks, [(2015, 1), (2015, 2), (2015, 3)])
+        np.testing.assert_array_equal(history.points, self.points[:, 3:])
+
+    def test_missing_seasons(self):
+        # PointsHistory itself silently keeps the seasons it holds
+        self.assertEqual(len(PointsHistory(self.directory, 'WR', 2013, 2016)), 6)
+        with self.assertRaises(ValueError) as raised:
+            open_seasons(self.directory, 'WR', 2013, 2015)
+        self.assertIn('2013', str(raised.exception))
+        self.assertRaises(ValueError, open_seasons, self.directory, 'WR', 2015, 2016)
+        self.assertRaises(ValueError, open_seasons, self.directory, 'WR', 2016, 2017)
+
+    def test_missing_history(self):
+        self.assertRaises(ValueError, open_seasons, self.directory, 'TE', 2014, 2015)
+
+
+if __name__ == '__main__':
+    unittest.main()
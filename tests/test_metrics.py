@@ -0,0 +1,117 @@
+""" Tests of the DCG and Diff scorers """
+
+import unittest
+import numpy as np
+import pandas as pd
+
+from yafsa.score import DCGScorer, DifferenceScorer, OnlineDifferenceScorer
+from yafsa.score.batch import BatchDCGScorer
+
+
+def random_week(n_players, n_experts, random_state):
+    """
+    Points and ranks of one week with unranked players and players without points, as a frame of ranks and a
+    Series of points indexed by player ID (in ID order) and as compact arrays
+    :return: tuple (ranks frame, points Series, rank array, points array)
+    """
+    points = np.round(random_state.gamma(2., 5., n_players), 1)
+    points[random_state.rand(n_players) < 0.2] = np.nan
+    ranks = np.full((n_players, n_experts), np.nan)
+    for expert in xrange(n_experts):
+        ranked = random_state.choice(n_players, n_players // 2, replace=False)
+        ranks[ranked, expert] = np.arange(1., n_players // 2 + 1)
+    return pd.DataFrame(ranks), pd.Series(points), ranks, points
+
+
+class CompactFormTest(unittest.TestCase):
+
+    def test_unranked_players_follow_ranked_players(self):
+        points = np.array([10., 8., 6., 4.])
+        ranks = np.array([1., 2., np.nan, np.nan])
+        scorer = DCGScorer(k=4, normalize=False)
+        expected = 10. + 8. / np.log2(3) + 6. / 2 + 4. / np.log2(5)
+        self.assertAlmostEqual(scorer.fit(points).score(ranks)[0], expected)
+        series_score = scorer.fit(pd.Series(points, index=list('abcd'))).score(pd.Series(ranks, index=list('abcd')))
+        self.assertAlmostEqual(series_score.iloc[0], expected)
+
+    def test_series_and_arrays_score_alike(self):
+        random_state = np.random.RandomState(0)
+        for _ in xrange(20):
+            ranks, points, rank_array, points_array = random_week(30, 4, random_state)
+            for k in (5, 10, 30, None):
+                for scorer in (DCGScorer(k=k, numerator='exp', normalize=True),
+                               DCGScorer(k=k, normalize=False)):
+                    np.testing.assert_allclose(scorer.fit(points_array).score(rank_array),
+                                               scorer.fit(points).score(ranks).values)
+                batch = BatchDCGScorer(k=k, normalize=False)
+                np.testing.assert_allclose(batch.score_arrays(rank_array[:, :, None], points_array[:, None])[:, 0],
+                                           DCGScorer(k=k, normalize=False).fit(points).score(ranks).values)
+                history = pd.DataFrame(random_state.gamma(2., 5., (30, 6)))
+                diff = DifferenceScorer(k=k).fit(history)
+                np.testing.assert_allclose(diff.score(rank_array, points_array), diff.score(ranks, points).values)
+
+    def test_arrays_align_on_common_prefix(self):
+        # player IDs assigned after the rankings were read have points but no ranks
+        points = np.array([10., 8., 6., 4., 20.])
+        ranks = np.array([[2.], [1.], [np.nan], [3.]])
+        scorer = DCGScorer(k=3, normalize=False).fit(points)
+        self.assertAlmostEqual(scorer.score(ranks)[0], 8. + 10. / np.log2(3) + 4. / 2)
+
+
+
+class OnlineDifferenceScorerTest(unittest.TestCase):
+
+    def setUp(self):
+        random_state = np.random.RandomState(0)
+        # weeks of 20 to 30 players with points
+        self.history = pd.DataFrame(np.round(random_state.gamma(2., 5., (30, 8)), 1))
+        for week in self.history:
+            self.history.iloc[random_state.randint(20, 31):, week] = np.nan
+        self.ranks, self.points = random_week(30, 4, random_state)[:2]
+
+    def assert_profiles_equal(self, online, batch):
+        self.assertEqual(online.n_fitted_points_, batch.n_fitted_points_)
+        np.testing.assert_allclose(online.points_mean_by_rank_, batch.points_mean_by_rank_)
+        np.testing.assert_allclose(online.points_std_by_rank_, batch.points_std_by_rank_)
+
+    def test_matches_batch_fit(self):
+        batch = DifferenceScorer(k=10, standardize=True).fit(self.history)
+        online = OnlineDifferenceScorer(k=10, standardize=True)
+        for week in self.history:
+            online.partial_fit(self.history[week])
+        self.assert_profiles_equal(online, batch)
+        np.testing.assert_allclose(online.score(self.ranks, self.points), batch.score(self.ranks, self.points))
+        # several weeks at once, and a refit from scratch
+        online = OnlineDifferenceScorer(k=10, standardize=True).partial_fit(self.history.iloc[:, :3])
+        self.assert_profiles_equal(online.partial_fit(self.history.iloc[:, 3:].values), batch)
+        self.assert_profiles_equal(online.fit(self.history), batch)
+
+    def test_window_drops_old_weeks(self):
+        online = OnlineDifferenceScorer(standardize=True, window=3)
+        for week in self.history:
+            online.partial_fit(self.history[week])
+            first = max(0, week - 2)
+            self.assert_profiles_equal(online, DifferenceScorer(standardize=True).fit(self.history.loc[:, first:week]))
+        self.assertEqual(online.n_weeks_, 3)
+
+    def test_halflife_weights(self):
+        # a week's weight halves with every later week: weights 1/2 and 1, so a mean of 8/3
+        online = OnlineDifferenceScorer(halflife=1.).partial_fit(np.array([[0., 4.]]))
+        np.testing.assert_allclose(online.points_mean_by_rank_, [8. / 3])
+        np.testing.assert_allclose(online.weights_, [1.5])
+        # in general, means and standard deviations are weighted by decay ** age
+        online = OnlineDifferenceScorer(standardize=True, halflife=3.).fit(self.history)
+        sorted_points = -np.sort(-self.history.values, axis=0)
+        ages = np.arange(self.history.shape[1])[::-1]
+        weights = np.where(np.isnan(sorted_points), 0., 0.5 ** (ages / 3.))
+        values = np.nan_to_num(sorted_points)
+        means = (weights * values).sum(axis=1) / weights.sum(axis=1)
+        stds = np.sqrt((weights * (values - means[:, None]) ** 2).sum(axis=1) / weights.sum(axis=1))
+        # ranks of a single week have no spread, and are standardized by the median spread
+        stds[stds == 0] = np.median(stds[stds > 0])
+        np.testing.assert_allclose(online.points_mean_by_rank_, means)
+        np.testing.assert_allclose(online.points_std_by_rank_, stds)
+
+
+if __name__ == '__main__':
+    unittest.main()
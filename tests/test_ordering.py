@@ -0,0 +1,221 @@
+""" Tests of the ordering metrics against brute-force implementations built one player at a time """
+
+import unittest
+import numpy as np
+import pandas as pd
+
+from yafsa.score import AveragePrecisionScorer, FootruleScorer, KendallTauScorer, PrecisionScorer, RBOScorer
+from yafsa.score.ordering import OrderScorer, count_inversions, count_ties
+
+
+def expert_and_true_lists(ranks, points, k):
+    """
+    Lists compared by the ordering metrics: the players with points ranked by the expert, and every player with
+    points, ordered by points (ties broken by player ID) and cut at k
+    :param ranks: array of one expert's ranks indexed by player ID (NaN if unranked)
+    :param points: array of points indexed by player ID (NaN if no points)
+    :param k: list depth
+    :return: tuple (expert list, true list, list length) with lists of player IDs
+    """
+    scored = [i for i in xrange(len(points)) if not np.isnan(points[i])]
+    length = min(k, len(scored))
+    true_list = sorted(scored, key=lambda i: (-points[i], i))[:length]
+    ranked = [i for i in scored if not np.isnan(ranks[i])]
+    expert_list = sorted(ranked, key=lambda i: (ranks[i], i))[:length]
+    return expert_list, true_list, length
+
+
+def precision(expert_list, true_list, length, points):
+    return len(set(expert_list) & set(true_list)) / float(length)
+
+
+def average_precision(expert_list, true_list, length, points):
+    hits, total = 0, 0.
+    for depth, player in enumerate(expert_list, 1):
+        if player in true_list:
+            hits += 1
+            total += hits / float(depth)
+    return total / length
+
+
+def rbo(expert_list, true_list, length, points, p=0.9):
+    total = 0.
+    overlap = 0
+    for depth in xrange(1, length + 1):
+        overlap = len(set(expert_list[:depth]) & set(true_list[:depth]))
+        total += (1 - p) / p * p ** depth * overlap / float(depth)
+    return total + overlap / float(length) * p ** length
+
+
+def footrule(expert_list, true_list, length, points):
+    distance = 0
+    for player in set(expert_list) | set(true_list):
+        expert_position = expert_list.index(player) if player in expert_list else length
+        true_position = true_list.index(player) if player in true_list else length
+        distance += abs(expert_position - true_position)
+    return 1 - distance / (length * (length + 1.))
+
+
+def kendall_tau(expert_list, true_list, length, points):
+    listed = [points[i] for i in expert_list]
+    concordant = discordant = ties = 0
+    for i in xrange(len(listed)):
+        for j in xrange(i + 1, len(listed)):
+            if listed[i] > listed[j]:
+                concordant += 1
+            elif listed[i] < listed[j]:
+                discordant += 1
+            else:
+                ties += 1
+    n_pairs = len(listed) * (len(listed) - 1) / 2.
+    if n_pairs == 0 or n_pairs == ties:
+        return np.nan
+    return (concordant - discordant) / np.sqrt(n_pairs * (n_pairs - ties))
+
+
+SCORERS = [
+    (PrecisionScorer, precision),
+    (AveragePrecisionScorer, average_precision),
+    (RBOScorer, rbo),
+    (FootruleScorer, footrule),
+    (KendallTauScorer, kendall_tau),
+]
+
+
+def brute_force_scores(direct, rank_array, points_array, k):
+    """
+    Scores of every expert and week computed one list at a time
+    :param direct: brute-force metric of (expert list, true list, list length, points)
+    :param rank_array: array of ranks (players x experts x weeks)
+    :param points_array: array of points (players x weeks)
+    :param k: list depth
+    :return: array of scores (experts x weeks), NaN for weeks without points
+    """
+    scores = np.full(rank_array.shape[1:], np.nan)
+    for expert in xrange(rank_array.shape[1]):
+        for week in xrange(rank_array.shape[2]):
+            lists = expert_and_true_lists(rank_array[:, expert, week], points_array[:, week], k)
+            if lists[2]:
+                scores[expert, week] = direct(*(lists + (points_array[:, week],)))
+    return scores
+
+
+def random_season(n_players, n_experts, n_weeks, random_state, n_ranked=None, rank_ties=False):
+    """
+    Random compact arrays: whole points (so that players tie) with missing players, and rankings of a random subset
+    of the players
+    :param n_players:
+    :param n_experts:
+    :param n_weeks:
+    :param random_state: np.random.RandomState
+    :param n_ranked: number of players each expert ranks (defaults to half of them)
+    :param rank_ties: give some ranked players the rank of the player above them
+    :return: tuple (rank_array, points_array)
+    """
+    points_array = np.round(random_state.gamma(2., 2., (n_players, n_weeks)))
+    points_array[random_state.rand(n_players, n_weeks) < 0.15] = np.nan
+    rank_array = np.full((n_players, n_experts, n_weeks), np.nan)
+    n_ranked = n_ranked or max(2, n_players // 2)
+    for expert in xrange(n_experts):
+        for week in xrange(n_weeks):
+            ranked = random_state.choice(n_players, n_ranked, replace=False)
+            ranks = np.arange(1., n_ranked + 1)
+            if rank_ties:
+                tied = random_state.rand(n_ranked) < 0.2
+                tied[0] = False
+                ranks[tied] = ranks[np.flatnonzero(tied) - 1]
+                ranks = np.maximum.accumulate(ranks)
+            rank_array[ranked, expert, week] = ranks
+    return rank_array, points_array
+
+
+class CountTest(unittest.TestCase):
+
+    def test_count_inversions(self):
+        random_state = np.random.RandomState(0)
+        for n in [1, 2, 3, 7, 8, 9, 33]:
+            values = random_state.randint(0, 5, (n, 4)).astype(float)
+            expected = [sum(column[i] > column[j] for i in xrange(n) for j in xrange(i + 1, n)) for column in values.T]
+            np.testing.assert_array_equal(count_inversions(values), expected)
+
+    def test_count_ties(self):
+        values = np.array([[1., 2.], [1., np.inf], [3., 2.], [1., 2.]])
+        valid = np.isfinite(values)
+        np.testing.assert_array_equal(count_ties(values, valid), [3, 3])
+
+
+class OrderScorerTest(unittest.TestCase):
+
+    def assert_matches_brute_force(self, rank_array, points_array, k):
+        for scorer_class, direct in SCORERS:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                expected = brute_force_scores(direct, rank_array, points_array, k)
+            scores = scorer_class(k=k).score_arrays(rank_array, points_array)
+            np.testing.assert_allclose(scores, expected, err_msg='%s, k=%s' % (scorer_class.__name__, k))
+
+    def test_random_seasons(self):
+        random_state = np.random.RandomState(0)
+        for _ in xrange(30):
+            rank_array, points_array = random_season(random_state.randint(2, 30), 3, 2, random_state)
+            self.assert_matches_brute_force(rank_array, points_array, 10)
+
+    def test_tied_points_and_ranks(self):
+        random_state = np.random.RandomState(1)
+        for _ in xrange(20):
+            rank_array, points_array = random_season(20, 3, 2, random_state, rank_ties=True)
+            points_array = np.round(points_array / 4.)
+            self.assert_matches_brute_force(rank_array, points_array, 8)
+
+    def test_unranked_players(self):
+        random_state = np.random.RandomState(2)
+        # experts rank only a few of the players with points, and rank players without points
+        rank_array, points_array = random_season(25, 4, 3, random_state, n_ranked=4)
+        self.assert_matches_brute_force(rank_array, points_array, 10)
+        # an expert who ranked nobody
+        rank_array[:, 0, :] = np.nan
+        self.assert_matches_brute_force(rank_array, points_array, 10)
+
+    def test_k_larger_than_the_lists(self):
+        random_state = np.random.RandomState(3)
+        rank_array, points_array = random_season(12, 3, 2, random_state)
+        for k in (12, 13, 50, None):
+            self.assert_matches_brute_force(rank_array, points_array, np.inf if k is None else k)
+
+    def test_weeks_without_points(self):
+        random_state = np.random.RandomState(4)
+        rank_array, points_array = random_season(10, 2, 2, random_state)
+        points_array[:, 1] = np.nan
+        for scorer_class, _ in SCORERS:
+            scores = scorer_class(k=5).score_arrays(rank_array, points_array)
+            self.assertTrue(np.all(np.isnan(scores[:, 1])))
+
+    def test_perfect_ranking(self):
+        points = pd.Series([30., 20., 10., 5., np.nan], index=list('abcde'))
+        ranks = pd.DataFrame({'perfect': [1., 2., 3., 4., 5.], 'reversed': [4., 3., 2., 1., np.nan]},
+                             index=list('abcde'))
+        for scorer_class, _ in SCORERS:
+            scores = scorer_class(k=4).fit(points).score(ranks)
+            self.assertAlmostEqual(scores['perfect'], 1., msg=scorer_class.__name__)
+        tau = KendallTauScorer(k=4).fit(points).score(ranks)
+        self.assertAlmostEqual(tau['reversed'], -1.)
+
+    def test_frames_match_arrays(self):
+        random_state = np.random.RandomState(5)
+        rank_array, points_array = random_season(15, 3, 1, random_state)
+        players = ['Player %i' % i for i in xrange(15)]
+        ranks = pd.DataFrame(rank_array[:, :, 0], index=players, columns=['A', 'B', 'C'])
+        # players with points but no ranks are left out of the frame of ranks
+        ranks = ranks.dropna(how='all')
+        points = pd.Series(points_array[:, 0], index=players)
+        for scorer_class, _ in SCORERS:
+            scores = scorer_class(k=6).fit(points).score(ranks)
+            expected = scorer_class(k=6).score_arrays(rank_array, points_array)[:, 0]
+            np.testing.assert_allclose(scores.values, expected)
+            self.assertEqual(list(scores.index), ['A', 'B', 'C'])
+
+    def test_base_class_is_abstract(self):
+        self.assertRaises(TypeError, OrderScorer)
+
+
+if __name__ == '__main__':
+    unittest.main()
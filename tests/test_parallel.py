@@ -0,0 +1,147 @@
+""" Tests of ParallelScraper against a local stand-in server serving fixture pages """
+
+import socket
+import time
+import unittest
+
+from tests.server import FixtureServer, fixture_page
+from yafsa import instrument
+from yafsa.parallel import ParallelScraper, TokenBucket
+from yafsa.scrape import TableScraper
+
+
+def _server_error_then(page, failures):
+    """
+    Route answering the first failures requests to a path with a 500 and the later ones with page
+    """
+    def route(handler, attempt):
+        if attempt <= failures:
+            handler.send_body('', code=500)
+        else:
+            handler.send_body(page)
+    return route
+
+
+def _dropped_then(page, failures):
+    """
+    Route closing the connection without a response to the first failures requests to a path (an
+    httplib.BadStatusLine for the client)
+    """
+    def route(handler, attempt):
+        if attempt <= failures:
+            handler.close_connection = 1
+        else:
+            handler.send_body(page)
+    return route
+
+
+class _TimingOutScraper(TableScraper):
+
+    """ TableScraper whose first opens of a url time out """
+
+    def __init__(self, timeouts, **kwargs):
+        super(_TimingOutScraper, self).__init__(**kwargs)
+        self.timeouts = timeouts
+        self.opened = 0
+
+    def open(self, url):
+        self.opened += 1
+        if self.opened <= self.timeouts:
+            raise socket.timeout('timed out')
+        return super(_TimingOutScraper, self).open(url)
+
+
+class ParallelScraperTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rankings = fixture_page('fantasypros')
+        self.stats = fixture_page('thehuddle')
+        self.server = FixtureServer({
+            '/rankings': self.rankings,
+            '/stats': self.stats,
+            '/flaky': _server_error_then(self.rankings, 2),
+            '/dropped': _dropped_then(self.rankings, 1),
+        }).start()
+        instrument.reset()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def url(self, path, query=''):
+        return '%s%s%s' % (self.server.url, path, '?%s' % query if query else '')
+
+    def test_matches_serial_scraping(self):
+        urls = [self.url('/rankings', 'week=%d' % week) for week in xrange(1, 7)]
+        scraper = TableScraper(header_rows_to_skip=0)
+        serial = [scraper.scrape_table(url) for url in urls]
+        self.assertEqual(len(serial[0]), 24)
+        for parse_processes in (0, 2):
+            parallel = ParallelScraper(scraper, max_workers=3, rate=1000., burst=10, backoff=0.,
+                                       parse_processes=parse_processes)
+            self.assertEqual(parallel.scrape_tables(urls), serial)
+
+    def test_matches_serial_scraping_with_header_rows(self):
+        scraper = TableScraper(header_rows_to_skip=1)
+        url = self.url('/stats')
+        parallel = ParallelScraper(scraper, max_workers=2, rate=1000., burst=10, parse_processes=0)
+        self.assertEqual(parallel.scrape_tables([url]), [scraper.scrape_table(url)])
+
+    def test_rate_limit_spaces_requests_to_a_host(self):
+        rate = 20.
+        urls = [self.url('/rankings', 'page=%d' % i) for i in xrange(6)]
+        parallel = ParallelScraper(TableScraper(), max_workers=6, rate=rate, burst=1, parse_processes=0)
+        parallel.scrape_tables(urls)
+        times = sorted(self.server.times('/rankings'))
+        self.assertEqual(len(times), len(urls))
+        # a burst of one lets the first request through at once and spaces the others 1 / rate apart
+        self.assertGreaterEqual(times[-1] - times[0], (len(urls) - 1) / rate * 0.9)
+        calls, waited, _ = instrument.collect()[0]['scrape.rate_limit']
+        self.assertEqual(calls, len(urls))
+        self.assertGreater(waited, 0.)
+
+    def test_burst_lets_requests_through_at_once(self):
+        clock = [0.]
+        sleeps = []
+        bucket = TokenBucket(2., capacity=3, clock=lambda: clock[0], sleep=sleeps.append)
+        self.assertEqual([bucket.acquire() for _ in xrange(3)], [0., 0., 0.])
+        self.assertEqual(bucket.acquire(), 0.5)
+        clock[0] += 1.
+        self.assertEqual(bucket.acquire(), 0.)
+        self.assertEqual(sleeps, [0.5])
+
+    def test_retries_server_errors(self):
+        parallel = ParallelScraper(TableScraper(), retries=2, rate=1000., backoff=0.001, parse_processes=0)
+        self.assertEqual(parallel.scrape_table(self.url('/flaky')), TableScraper().parse_page(self.rankings))
+        self.assertEqual(self.server.count('/flaky'), 3)
+
+    def test_gives_up_after_retries(self):
+        parallel = ParallelScraper(TableScraper(), retries=1, rate=1000., backoff=0.001, parse_processes=0)
+        self.assertIsNone(parallel.scrape_table(self.url('/flaky')))
+        self.assertEqual(self.server.count('/flaky'), 2)
+
+    def test_does_not_retry_client_errors(self):
+        parallel = ParallelScraper(TableScraper(), retries=3, rate=1000., backoff=0.001, parse_processes=0)
+        self.assertIsNone(parallel.scrape_table(self.url('/missing')))
+        self.assertEqual(self.server.count('/missing'), 1)
+
+    def test_retries_dropped_responses(self):
+        parallel = ParallelScraper(TableScraper(), retries=2, rate=1000., backoff=0.001, parse_processes=0)
+        self.assertEqual(parallel.scrape_table(self.url('/dropped')), TableScraper().parse_page(self.rankings))
+        self.assertEqual(self.server.count('/dropped'), 2)
+
+    def test_retries_timeouts(self):
+        scraper = _TimingOutScraper(2)
+        parallel = ParallelScraper(scraper, retries=2, rate=1000., backoff=0.001, parse_processes=0)
+        self.assertEqual(parallel.scrape_table(self.url('/rankings')), TableScraper().parse_page(self.rankings))
+        self.assertEqual(scraper.opened, 3)
+        self.assertEqual(self.server.count('/rankings'), 1)
+
+    def test_timeouts_after_retries_are_network_failures(self):
+        parallel = ParallelScraper(_TimingOutScraper(5), retries=1, rate=1000., backoff=0.001, parse_processes=0)
+        start = time.time()
+        self.assertIsNone(parallel.scrape_table(self.url('/rankings')))
+        self.assertLess(time.time() - start, 5.)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+""" Tests of the bootstrap, permutation and win probability resampling of expert scores """
+
+import unittest
+import numpy as np
+import pandas as pd
+
+from yafsa.score import DCGScorer, DifferenceScorer, Resampler
+from yafsa.score.resample import _metric_spec, _resample_indices, _score_shard
+
+
+def random_week(n_players, random_state, n_points_only=0):
+    """
+    Ranks of four experts (an expert ranking by points, one ranking in reverse and two random rankings) and points
+    of one week, with unranked players and players without points
+    :param n_players: number of players in the ranks
+    :param random_state:
+    :param n_points_only: number of further players with points but absent from the ranks
+    :return: tuple (ranks DataFrame, points Series)
+    """
+    players = ['P%d' % i for i in xrange(n_players + n_points_only)]
+    points = pd.Series(np.round(random_state.gamma(2., 5., len(players)), 1), index=players)
+    points[random_state.rand(len(players)) < 0.1] = np.nan
+    ranked = points.iloc[:n_players].fillna(0.).rank(ascending=False, method='first')
+    ranks = pd.DataFrame({'Best': ranked, 'Worst': n_players + 1 - ranked,
+                          'A': random_state.permutation(n_players) + 1., 'B': random_state.permutation(n_players) + 1.},
+                         columns=['Best', 'Worst', 'A', 'B'])
+    # the random experts leave players unranked
+    ranks.loc[ranks['A'] > 0.8 * n_players, 'A'] = np.nan
+    ranks.loc[ranks['B'] > 0.6 * n_players, 'B'] = np.nan
+    return ranks, points
+
+
+def scorers(random_state, points, n_players):
+    """
+    Fitted DCG and Diff scorers
+    """
+    history = pd.DataFrame(random_state.gamma(2., 5., (n_players, 8)))
+    return [DCGScorer(k=10).fit(points), DCGScorer(k=None, numerator='exp', normalize=False).fit(points),
+            DifferenceScorer(k=10).fit(history), DifferenceScorer(k=None, standardize=True).fit(history)]
+
+
+class ResamplerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.random_state = np.random.RandomState(0)
+        self.ranks, self.points = random_week(30, self.random_state)
+
+    def test_score_matches_scorer(self):
+        ranks, points = random_week(30, self.random_state, n_points_only=5)
+        for scorer in scorers(self.random_state, points, 35):
+            np.testing.assert_allclose(Resampler(scorer).score(ranks, points),
+                                       scorer.score(ranks, points).values)
+            # ranks scraped as strings are compared as numbers
+            np.testing.assert_allclose(Resampler(scorer).score(ranks.astype(str).replace('nan', np.nan), points),
+                                       scorer.score(ranks, points).values)
+
+    def test_same_seed_same_results(self):
+        scorer = DifferenceScorer(k=10).fit(pd.DataFrame(self.random_state.gamma(2., 5., (30, 8))))
+        serial = Resampler(scorer, n_resamples=40, seed=3, shard_size=40, processes=1)
+        sharded = Resampler(scorer, n_resamples=40, seed=3, shard_size=7, processes=2)
+        for method in ('bootstrap', 'permutation'):
+            expected = getattr(serial, method)(self.ranks, self.points)
+            self.assertEqual(expected.shape, (40, 4))
+            self.assertEqual(list(expected.columns), list(self.ranks.columns))
+            pd.util.testing.assert_frame_equal(getattr(sharded, method)(self.ranks, self.points), expected)
+            other_seed = Resampler(scorer, n_resamples=40, seed=4)
+            self.assertFalse(getattr(other_seed, method)(self.ranks, self.points).equals(expected))
+
+    def test_identity_resample_reproduces_scores(self):
+        for scorer in scorers(self.random_state, self.points, 30):
+            resampler = Resampler(scorer)
+            rank_array, points_array, position_array = resampler._align(self.ranks, self.points)
+            identity = np.tile(np.arange(rank_array.shape[0])[:, None], (1, 3))
+            observed = scorer.score(self.ranks, self.points).values
+            for method in ('bootstrap', 'permutation'):
+                scores = _score_shard((_metric_spec(scorer), rank_array, points_array, position_array, identity,
+                                       method))
+                np.testing.assert_allclose(scores, np.tile(observed[:, None], (1, 3)))
+
+    def test_bootstrap_scores_resampled_players(self):
+        n_resamples = 5
+        for scorer in (DCGScorer(k=10, normalize=False).fit(self.points),
+                       DifferenceScorer(k=10).fit(pd.DataFrame(self.random_state.gamma(2., 5., (30, 8))))):
+            scores = Resampler(scorer, n_resamples=n_resamples, seed=1, shard_size=2).bootstrap(self.ranks,
+                                                                                                 self.points)
+            for resample in xrange(n_resamples):
+                # players drawn more than once are scored once for each draw
+                idx = np.sort(_resample_indices(30, (1, resample, 1), 'bootstrap')[:, 0])
+                rank_array, points_array = self.ranks.values[idx], self.points.values[idx]
+                if isinstance(scorer, DCGScorer):
+                    expected = DCGScorer(k=10, normalize=False).fit(points_array).score(rank_array)
+                else:
+                    expected = scorer.score(rank_array, points_array)
+                np.testing.assert_allclose(scores.iloc[resample].values, expected)
+
+    def test_permutation_moves_points_only(self):
+        scorer = DCGScorer(k=None, normalize=False).fit(self.points)
+        scores = Resampler(scorer, n_resamples=5, seed=2).permutation(self.ranks, self.points)
+        for resample in xrange(5):
+            # rankings stay with their players
+            idx = _resample_indices(30, (2, resample, 1), 'permutation')[:, 0]
+            expected = DCGScorer(k=None, normalize=False).fit(self.points.values[idx]).score(self.ranks.values)
+            np.testing.assert_allclose(scores.iloc[resample].values, expected)
+
+    def test_p_values(self):
+        resampler = Resampler(DCGScorer(k=10).fit(self.points), n_resamples=50)
+        p_values = resampler.p_values(self.ranks, self.points)
+        null_scores = resampler.permutation(self.ranks, self.points)
+        observed = resampler.score(self.ranks, self.points)
+        for expert, score in zip(self.ranks.columns, observed):
+            self.assertAlmostEqual(p_values[expert], (1. + (null_scores[expert] >= score).sum()) / 51.)
+        # no permutation ranks the points as well as the best ranking, every permutation beats the worst
+        self.assertAlmostEqual(p_values['Best'], 1. / 51)
+        self.assertAlmostEqual(p_values['Worst'], 1.)
+
+    def test_win_probabilities(self):
+        resampler = Resampler(DCGScorer(k=10).fit(self.points), n_resamples=50)
+        probabilities = resampler.win_probabilities(self.ranks, self.points)
+        np.testing.assert_allclose(np.diag(probabilities.values), 0.5)
+        np.testing.assert_allclose(probabilities.values + probabilities.values.T, 1.)
+        scores = resampler.bootstrap(self.ranks, self.points)
+        expected = (scores['A'] > scores['B']).mean() + 0.5 * (scores['A'] == scores['B']).mean()
+        self.assertAlmostEqual(probabilities.loc['A', 'B'], expected)
+        self.assertAlmostEqual(probabilities.loc['Best', 'Worst'], 1.)
+
+    def test_confidence_intervals(self):
+        resampler = Resampler(DCGScorer(k=10).fit(self.points), n_resamples=50)
+        intervals = resampler.confidence_intervals(self.ranks, self.points, alpha=0.1)
+        scores = resampler.bootstrap(self.ranks, self.points)
+        np.testing.assert_allclose(intervals['Lower'], scores.quantile(0.05).values)
+        np.testing.assert_allclose(intervals['Upper'], scores.quantile(0.95).values)
+        np.testing.assert_allclose(intervals['Score'], resampler.score(self.ranks, self.points))
+
+    def test_unsupported_scorer(self):
+        self.assertRaises(TypeError, Resampler, object())
+        self.assertRaises(ValueError, Resampler(DifferenceScorer().fit(pd.DataFrame(np.ones((3, 2))))).score,
+                          self.ranks)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+""" Tests of the SQLite results store """
+
+import unittest
+import pandas as pd
+
+from yafsa.results import ResultsStore
+
+
+def _results(week, experts, position='WR', year=2016):
+    """
+    Tidy results of one scored week, as from driver.score_season, with DCG and Diff metrics
+    """
+    n = len(experts)
+    return pd.DataFrame({'Year': year, 'Week': week, 'Position': position, 'Expert': experts,
+                         'DCG': range(1, n + 1), 'DCGScore': [1. - 0.1 * i for i in xrange(n)],
+                         'Diff': range(n, 0, -1), 'DiffScore': [-1. - 0.1 * i for i in xrange(n)],
+                         'Composite': [n + 1] * n},
+                        columns=['Year', 'Week', 'Position', 'Expert', 'DCG', 'DCGScore', 'Diff', 'DiffScore',
+                                 'Composite'])
+
+
+class ResultsStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = ResultsStore(':memory:', windows=[2])
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_record(self):
+        self.assertEqual(self.store.record(_results(1, ['A', 'B'])), 6)
+        scores = self.store.scores(metric='DCG')
+        self.assertEqual(list(scores['expert']), ['A', 'B'])
+        self.assertEqual(list(scores['score']), [1., 0.9])
+
+    def test_rescore_drops_experts_no_longer_scored(self):
+        self.store.record(_results(1, ['A', 'B', 'ConsensusBorda']))
+        self.store.record(_results(2, ['A', 'B', 'ConsensusBorda']))
+        self.store.record(_results(1, ['A', 'B']))
+        scores = self.store.scores()
+        self.assertEqual(sorted(scores[scores['week'] == 1]['expert'].unique()), ['A', 'B'])
+        # other weeks are kept
+        self.assertEqual(sorted(scores[scores['week'] == 2]['expert'].unique()), ['A', 'B', 'ConsensusBorda'])
+        # and so are the rollups
+        board = self.store.leaderboard(metric='DCG', position='WR')
+        self.assertEqual(board.loc['A', 'Weeks'], 2)
+        self.assertEqual(board.loc['ConsensusBorda', 'Weeks'], 1)
+        window = self.store.leaderboard(metric='DCG', position='WR', window=2)
+        self.assertEqual(window.loc['ConsensusBorda', 'Weeks'], 1)
+
+    def test_rescore_drops_metrics_no_longer_scored(self):
+        self.store.record(_results(1, ['A', 'B']))
+        self.store.record(_results(1, ['A', 'B']).drop(['Diff', 'DiffScore'], axis=1))
+        self.assertEqual(sorted(self.store.scores()['metric'].unique()), ['Composite', 'DCG'])
+        self.assertTrue(self.store.leaderboard(metric='Diff', position='WR').empty)
+
+    def test_other_positions_are_kept(self):
+        self.store.record(_results(1, ['A', 'B'], position='TE'))
+        self.store.record(_results(1, ['A', 'B', 'C']))
+        self.store.record(_results(1, ['A']))
+        self.assertEqual(list(self.store.scores(position='TE', metric='DCG')['expert']), ['A', 'B'])
+        self.assertEqual(list(self.store.scores(position='WR', metric='DCG')['expert']), ['A'])
+
+
+if __name__ == '__main__':
+    unittest.main()
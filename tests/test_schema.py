@@ -0,0 +1,70 @@
+""" Tests of the table schemas applied to scraped records """
+
+import unittest
+
+from yafsa import instrument
+from yafsa.schema import RANKINGS_SCHEMA, STATS_SCHEMA, SchemaError, TableSchema, parse_number
+
+
+class ParseNumberTest(unittest.TestCase):
+
+    def test_numbers(self):
+        self.assertEqual(parse_number(' 1,024 '), 1024)
+        self.assertEqual(parse_number('-3.5'), -3.5)
+        self.assertEqual(parse_number('.5'), 0.5)
+        self.assertIsNone(parse_number('  '))
+        self.assertRaises(SchemaError, parse_number, 'NR')
+
+
+class TableSchemaTest(unittest.TestCase):
+
+    def setUp(self):
+        instrument.reset()
+
+    def tearDown(self):
+        instrument.reset()
+
+    def test_bad_cell_becomes_null(self):
+        schema = TableSchema('rankings', 'Player (matchup)', drop=['Rank'])
+        records = [{'Player (matchup)': 'Antonio Brown PIT vs. WAS', 'Rank': '1', 'MikeClay': 'NR', 'LizLoza': '2'},
+                   {'Player (matchup)': 'Julio Jones ATL vs. TB', 'Rank': '2', 'MikeClay': '1', 'LizLoza': '1'}]
+        parsed = list(schema.apply(records))
+        self.assertEqual(len(parsed), 2)
+        self.assertIsNone(parsed[0]['MikeClay'])
+        self.assertEqual(parsed[0]['LizLoza'], 2)
+        self.assertEqual(parsed[1]['MikeClay'], 1)
+        self.assertEqual(schema.errors, {'cell_number': 1})
+        counters = instrument.collect()[1]
+        self.assertEqual(counters['schema.rankings.cell_number'], 1)
+        self.assertEqual(counters['schema.rankings.rows'], 2)
+        self.assertNotIn('schema.rankings.rejected', counters)
+
+    def test_bad_required_cell_rejects_row(self):
+        schema = TableSchema('stats', 'PLAYER', columns={'FPTS': parse_number})
+        records = [{'PLAYER': 'Antonio Brown', 'FPTS': 'n/a'}, {'PLAYER': 'Julio Jones', 'FPTS': '12.5'},
+                   {'PLAYER': 'Odell Beckham', 'FPTS': ''}]
+        parsed = list(schema.apply(records))
+        self.assertEqual(parsed, [{'PLAYER': 'Julio Jones', 'FPTS': 12.5}])
+        self.assertEqual(schema.errors, {'number': 1, 'missing': 1})
+        self.assertEqual(instrument.collect()[1]['schema.stats.rejected'], 2)
+
+    def test_missing_player_rejects_row(self):
+        schema = TableSchema('rankings', 'Player (matchup)')
+        parsed = list(schema.apply([{'Player (matchup)': ' ', 'MikeClay': '1'},
+                                    {'Player (matchup)': 'Julio Jones ATL vs. TB', 'MikeClay': 'NR'}]))
+        self.assertEqual(len(parsed), 1)
+        self.assertEqual(schema.errors, {'player': 1, 'cell_number': 1})
+
+    def test_every_record_rejected(self):
+        schema = TableSchema('stats', 'PLAYER', columns={'FPTS': parse_number})
+        with self.assertRaises(SchemaError) as raised:
+            list(schema.apply([{'PLAYER': 'Julio Jones', 'FPTS': 'n/a'}]))
+        self.assertEqual(raised.exception.reason, 'table')
+
+    def test_module_schemas(self):
+        self.assertEqual(RANKINGS_SCHEMA.required, set())
+        self.assertEqual(STATS_SCHEMA.required, set(['FPTS']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+""" Tests of TableScraper telling pages that could not be scraped from tables without rows """
+
+import unittest
+
+from tests.server import FixtureServer, fixture_page
+from yafsa.parallel import ParallelScraper
+from yafsa.schema import RANKINGS_SCHEMA, STATS_SCHEMA
+from yafsa.scrape import ScrapeError, TableScraper
+
+
+EMPTY_TABLE = '<html><body><table><tr><th>PLAYER</th><th>FPTS</th></tr></table></body></html>'
+
+
+class ScrapeFailureTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stats = fixture_page('thehuddle')
+        self.server = FixtureServer({'/stats': self.stats, '/empty': EMPTY_TABLE}).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def url(self, path):
+        return '%s%s' % (self.server.url, path)
+
+    def test_empty_table(self):
+        self.assertEqual(TableScraper().scrape_table(self.url('/empty')), [])
+        self.assertEqual(list(TableScraper().iter_table(self.url('/empty'))), [])
+
+    def test_failed_fetch(self):
+        self.assertIsNone(TableScraper().scrape_table(self.url('/missing')))
+        with self.assertRaises(ScrapeError):
+            list(TableScraper().iter_table(self.url('/missing')))
+
+    def test_every_record_rejected_by_the_schema(self):
+        # the stats page has no rankings player column: its layout does not match the schema
+        scraper = TableScraper(header_rows_to_skip=1, schema=RANKINGS_SCHEMA)
+        self.assertIsNone(scraper.scrape_table(self.url('/stats')))
+        with self.assertRaises(ScrapeError):
+            list(scraper.iter_table(self.url('/stats')))
+        for parse_processes in (0, 1):
+            parallel = ParallelScraper(scraper, rate=1000., retries=0, parse_processes=parse_processes)
+            self.assertEqual(parallel.scrape_tables([self.url('/stats')]), [None])
+
+    def test_schema_applied(self):
+        scraper = TableScraper(header_rows_to_skip=1, schema=STATS_SCHEMA)
+        records = scraper.scrape_table(self.url('/stats'))
+        self.assertEqual(len(records), 24)
+        self.assertEqual(records, list(scraper.iter_table(self.url('/stats'))))
+        self.assertEqual(sorted(records[0]), ['FPTS', 'PLAYER'])
+
+
+if __name__ == '__main__':
+    unittest.main()
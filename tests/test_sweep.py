@@ -0,0 +1,65 @@
+""" Tests of the sweeps of the scoring depth k against the scorers at each depth """
+
+import unittest
+import numpy as np
+import pandas as pd
+
+from tests.test_metrics import random_week
+from yafsa.score import DCGScorer, DifferenceScorer, composite_curves, dcg_curves, difference_curves, ordering_changes
+from yafsa.score.sweep import orderings
+
+
+class CurvesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.random_state = np.random.RandomState(0)
+        self.ranks, self.points = random_week(30, 4, self.random_state)[:2]
+
+    def test_dcg_curves(self):
+        # depths past the 15 ranked players of each expert
+        max_k = 20
+        for numerator, normalize in (('rel', True), ('rel', False), ('exp', True)):
+            curves = dcg_curves(DCGScorer(numerator=numerator, normalize=normalize).fit(self.points), self.ranks,
+                                max_k)
+            self.assertEqual(list(curves.index), range(1, max_k + 1))
+            for k in xrange(1, max_k + 1):
+                expected = DCGScorer(k=k, numerator=numerator, normalize=normalize).fit(self.points).score(self.ranks)
+                np.testing.assert_allclose(curves.loc[k].values, expected.values, err_msg='k=%d' % k)
+
+    def test_difference_curves(self):
+        # depths past the 12 fitted ranks score the fitted ranks only
+        history = pd.DataFrame(self.random_state.gamma(2., 5., (12, 6)))
+        max_k = 20
+        for standardize in (False, True):
+            curves = difference_curves(DifferenceScorer(standardize=standardize).fit(history), self.ranks,
+                                       self.points, max_k)
+            self.assertEqual(curves.shape, (max_k, 4))
+            for k in xrange(1, max_k + 1):
+                expected = DifferenceScorer(k=k, standardize=standardize).fit(history).score(self.ranks, self.points)
+                np.testing.assert_allclose(curves.loc[k].values, expected.values, err_msg='k=%d' % k)
+
+
+class OrderingChangesTest(unittest.TestCase):
+
+    def test_orderings(self):
+        curves = pd.DataFrame([[3., 1., np.nan], [2., 2., 1.]], columns=['X', 'Y', 'Z'])
+        # experts without a score come last, ties in column order
+        np.testing.assert_array_equal(orderings(curves).values, [[1., 2., 3.], [1., 2., 3.]])
+
+    def test_ordering_changes(self):
+        depths = pd.Index([1, 2, 3, 4, 5], name='k')
+        # X leads at depths 1 and 2, Y from depth 3 by DCG and from depth 4 by Diff
+        dcg = pd.DataFrame({'X': [3., 3., 1., 1., 1.], 'Y': [1., 2., 2., 2., 2.], 'Z': [0., 0., 0., 0., 3.]},
+                           index=depths, columns=['X', 'Y', 'Z'])
+        diff = pd.DataFrame({'X': [-1., -1., -1., -3., -3.], 'Y': [-2., -2., -2., -2., -2.], 'Z': [-4.] * 5},
+                            index=depths, columns=['X', 'Y', 'Z'])
+        composite = composite_curves({'DCG': dcg, 'Diff': diff})
+        np.testing.assert_array_equal(composite.values, [[2., 4., 6.], [2., 4., 6.], [3., 3., 6.], [4., 2., 6.],
+                                                         [5., 3., 4.]])
+        # at depth 3 X and Y tie and keep their order
+        self.assertEqual(ordering_changes(composite), [4, 5])
+        self.assertEqual(ordering_changes(composite_curves({'DCG': dcg})), [3, 5])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,236 @@
+""" Tests of the keep-alive transport against a local server, and of the in-memory fake """
+
+import gzip
+import pickle
+import shutil
+import tempfile
+import unittest
+import zlib
+from cStringIO import StringIO
+from urllib2 import HTTPError, Request, URLError
+
+from tests.server import FixtureServer, fixture_page
+from yafsa.cache import ResponseCache
+from yafsa.schema import STATS_SCHEMA
+from yafsa.scrape import TableScraper
+from yafsa.transport import FakeTransport, HTTPTransport
+
+
+def _gzip(body):
+    f = StringIO()
+    with gzip.GzipFile(fileobj=f, mode='wb') as g:
+        g.write(body)
+    return f.getvalue()
+
+
+def _raw_deflate(body):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(body) + compressor.flush()
+
+
+def _encoded_route(body, encoding):
+    def route(handler, attempt):
+        handler.send_body(body, headers={'Content-Encoding': encoding})
+    return route
+
+
+def _chunked_route(page, size=1000):
+    def route(handler, attempt):
+        handler.send_response(200)
+        handler.send_header('Transfer-Encoding', 'chunked')
+        handler.end_headers()
+        for first in xrange(0, len(page), size):
+            part = page[first:first + size]
+            handler.wfile.write('%x\r\n%s\r\n' % (len(part), part))
+        handler.wfile.write('0\r\n\r\n')
+    return route
+
+
+def _closing_route(page):
+    """
+    Route answering with page and then closing the connection without saying so, as a server timing out an idle
+    keep-alive connection does
+    """
+    def route(handler, attempt):
+        handler.send_body(page)
+        handler.close_connection = 1
+    return route
+
+
+def _truncated_route(page):
+    def route(handler, attempt):
+        handler.send_response(200)
+        handler.send_header('Content-Length', str(len(page)))
+        handler.end_headers()
+        handler.wfile.write(page[:len(page) // 2])
+        handler.close_connection = 1
+    return route
+
+
+def _etag_route(page, etag):
+    def route(handler, attempt):
+        if handler.headers.getheader('If-None-Match') == etag:
+            handler.send_body('', code=304)
+        else:
+            handler.send_body(page, headers={'ETag': etag})
+    return route
+
+
+class HTTPTransportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.page = fixture_page('thehuddle')
+        self.server = FixtureServer({
+            '/plain': self.page,
+            '/gzip': _encoded_route(_gzip(self.page), 'gzip'),
+            '/zlib': _encoded_route(zlib.compress(self.page), 'deflate'),
+            '/deflate': _encoded_route(_raw_deflate(self.page), 'deflate'),
+            '/chunked': _chunked_route(self.page),
+            '/redirect': lambda handler, attempt: handler.send_body('', code=302, headers={'Location': '/gzip'}),
+            '/error': lambda handler, attempt: handler.send_body('server error', code=500),
+            '/closing': _closing_route(self.page),
+            '/truncated': _truncated_route(self.page),
+            '/etag': _etag_route(self.page, '"v1"'),
+        }).start()
+        self.transport = HTTPTransport(timeout=5.)
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.stop()
+
+    def url(self, path):
+        return '%s%s' % (self.server.url, path)
+
+    def read(self, path):
+        response = self.transport.open(self.url(path))
+        try:
+            return response.read()
+        finally:
+            response.close()
+
+    def test_keep_alive_reuse(self):
+        for _ in xrange(3):
+            self.assertEqual(self.read('/plain'), self.page)
+        self.assertEqual(self.server.connections, 1)
+        stats = self.transport.stats
+        self.assertEqual((stats['requests'], stats['reused'], stats['idle']), (3, 2, 1))
+
+    def test_decoders(self):
+        for path in ('/gzip', '/zlib', '/deflate', '/chunked'):
+            self.assertEqual(self.read(path), self.page, path)
+        self.assertEqual(self.server.connections, 1)
+        gzipped = self.transport.log[0]
+        self.assertLess(gzipped.bytes_received, gzipped.bytes_decoded)
+        self.assertEqual(gzipped.bytes_decoded, len(self.page))
+
+    def test_streamed_reads(self):
+        for path in ('/gzip', '/chunked'):
+            response = self.transport.open(self.url(path))
+            parts = list(iter(lambda: response.read(700), ''))
+            self.assertEqual(''.join(parts), self.page)
+            self.assertTrue(all(len(part) == 700 for part in parts[:-1]))
+        self.assertEqual(self.transport.stats['idle'], 1)
+
+    def test_uncompressed(self):
+        transport = HTTPTransport(compress=False)
+        response = transport.open(self.url('/plain'))
+        self.assertEqual(response.read(), self.page)
+        self.assertEqual(transport.log[0].bytes_received, len(self.page))
+        transport.close()
+
+    def test_redirect(self):
+        response = self.transport.open(self.url('/redirect'))
+        self.assertEqual(response.read(), self.page)
+        self.assertEqual(response.geturl(), self.url('/gzip'))
+        self.assertEqual(self.server.connections, 1)
+
+    def test_http_errors(self):
+        with self.assertRaises(HTTPError) as raised:
+            self.transport.open(self.url('/missing'))
+        self.assertEqual(raised.exception.code, 404)
+        with self.assertRaises(HTTPError) as raised:
+            self.transport.open(self.url('/error'))
+        self.assertEqual(raised.exception.code, 500)
+        self.assertEqual(raised.exception.read(), 'server error')
+        # the bodies of errors are read, so the connection is reused
+        self.assertEqual(self.read('/plain'), self.page)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_url_errors(self):
+        self.assertRaises(URLError, self.transport.open, 'ftp://127.0.0.1/page')
+        self.server.stop()
+        self.server = FixtureServer({}).start()
+        # nothing listens on the port of the stopped server
+        self.assertRaises(URLError, self.transport.open, 'http://127.0.0.1:%d/plain' % self.server.server_address[1])
+
+    def test_stale_connection_retried(self):
+        self.assertEqual(self.read('/closing'), self.page)
+        self.assertEqual(self.transport.stats['idle'], 1)
+        # the pooled connection was closed by the server: the GET is sent again on a new connection
+        self.assertEqual(self.read('/plain'), self.page)
+        self.assertEqual(self.server.connections, 2)
+        self.assertEqual(self.server.count('/plain'), 1)
+
+    def test_stale_connection_not_retried_for_post(self):
+        self.assertEqual(self.read('/closing'), self.page)
+        with self.assertRaises(URLError):
+            self.transport.open(Request(self.url('/plain'), data='week=1'))
+        self.assertEqual(self.server.connections, 1)
+        # the connection was dropped, so the next request opens a new one
+        response = self.transport.open(Request(self.url('/plain'), data='week=1'))
+        self.assertEqual(response.read(), self.page)
+        self.assertEqual(self.server.connections, 2)
+
+    def test_truncated_body(self):
+        response = self.transport.open(self.url('/truncated'))
+        self.assertRaises(URLError, response.read)
+        response = self.transport.open(self.url('/truncated'))
+        self.assertRaises(URLError, lambda: list(iter(lambda: response.read(100), '')))
+        self.assertEqual(self.transport.stats['idle'], 0)
+
+    def test_scraper(self):
+        scraper = TableScraper(header_rows_to_skip=1, transport=self.transport, schema=STATS_SCHEMA)
+        records = scraper.scrape_table(self.url('/plain'))
+        self.assertEqual(len(records), 24)
+        self.assertEqual(scraper.scrape_table(self.url('/gzip')), records)
+        self.assertEqual(list(scraper.iter_table(self.url('/chunked'))), records)
+        # pickled without its connections
+        copy = pickle.loads(pickle.dumps(self.transport))
+        self.assertEqual(copy.stats['requests'], 0)
+
+    def test_cache_revalidation(self):
+        directory = tempfile.mkdtemp(prefix='yafsa-test-')
+        try:
+            cache = ResponseCache(directory, ttl=0, opener=self.transport.open)
+            self.assertEqual(cache.fetch(self.url('/etag')), self.page)
+            self.assertEqual(cache.fetch(self.url('/etag')), self.page)
+            self.assertEqual((cache.stats['misses'], cache.stats['revalidated']), (1, 1))
+            self.assertEqual(self.server.connections, 1)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+class FakeTransportTest(unittest.TestCase):
+
+    def test_pages(self):
+        page = fixture_page('thehuddle')
+        transport = FakeTransport({'http://stats/page': page, 'http://stats/error': (500, 'error')})
+        self.assertEqual(transport.open('http://stats/page').read(), page)
+        self.assertEqual(transport.open(Request('http://stats/page')).getcode(), 200)
+        with self.assertRaises(HTTPError) as raised:
+            transport.open('http://stats/error')
+        self.assertEqual((raised.exception.code, raised.exception.read()), (500, 'error'))
+        self.assertRaises(HTTPError, transport.open, 'http://stats/missing')
+        self.assertEqual(transport.requests, ['http://stats/page'] * 2 + ['http://stats/error', 'http://stats/missing'])
+        self.assertEqual(transport.stats['requests'], 4)
+        self.assertEqual(pickle.loads(pickle.dumps(transport)).requests, transport.requests)
+
+    def test_scraper(self):
+        transport = FakeTransport({'http://stats/page': fixture_page('thehuddle')})
+        scraper = TableScraper(header_rows_to_skip=1, transport=transport, schema=STATS_SCHEMA)
+        self.assertEqual(len(scraper.scrape_table('http://stats/page')), 24)
+        self.assertIsNone(scraper.scrape_table('http://stats/missing'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,303 @@
+""" Persistent on-disk cache of HTTP responses with conditional revalidation and LRU eviction """
+
+import datetime
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+import ujson as json
+from contextlib import closing
+from urllib2 import HTTPError, Request, urlopen
+
+
+INDEX_FILE = 'index.json'
+
+WEEK_PATTERN = re.compile(r'[?&]week=(\d+)')
+
+
+class ResponseCache(object):
+
+    """
+    Cache of page bodies keyed by url
+
+    A cached page is served without a request while it is fresh (younger than its TTL).  Once stale, it is
+    revalidated with If-None-Match/If-Modified-Since using the ETag/Last-Modified headers of the cached
+    response, so an unchanged page costs a request but no download.  When the cached bodies exceed max_bytes,
+    the least recently used pages are evicted.  The index is written when a page is downloaded; access times and
+    revalidations are kept in memory until flush or close.  Pages can be streamed (open): a downloaded body is
+    written to disk as it is read and added to the cache once read to the end, and a cached body is read from
+    its file.
+    """
+
+    def __init__(self, directory, max_bytes=100 * 1024 * 1024, ttl=None, opener=urlopen):
+        """
+        :param directory: directory holding cached bodies and the index
+        :param max_bytes: maximum total size of cached bodies
+        :param ttl: seconds a cached page stays fresh (None never expires), or a function of the url returning
+            seconds or None
+        :param opener: function opening a urllib2 Request
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.opener = opener
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self._lock = threading.RLock()
+        self._index = self._read_index()
+        # whether the index has changes (access times, revalidations) not yet written
+        self._dirty = False
+
+    @property
+    def stats(self):
+        """
+        Counters of cache use: hits (served without a request), revalidated (304 responses), misses (downloads)
+        :return:
+        """
+        return {'hits': self.hits, 'revalidated': self.revalidated, 'misses': self.misses,
+                'pages': len(self._index), 'bytes': self.size}
+
+    @property
+    def size(self):
+        """
+        Total size in bytes of cached bodies
+        :return:
+        """
+        return sum(entry['size'] for entry in self._index.itervalues())
+
+    def is_fresh(self, url):
+        """
+        Whether url can be served from the cache without a request
+        :param url:
+        :return:
+        """
+        with self._lock:
+            entry = self._index.get(url)
+            if entry is None:
+                return False
+            ttl = self.ttl(url) if callable(self.ttl) else self.ttl
+            return ttl is None or time.time() - entry['fetched'] < ttl
+
+    def fetch(self, url):
+        """
+        Get the body of url, from the cache if possible
+        :param url:
+        :return: string
+        """
+        with closing(self.open(url)) as f:
+            return f.read()
+
+    def open(self, url):
+        """
+        Open the body of url for reading, from the cache if possible
+        :param url:
+        :return: file-like object with read and close; a downloaded body is added to the cache once it has been read
+            to the end (a body closed before its end is not cached)
+        """
+        if self.is_fresh(url):
+            with self._lock:
+                self.hits += 1
+                return self._open_body(url)
+
+        request = Request(url)
+        with self._lock:
+            entry = self._index.get(url)
+        if entry is not None:
+            if entry.get('etag'):
+                request.add_header('If-None-Match', entry['etag'])
+            if entry.get('last_modified'):
+                request.add_header('If-Modified-Since', entry['last_modified'])
+
+        try:
+            urlhandle = self.opener(request)
+        except HTTPError as e:
+            if e.code != 304 or entry is None:
+                raise
+            with self._lock:
+                self.revalidated += 1
+                entry['fetched'] = time.time()
+                return self._open_body(url)
+
+        with self._lock:
+            self.misses += 1
+        return _CachingReader(self, url, urlhandle)
+
+    def flush(self):
+        """
+        Write the index if access times or revalidations were recorded since it was last written
+        :return:
+        """
+        with self._lock:
+            if self._dirty:
+                self._write_index()
+
+    def close(self):
+        """
+        Flush the index
+        :return:
+        """
+        self.flush()
+
+    def clear(self):
+        """
+        Remove every cached page
+        :return:
+        """
+        with self._lock:
+            for url in list(self._index):
+                self._evict(url)
+            self._write_index()
+
+    def _open_body(self, url):
+        entry = self._index[url]
+        entry['accessed'] = time.time()
+        self._dirty = True
+        return open(os.path.join(self.directory, entry['file']), 'rb')
+
+    def _add_body(self, url, tmp_file_name, size, etag, last_modified):
+        """
+        Move a downloaded body into the cache and index it, evicting least recently used pages
+        :param url:
+        :param tmp_file_name: file the body was written to
+        :param size: bytes in the body
+        :param etag:
+        :param last_modified:
+        :return:
+        """
+        file_name = '%s.html' % hashlib.sha1(url).hexdigest()
+        os.rename(tmp_file_name, os.path.join(self.directory, file_name))
+        now = time.time()
+        self._index[url] = {'file': file_name, 'size': size, 'etag': etag, 'last_modified': last_modified,
+                            'fetched': now, 'accessed': now}
+        # evict least recently used pages, never the page just written
+        by_access = sorted(self._index, key=lambda u: self._index[u]['accessed'])
+        total = self.size
+        for lru_url in by_access:
+            if total <= self.max_bytes or lru_url == url:
+                break
+            total -= self._index[lru_url]['size']
+            self._evict(lru_url)
+        self._write_index()
+
+    def _evict(self, url):
+        entry = self._index.pop(url)
+        try:
+            os.remove(os.path.join(self.directory, entry['file']))
+        except OSError:
+            pass
+
+    def _read_index(self):
+        index_file = os.path.join(self.directory, INDEX_FILE)
+        if not os.path.exists(index_file):
+            return {}
+        with open(index_file) as f:
+            index = json.loads(f.read())
+        # drop entries whose bodies are missing
+        return {url: entry for url, entry in index.iteritems()
+                if os.path.exists(os.path.join(self.directory, entry['file']))}
+
+    def _write_index(self):
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        index_file = os.path.join(self.directory, INDEX_FILE)
+        with open('%s.tmp' % index_file, 'w') as f:
+            f.write(json.dumps(self._index))
+        os.rename('%s.tmp' % index_file, index_file)
+        self._dirty = False
+
+
+class _CachingReader(object):
+
+    """ Response being downloaded: bytes read are written to a temporary file, added to the cache at the end """
+
+    def __init__(self, cache, url, urlhandle):
+        """
+        :param cache: ResponseCache
+        :param url:
+        :param urlhandle: response opened by the cache's opener
+        """
+        self.cache = cache
+        self.url = url
+        self.urlhandle = urlhandle
+        headers = urlhandle.info()
+        self.etag = headers.getheader('ETag')
+        self.last_modified = headers.getheader('Last-Modified')
+        if not os.path.exists(cache.directory):
+            os.makedirs(cache.directory)
+        fd, self.tmp_file_name = tempfile.mkstemp(suffix='.tmp', dir=cache.directory)
+        self.file = os.fdopen(fd, 'wb')
+        self.size = 0
+
+    def read(self, size=-1):
+        """
+        Read bytes of the body, caching the body once its end is read
+        :param size: number of bytes (to the end of the body if negative)
+        :return: string
+        """
+        data = self.urlhandle.read() if size < 0 else self.urlhandle.read(size)
+        if self.file is not None:
+            self.file.write(data)
+            self.size += len(data)
+            if size < 0 or not data:
+                self._finish(complete=True)
+        return data
+
+    def close(self):
+        self._finish(complete=False)
+        self.urlhandle.close()
+
+    def _finish(self, complete):
+        """
+        Add the body to the cache if it was read to the end, discard it otherwise (once)
+        :param complete: whether the body was read to the end
+        :return:
+        """
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+        if complete:
+            with self.cache._lock:
+                self.cache._add_body(self.url, self.tmp_file_name, self.size, self.etag, self.last_modified)
+        else:
+            os.remove(self.tmp_file_name)
+
+
+def season_week(year, today=None, n_weeks=17):
+    """
+    Week of a season in progress on a date, e.g., the current_week of season_ttl.  The season opens on the Thursday
+    after Labor Day (the first Monday of September) and each week starts on the Tuesday before its games, so the
+    games of a week are over once the next week starts.
+    :param year: season
+    :param today: datetime.date (defaults to today)
+    :param n_weeks: number of weeks in the season
+    :return: week in progress (1 before the season opens), None once the season is complete
+    """
+    today = today or datetime.date.today()
+    september = datetime.date(int(year), 9, 1)
+    labor_day = september + datetime.timedelta(days=(7 - september.weekday()) % 7)
+    week = (today - labor_day - datetime.timedelta(days=1)).days // 7 + 1
+    if week > n_weeks:
+        return None
+    return max(1, week)
+
+
+def season_ttl(current_week=None, ttl=60 * 60):
+    """
+    Build a TTL function for ResponseCache: pages of weeks before current_week never expire (completed weeks do
+    not change), while pages of current_week and later (or without a week) expire after ttl seconds
+    :param current_week: week in progress (None if the season is complete, so that no page expires)
+    :param ttl: seconds pages of open weeks stay fresh
+    :return:
+    """
+    def url_ttl(url):
+        if current_week is None:
+            return None
+        match = WEEK_PATTERN.search(url)
+        if match and int(match.group(1)) < current_week:
+            return None
+        return ttl
+    return url_ttl
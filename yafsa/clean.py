@@ -1,10 +1,103 @@
 """ Tools for ETL/cleaning rank and stats data """
 
 import numpy as np
+import pandas as pd
 import re
+from yafsa import instrument
 
 
-def clean_data(df, player_col, index_name=None, select_cols=None, drop_cols=None, fill=None):
+# first two space-separated tokens of a (stripped) player name
+PLAYER_NAME_RE = re.compile(r'^([^ ]*(?: [^ ]*)?)')
+# date of the form mm/dd
+DATE_RE = re.compile(r'\d+/\d+')
+
+
+class PlayerRegistry(object):
+
+	"""
+	Memoized table mapping raw scraped player strings (e.g., "Odell Beckham Jr. NYG vs DAL") to canonical names
+	and stable integer player IDs, shared across every file of a season so each raw string is normalized once
+	"""
+
+	def __init__(self):
+		# raw string -> canonical name
+		self.names = {}
+		# canonical name -> player ID
+		self.ids = {}
+		# player ID -> canonical name
+		self.players = []
+
+	def __len__(self):
+		return len(self.players)
+
+	def normalize(self, raw_names):
+		"""
+		Canonical names for a series of raw player strings, normalizing only strings not seen before
+		:param raw_names: Series of raw player strings
+		:return: Series of canonical names
+		"""
+		unseen = [name for name in pd.unique(raw_names.values) if name not in self.names]
+		if unseen:
+			canonical = normalize_player_names(pd.Series(unseen, dtype=object))
+			for raw, name in zip(unseen, canonical):
+				self.names[raw] = name
+				self.intern(name)
+		return pd.Series([self.names.get(raw) for raw in raw_names.values], index=raw_names.index, name=raw_names.name,
+						 dtype=object)
+
+	def intern(self, name):
+		"""
+		Player ID of a canonical name, assigning the next ID to names not seen before
+		:param name: canonical player name
+		:return: int
+		"""
+		player_id = self.ids.get(name)
+		if player_id is None:
+			player_id = self.ids[name] = len(self.players)
+			self.players.append(name)
+		return player_id
+
+	def player_ids(self, raw_names):
+		"""
+		Player IDs for a series of raw player strings
+		:param raw_names: Series of raw player strings
+		:return: Series of integer IDs
+		"""
+		names = self.normalize(raw_names)
+		return pd.Series([self.ids[name] for name in names.values], index=names.index, name=names.name, dtype=int)
+
+	def to_array(self, data, size=None):
+		"""
+		Convert data indexed by canonical player name (e.g., the output of clean_data) to the compact form used
+		by the scorers: a float array whose row i holds the data of player ID i (NaN for players not in data)
+		:param data: Series or DataFrame indexed by canonical player name
+		:param size: number of rows (defaults to the number of registered players)
+		:return: array of shape (size,) for a Series or (size, n_columns) for a DataFrame
+		"""
+		ids = np.array([self.intern(name) for name in data.index], dtype=int)
+		size = len(self) if size is None else size
+		array = np.full((size,) + data.shape[1:], np.nan)
+		in_range = ids < size
+		array[ids[in_range]] = data.values[in_range]
+		return array
+
+	def from_array(self, array, name=None, columns=None):
+		"""
+		Convert a compact array indexed by player ID back to a Series or DataFrame indexed by player name
+		:param array: array of shape (n_players,) or (n_players, n_columns)
+		:param name: name of the index
+		:param columns: column labels for a 2-d array
+		:return:
+		"""
+		index = pd.Index(self.players[:array.shape[0]], name=name)
+		if array.ndim == 1:
+			return pd.Series(array, index=index)
+		return pd.DataFrame(array, index=index, columns=columns)
+
+
+@instrument.timer('clean')
+def clean_data(df, player_col, index_name=None, select_cols=None, drop_cols=None, fill=None, registry=None,
+			   player_ids=False):
 	"""
 	Convenience function for cleaning data: subsetting, filling missing values, and setting index/columns
 	:param df: DataFrame usually resulting from scraping stats or rankings
@@ -13,8 +106,11 @@ def clean_data(df, player_col, index_name=None, select_cols=None, drop_cols=None
 	:param select_cols: columns to be selected (defaults to all)
 	:param drop_cols: columns to be dropped (defaults to none)
 	:param fill: value in df to be filled with NaN
+	:param registry: PlayerRegistry memoizing player name normalization (names are normalized directly if None)
+	:param player_ids: index by the registry's integer player IDs instead of player names (requires registry)
 	:return:
 	"""
+	instrument.count('clean.rows_in', df.shape[0])
 
 	# subsetting
 	if select_cols:
@@ -23,29 +119,39 @@ def clean_data(df, player_col, index_name=None, select_cols=None, drop_cols=None
 		df = df.filter(select_cols + [player_col], axis=1)
 	if drop_cols:
 		drop_cols = drop_cols if isinstance(drop_cols, list) else [drop_cols]
-		# use select instead of drop here to avoid requiring every element of drop_cols to be in df
-		df = df.select(lambda x: x not in drop_cols, axis=1)
+		# use a mask instead of drop here to avoid requiring every element of drop_cols to be in df
+		df = df.loc[:, ~df.columns.isin(drop_cols)]
 
 	# fill missing values
 	if fill is not None:
 		df = df.replace(fill, np.nan)
 
 	# set index and column names
-	df = (df.pipe(set_player_index, player_col, index_name)
+	df = (df.pipe(set_player_index, player_col, index_name, registry, player_ids)
 			.pipe(set_column_names, deduplicate=True))
 
+	instrument.count('clean.rows_out', df.shape[0])
 	return df
 
 
-def set_player_index(df, player_col, index_name):
+def set_player_index(df, player_col, index_name, registry=None, player_ids=False):
 	"""
 	Sets player_col as the index, after normalization, with name index_name
 	:param df: dataframe
 	:param player_col: column containing player names
 	:param index_name: name to use for index
+	:param registry: PlayerRegistry memoizing player name normalization (names are normalized directly if None)
+	:param player_ids: replace player names with the registry's integer player IDs (requires registry)
 	:return:
 	"""
-	df[player_col] = df[player_col].apply(_normalize_player_names)
+	if player_ids:
+		if registry is None:
+			raise ValueError('player_ids requires a registry')
+		df[player_col] = registry.player_ids(df[player_col])
+	elif registry is None:
+		df[player_col] = normalize_player_names(df[player_col])
+	else:
+		df[player_col] = registry.normalize(df[player_col])
 
 	df = (df.set_index(player_col)
 			.rename_axis(index_name if index_name else player_col, axis=0))
@@ -65,16 +171,24 @@ def set_column_names(df, deduplicate=True):
 	return df
 
 
-def _normalize_player_names(namestr):
+def normalize_player_names(names):
 	"""
 	Strips off all extra information from player names (e.g., opponent, date) and standardizes names (removes Jr., etc)
-	:param namestr: string
+	:param names: Series of strings
+	:return:
+	"""
+	return (names.str.strip()
+				 .str.extract(PLAYER_NAME_RE, expand=False)
+				 .str.strip(',.'))
+
+
+def normalize_player_name(name):
+	"""
+	Normalizes a single player name as normalize_player_names does (e.g., while scraping, see yafsa.schema)
+	:param name: string
 	:return:
 	"""
-	try:
-		return ' '.join(namestr.strip().split(' ')[:2]).strip(',.')
-	except IndexError:
-		return ' '
+	return PLAYER_NAME_RE.match(name.strip()).group(1).strip(',.')
 
 
 def _strip_date_from_name(namestr):
@@ -83,7 +197,4 @@ def _strip_date_from_name(namestr):
 	:param namestr: string
 	:return:
 	"""
-	try:
-		return re.split('\d+/\d+', namestr)[0]
-	except IndexError:
-		return ' '
+	return DATE_RE.split(namestr)[0]
@@ -0,0 +1,369 @@
+""" SQLite store of scraped stats and rankings, normalized into players, experts, points and rankings tables """
+
+import sqlite3
+import numpy as np
+import pandas as pd
+from contextlib import contextmanager
+from yafsa import instrument
+from yafsa.clean import PlayerRegistry, _strip_date_from_name
+
+
+# labels of the scraped tables (see scrape_stats.py and scrape_rankings.py)
+STATS_PLAYER_COL = 'PLAYER'
+POINTS_COL = 'FPTS'
+RANKS_PLAYER_COL = 'Player (matchup)'
+RANKS_DROP_COLS = ['Rank', 'FantasyProsAll Experts']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS experts (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS points (
+    year INTEGER NOT NULL,
+    week INTEGER NOT NULL,
+    position TEXT NOT NULL,
+    player_id INTEGER NOT NULL REFERENCES players (id),
+    row INTEGER NOT NULL,
+    points REAL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS points_year_week_position_player ON points (year, week, position, player_id);
+CREATE TABLE IF NOT EXISTS rankings (
+    year INTEGER NOT NULL,
+    week INTEGER NOT NULL,
+    position TEXT NOT NULL,
+    expert_id INTEGER NOT NULL REFERENCES experts (id),
+    player_id INTEGER NOT NULL REFERENCES players (id),
+    source INTEGER NOT NULL,
+    row INTEGER NOT NULL,
+    rank REAL NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS rankings_year_week_position_expert
+    ON rankings (year, week, position, expert_id, player_id);
+CREATE INDEX IF NOT EXISTS rankings_expert_position_year ON rankings (expert_id, position, year, week);
+"""
+
+
+class Database(object):
+
+    """
+    SQLite database of points and expert rankings
+
+    Tables are normalized as they are ingested: player names are normalized (as clean_data does) into the players
+    table, expert labels are stripped of their trailing date into the experts table, and only the points (FPTS) and
+    the non-empty ranks are kept, keyed by (year, week, position, player) and (year, week, position, expert, player).
+    Each write runs its inserts with executemany inside a single transaction, replacing any earlier copy of the
+    table, and the readers return frames shaped like those of driver.get_stats and driver.get_ranks.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: database file (created if it does not exist, ':memory:' for an in-memory database)
+        """
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+        self.registry = PlayerRegistry()
+        # table -> {name -> ID}, loaded lazily
+        self._ids = {}
+        # number of open (nested) transaction blocks
+        self._depth = 0
+
+    def close(self):
+        self.connection.close()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Group writes into a single transaction, committed on exit and rolled back on error; transactions opened
+        within a transaction (e.g., by write_stats) join it, so only the outermost one commits
+        :return:
+        """
+        self._depth += 1
+        try:
+            if self._depth > 1:
+                yield self
+            else:
+                with self.connection:
+                    yield self
+        except Exception:
+            # IDs assigned in the rolled back transaction no longer exist
+            self._ids.clear()
+            raise
+        finally:
+            self._depth -= 1
+
+    def write_stats(self, records, year, week, position):
+        """
+        Add (or replace) a scraped stats table
+        :param records: iterable of dict records, one for each row
+        :param year:
+        :param week:
+        :param position:
+        :return: number of rows written
+        """
+        records = list(records)
+        with self.transaction():
+            return self._insert_points(year, week, position, [record.get(STATS_PLAYER_COL) for record in records],
+                                       [record.get(POINTS_COL) for record in records])
+
+    def write_ranks(self, records, year, week, position, source):
+        """
+        Add (or replace) a scraped rankings table
+        :param records: iterable of dict records, one for each row
+        :param year:
+        :param week:
+        :param position:
+        :param source: ranking source
+        :return: number of ranks written
+        """
+        records = list(records)
+        labels = []
+        for record in records:
+            labels.extend(label for label in record if label not in labels)
+        columns = [(label, [record.get(label) for record in records]) for label in labels
+                   if label != RANKS_PLAYER_COL and label not in RANKS_DROP_COLS]
+        with self.transaction():
+            return self._insert_ranks(year, week, position, source,
+                                      [record.get(RANKS_PLAYER_COL) for record in records], columns)
+
+    def import_stats(self, store, year):
+        """
+        Ingest every stats table of a season from a SeasonStore, in a single transaction
+        :param store: SeasonStore of scraped stats
+        :param year:
+        :return: number of rows written
+        """
+        n_rows = 0
+        with self.transaction():
+            for (week, position, _), df in store.read_partitions(year, columns=[STATS_PLAYER_COL, POINTS_COL]):
+                n_rows += self._insert_points(year, week, position, df[STATS_PLAYER_COL].tolist(),
+                                              df[POINTS_COL].tolist() if POINTS_COL in df else [None] * len(df))
+        return n_rows
+
+    def import_ranks(self, store, year):
+        """
+        Ingest every rankings table of a season from a SeasonStore, in a single transaction
+        :param store: SeasonStore of scraped rankings
+        :param year:
+        :return: number of ranks written
+        """
+        n_ranks = 0
+        with self.transaction():
+            for (week, position, source), df in store.read_partitions(year):
+                columns = [(label, df[label].tolist()) for label in df.columns
+                           if label != RANKS_PLAYER_COL and label not in RANKS_DROP_COLS]
+                n_ranks += self._insert_ranks(year, week, position, source, df[RANKS_PLAYER_COL].tolist(), columns)
+        return n_ranks
+
+    def get_stats(self, year, week, position):
+        """
+        Points of a week, shaped like driver.get_stats
+        :param year:
+        :param week:
+        :param position:
+        :return: Series of points indexed by player, named 'Week <week>'
+        """
+        with instrument.timer('db.stats'):
+            rows = self.connection.execute(
+                'SELECT players.name, points.points FROM points JOIN players ON players.id = points.player_id '
+                'WHERE points.year = ? AND points.week = ? AND points.position = ? ORDER BY points.row',
+                (int(year), int(week), position)).fetchall()
+        players = [name for name, _ in rows]
+        return pd.Series([_null_to_nan(value) for _, value in rows], index=pd.Index(players, name='Player'),
+                         name='Week %i' % int(week), dtype=float)
+
+    def get_points(self, year, weeks, position):
+        """
+        Points of several weeks from one query, shaped like the concatenation of driver.get_stats for each week
+        :param year:
+        :param weeks: list of weeks
+        :param position:
+        :return: DataFrame of points (players x 'Week <week>' columns)
+        """
+        weeks = [int(week) for week in weeks]
+        with instrument.timer('db.stats'):
+            frame = self.query(
+                'SELECT players.name AS Player, points.week AS week, points.points AS points FROM points '
+                'JOIN players ON players.id = points.player_id '
+                'WHERE points.year = ? AND points.position = ? AND points.week IN (%s) '
+                'ORDER BY points.week, points.row' % _placeholders(weeks),
+                [int(year), position] + weeks)
+        points = _pivot(frame, 'Player', 'week', 'points', weeks)
+        points.columns = ['Week %i' % week for week in weeks]
+        return points
+
+    def get_ranks(self, year, week, position, sources=None):
+        """
+        Expert rankings of a week, shaped like driver.get_ranks
+        :param year:
+        :param week:
+        :param position:
+        :param sources: source or collection of sources (all if None)
+        :return: DataFrame of ranks (players x experts), NaN for players an expert did not rank
+        """
+        where = 'rankings.year = ? AND rankings.week = ? AND rankings.position = ?'
+        params = [int(year), int(week), position]
+        if sources is not None:
+            sources = [int(source) for source in (sources if np.iterable(sources) else [sources])]
+            where += ' AND rankings.source IN (%s)' % _placeholders(sources)
+            params.extend(sources)
+        with instrument.timer('db.ranks'):
+            frame = self.query(
+                'SELECT players.name AS Player, experts.name AS Expert, rankings.rank AS rank FROM rankings '
+                'JOIN players ON players.id = rankings.player_id JOIN experts ON experts.id = rankings.expert_id '
+                'WHERE %s ORDER BY rankings.source, rankings.row, rankings.rowid' % where, params)
+        return _pivot(frame, 'Player', 'Expert', 'rank')
+
+    def expert_history(self, position, years, experts=None, weeks=None):
+        """
+        Ranks of experts over several seasons joined with the points of the ranked players, from one indexed query
+        :param position:
+        :param years: list of seasons
+        :param experts: list of expert names (all if None)
+        :param weeks: list of weeks (all if None)
+        :return: tidy DataFrame with Year, Week, Expert, Player, Rank and Points columns (NaN points for ranked
+            players without points)
+        """
+        years = list(years)
+        where = ['rankings.position = ?', 'rankings.year IN (%s)' % _placeholders(years)]
+        params = [position] + [int(year) for year in years]
+        if experts is not None:
+            experts = list(experts)
+            where.append('experts.name IN (%s)' % _placeholders(experts))
+            params.extend(experts)
+        if weeks is not None:
+            weeks = list(weeks)
+            where.append('rankings.week IN (%s)' % _placeholders(weeks))
+            params.extend(int(week) for week in weeks)
+        return self.query(
+            'SELECT rankings.year AS Year, rankings.week AS Week, experts.name AS Expert, players.name AS Player, '
+            'rankings.rank AS Rank, points.points AS Points FROM rankings '
+            'JOIN experts ON experts.id = rankings.expert_id JOIN players ON players.id = rankings.player_id '
+            'LEFT JOIN points ON points.year = rankings.year AND points.week = rankings.week '
+            'AND points.position = rankings.position AND points.player_id = rankings.player_id '
+            'WHERE %s ORDER BY rankings.year, rankings.week, experts.name, rankings.rank' % ' AND '.join(where),
+            params)
+
+    def query(self, sql, params=()):
+        """
+        Run a query
+        :param sql:
+        :param params: sequence of parameters
+        :return: DataFrame of the rows
+        """
+        return pd.read_sql_query(sql, self.connection, params=list(params))
+
+    def _insert_points(self, year, week, position, raw_players, values):
+        """
+        Replace the points of a (year, week, position), within the current transaction
+        :return: number of rows written
+        """
+        key = (int(year), int(week), position)
+        player_ids = self._player_ids(raw_players)
+        rows = [key + (player_id, row, _to_float(value))
+                for row, (player_id, value) in enumerate(zip(player_ids, values)) if player_id is not None]
+        self.connection.execute('DELETE FROM points WHERE year = ? AND week = ? AND position = ?', key)
+        self.connection.executemany('INSERT OR REPLACE INTO points (year, week, position, player_id, row, points) '
+                                    'VALUES (?, ?, ?, ?, ?, ?)', rows)
+        instrument.count('db.points', len(rows))
+        return len(rows)
+
+    def _insert_ranks(self, year, week, position, source, raw_players, columns):
+        """
+        Replace the ranks of a (year, week, position, source), within the current transaction
+        :param columns: list of (expert label, list of ranks) tuples
+        :return: number of ranks written
+        """
+        key = (int(year), int(week), position)
+        source = int(source)
+        player_ids = self._player_ids(raw_players)
+        expert_ids = self._intern('experts', [_strip_date_from_name(label) for label, _ in columns])
+        rows = []
+        # column by column, so that experts are inserted in the order of the table's columns
+        for expert_id, (_, ranks) in zip(expert_ids, columns):
+            for row, (player_id, rank) in enumerate(zip(player_ids, ranks)):
+                rank = _to_float(rank)
+                if player_id is not None and rank is not None:
+                    rows.append(key + (expert_id, player_id, source, row, rank))
+        self.connection.execute('DELETE FROM rankings WHERE year = ? AND week = ? AND position = ? AND source = ?',
+                                key + (source,))
+        self.connection.executemany('INSERT OR REPLACE INTO rankings '
+                                    '(year, week, position, expert_id, player_id, source, row, rank) '
+                                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        instrument.count('db.ranks', len(rows))
+        return len(rows)
+
+    def _player_ids(self, raw_players):
+        """
+        Player IDs of raw scraped player strings (None for missing strings)
+        :param raw_players: list of strings
+        :return: list
+        """
+        present = [i for i, raw in enumerate(raw_players) if isinstance(raw, basestring)]
+        names = self.registry.normalize(pd.Series([raw_players[i] for i in present], dtype=object)).tolist()
+        player_ids = [None] * len(raw_players)
+        for i, player_id in zip(present, self._intern('players', names)):
+            player_ids[i] = player_id
+        return player_ids
+
+    def _intern(self, table, names):
+        """
+        IDs of names in the players or experts table, inserting names not seen before
+        :param table: 'players' or 'experts'
+        :param names: list of names
+        :return: list of IDs
+        """
+        ids = self._ids.get(table)
+        if ids is None:
+            ids = self._ids[table] = dict(self.connection.execute('SELECT name, id FROM %s' % table))
+        for name in names:
+            if name not in ids:
+                ids[name] = self.connection.execute('INSERT INTO %s (name) VALUES (?)' % table, (name,)).lastrowid
+        return [ids[name] for name in names]
+
+
+def _pivot(frame, index, columns, values, columns_order=None):
+    """
+    Pivot a tidy frame, keeping index and column labels in order of first appearance (DataFrame.pivot sorts them)
+    :param frame:
+    :param index: column holding the index labels
+    :param columns: column holding the column labels
+    :param values: column holding the values
+    :param columns_order: column labels (defaults to those in frame)
+    :return:
+    """
+    rows, row_labels = pd.factorize(frame[index])
+    if columns_order is None:
+        cols, col_labels = pd.factorize(frame[columns])
+    else:
+        col_labels = pd.Index(columns_order)
+        cols = col_labels.get_indexer(frame[columns])
+    array = np.full((len(row_labels), len(col_labels)), np.nan)
+    array[rows, cols] = frame[values].values
+    return pd.DataFrame(array, index=pd.Index(row_labels, name=index), columns=list(col_labels))
+
+
+def _placeholders(values):
+    return ', '.join('?' * len(values))
+
+
+def _to_float(value):
+    """
+    Parse a scraped value, None if it is empty or not a number
+    :param value:
+    :return:
+    """
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if np.isnan(value) else value
+
+
+def _null_to_nan(value):
+    return np.nan if value is None else value
@@ -0,0 +1,210 @@
+""" Historical points of each position as memory-mapped (player x week) matrices with a JSON sidecar index """
+
+import copy
+import os
+import sys
+import ujson as json
+import numpy as np
+import pandas as pd
+from bisect import bisect_left, bisect_right
+
+
+class PointsHistory(object):
+
+    """
+    Weekly points of one position over many seasons, read lazily from a memory-mapped .npy matrix
+
+    The matrix holds one row per player and one column per (year, week), in chronological order, and is stored in
+    Fortran order so that every range of weeks is a contiguous block of the file.  The sidecar index
+    (<position>.json) lists the players and the (year, week) of each column.  Only the index is read when a
+    history is opened: points are paged in from the file as they are used, restricting a history to a range of
+    seasons or weeks (between) copies nothing, and pickling a history (e.g., to send it to a worker process)
+    sends only its location and range, so workers share the file through the page cache.
+    """
+
+    def __init__(self, directory, position, start=None, stop=None):
+        """
+        :param directory: directory holding the history files
+        :param position:
+        :param start: first year or (year, week) of the history (from the first week if None)
+        :param stop: last year or (year, week) of the history, inclusive (to the last week if None)
+        """
+        self.directory = directory
+        self.position = position
+        with open(self.index_path) as f:
+            index = json.loads(f.read())
+        self.players = index['players']
+        self.all_weeks = [tuple(week) for week in index['weeks']]
+        self.columns = slice(*_column_range(self.all_weeks, start, stop))
+        self.weeks = self.all_weeks[self.columns]
+        self._matrix = None
+
+    @property
+    def path(self):
+        return history_path(self.directory, self.position)
+
+    @property
+    def index_path(self):
+        return history_index_path(self.directory, self.position)
+
+    @property
+    def shape(self):
+        return len(self.players), len(self.weeks)
+
+    @property
+    def points(self):
+        """
+        Points of the history's weeks, a read-only view of the memory-mapped matrix (no points are read until used)
+        :return: array of shape (players, weeks)
+        """
+        if self._matrix is None:
+            self._matrix = np.load(self.path, mmap_mode='r')
+        return self._matrix[:, self.columns]
+
+    def between(self, start=None, stop=None):
+        """
+        History restricted to a range of seasons or weeks, without reading any points
+        :param start: first year or (year, week) (from the first week of this history if None)
+        :param stop: last year or (year, week), inclusive (to the last week of this history if None)
+        :return: PointsHistory
+        """
+        first, last = _column_range(self.all_weeks, start, stop)
+        # stay within this history's range
+        first = max(first, self.columns.start)
+        last = max(first, min(last, self.columns.stop))
+        history = copy.copy(self)
+        history.columns = slice(first, last)
+        history.weeks = self.all_weeks[first:last]
+        return history
+
+    def iter_blocks(self, n_weeks=17):
+        """
+        Points in consecutive blocks of weeks, e.g., to feed OnlineDifferenceScorer.partial_fit one block at a time
+        :param n_weeks: number of weeks in each block
+        :return: generator of arrays of shape (players, <= n_weeks)
+        """
+        points = self.points
+        for first in xrange(0, points.shape[1], n_weeks):
+            yield points[:, first:first + n_weeks]
+
+    def to_frame(self):
+        """
+        Points of the history's weeks in memory, indexed by player with '<year> Week <week>' columns
+        :return: DataFrame
+        """
+        return pd.DataFrame(np.array(self.points), index=pd.Index(self.players, name='Player'),
+                            columns=['%i Week %i' % week for week in self.weeks])
+
+    def __len__(self):
+        return len(self.weeks)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_matrix'] = None
+        return state
+
+
+def open_seasons(directory, position, first_year, last_year):
+    """
+    Points history of a range of seasons, checking that it holds every one of them
+    :param directory: directory holding the history files
+    :param position:
+    :param first_year:
+    :param last_year: inclusive
+    :return: PointsHistory
+    """
+    if not os.path.exists(history_index_path(directory, position)):
+        raise ValueError('No points history of %s in %s' % (position, directory))
+    history = PointsHistory(directory, position, first_year, last_year)
+    missing = sorted(set(xrange(first_year, last_year + 1)) - set(year for year, _ in history.weeks))
+    if missing:
+        raise ValueError('The points history of %s in %s lacks the seasons %s (of %i-%i)' % (
+            position, directory, ', '.join(str(year) for year in missing), first_year, last_year))
+    return history
+
+
+def history_path(directory, position):
+    return os.path.join(directory, '%s.npy' % position)
+
+
+def history_index_path(directory, position):
+    return os.path.join(directory, '%s.json' % position)
+
+
+def write_history(directory, position, points, players, weeks):
+    """
+    Write the points history of a position
+    :param directory: directory holding the history files (created if it does not exist)
+    :param position:
+    :param points: array of shape (players, weeks)
+    :param players: list of player names (one for each row)
+    :param weeks: list of (year, week) tuples in chronological order (one for each column)
+    :return: PointsHistory
+    """
+    points = np.asfortranarray(points, dtype=float)
+    if points.shape != (len(players), len(weeks)):
+        raise ValueError('points must have one row per player and one column per week')
+    weeks = [(int(year), int(week)) for year, week in weeks]
+    if weeks != sorted(weeks):
+        raise ValueError('weeks must be in chronological order')
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    path, index_path = history_path(directory, position), history_index_path(directory, position)
+    with open('%s.tmp' % path, 'wb') as f:
+        np.lib.format.write_array(f, points)
+    with open('%s.tmp' % index_path, 'w') as f:
+        f.write(json.dumps({'position': position, 'players': list(players), 'weeks': weeks}))
+    os.rename('%s.tmp' % path, path)
+    os.rename('%s.tmp' % index_path, index_path)
+    return PointsHistory(directory, position)
+
+
+def build_history(directory, positions, season_weeks, read_week):
+    """
+    Write the points history of each position from weekly points (e.g., driver.get_stats)
+    :param directory: directory holding the history files
+    :param positions: list of positions
+    :param season_weeks: list of (year, week) tuples
+    :param read_week: function of (year, week, position) returning a Series of points indexed by player
+    :return: dict mapping position to PointsHistory
+    """
+    season_weeks = sorted((int(year), int(week)) for year, week in season_weeks)
+    histories = {}
+    for position in positions:
+        rows = {}
+        columns = []
+        for year, week in season_weeks:
+            points = read_week(year, week, position)
+            player_rows = np.array([rows.setdefault(player, len(rows)) for player in points.index], dtype=int)
+            columns.append((player_rows, np.asarray(points.values, dtype=float)))
+        matrix = np.full((len(rows), len(columns)), np.nan, order='F')
+        for column, (player_rows, values) in enumerate(columns):
+            matrix[player_rows, column] = values
+        players = sorted(rows, key=rows.get)
+        histories[position] = write_history(directory, position, matrix, players, season_weeks)
+    return histories
+
+
+def _column_range(weeks, start, stop):
+    """
+    Columns of the weeks within a range
+    :param weeks: sorted list of (year, week) tuples
+    :param start: first year or (year, week) (from the first week if None)
+    :param stop: last year or (year, week), inclusive (to the last week if None)
+    :return: tuple (first column, end column)
+    """
+    first = 0 if start is None else bisect_left(weeks, _week_key(start, 0))
+    last = len(weeks) if stop is None else bisect_right(weeks, _week_key(stop, sys.maxint))
+    return first, max(first, last)
+
+
+def _week_key(value, default_week):
+    """
+    (year, week) of a range bound given as a year or a (year, week)
+    :param value:
+    :param default_week: week of a bound given as a year
+    :return: tuple
+    """
+    if isinstance(value, (tuple, list)):
+        return int(value[0]), int(value[1])
+    return int(value), default_week
@@ -0,0 +1,204 @@
+""" Lightweight timers and counters for the scrape, clean and score stages, with a summary report and profiling """
+
+import cProfile
+import functools
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+
+_lock = threading.Lock()
+# stage -> [calls, total seconds, max seconds]
+_timings = {}
+# name -> count
+_counters = {}
+
+
+class timer(object):
+
+    """
+    Time a stage, as a context manager (with timer('stage'): ...) or as a decorator (@timer('stage'))
+
+    Durations accumulate in the module registry (calls, total and max seconds per stage), which is thread-safe and
+    per process: use collect and merge to gather the timings of worker processes.
+    """
+
+    def __init__(self, stage):
+        """
+        :param stage: name of the stage
+        """
+        self.stage = stage
+        self.start = None
+        self.elapsed = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.elapsed = time.time() - self.start
+        record(self.stage, self.elapsed)
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def timed_func(*args, **kwargs):
+            with timer(self.stage):
+                return func(*args, **kwargs)
+        return timed_func
+
+
+def timed_method(func):
+    """
+    Decorator timing a method as the stage '<class name>.<method name>', so that subclasses are timed separately
+    :param func: method
+    :return:
+    """
+    @functools.wraps(func)
+    def timed_func(self, *args, **kwargs):
+        with timer('%s.%s' % (type(self).__name__, func.__name__)):
+            return func(self, *args, **kwargs)
+    return timed_func
+
+
+def record(stage, seconds, calls=1):
+    """
+    Add a duration to a stage
+    :param stage: name of the stage
+    :param seconds:
+    :param calls: number of calls the duration covers
+    :return:
+    """
+    with _lock:
+        timing = _timings.get(stage)
+        if timing is None:
+            _timings[stage] = [calls, seconds, seconds]
+        else:
+            timing[0] += calls
+            timing[1] += seconds
+            timing[2] = max(timing[2], seconds)
+
+
+def count(name, n=1):
+    """
+    Increment a counter
+    :param name: name of the counter
+    :param n: increment
+    :return:
+    """
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def reset():
+    """
+    Clear every timing and counter
+    :return:
+    """
+    with _lock:
+        _timings.clear()
+        _counters.clear()
+
+
+def collect():
+    """
+    Take the timings and counters recorded so far (e.g., to send them from a worker process) and reset them
+    :return: tuple (timings, counters)
+    """
+    with _lock:
+        snapshot = ({stage: list(timing) for stage, timing in _timings.iteritems()}, dict(_counters))
+        _timings.clear()
+        _counters.clear()
+    return snapshot
+
+
+def merge(snapshot):
+    """
+    Add timings and counters returned by collect
+    :param snapshot: tuple (timings, counters)
+    :return:
+    """
+    timings, counters = snapshot
+    with _lock:
+        for stage, (calls, total, longest) in timings.iteritems():
+            timing = _timings.setdefault(stage, [0, 0., 0.])
+            timing[0] += calls
+            timing[1] += total
+            timing[2] = max(timing[2], longest)
+        for name, n in counters.iteritems():
+            _counters[name] = _counters.get(name, 0) + n
+
+
+def report():
+    """
+    Summary of the timings (sorted by total time) and counters recorded so far
+    :return: string
+    """
+    with _lock:
+        timings = sorted(_timings.iteritems(), key=lambda item: -item[1][1])
+        counters = sorted(_counters.iteritems())
+    width = max([len(stage) for stage, _ in timings + counters] + [5])
+    lines = ['%-*s %8s %10s %10s %10s' % (width, 'stage', 'calls', 'total (s)', 'mean (ms)', 'max (ms)')]
+    for stage, (calls, total, longest) in timings:
+        lines.append('%-*s %8i %10.3f %10.2f %10.2f' % (width, stage, calls, total, 1000. * total / calls,
+                                                       1000. * longest))
+    if counters:
+        lines.append('')
+        lines.append('%-*s %8s' % (width, 'counter', 'count'))
+        for name, n in counters:
+            lines.append('%-*s %8i' % (width, name, n))
+    return '\n'.join(lines)
+
+
+@contextmanager
+def profile(path):
+    """
+    Profile a block with cProfile and dump the stats to path (readable with pstats)
+    :param path: file to dump the stats to
+    :return:
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+
+
+def print_profile(path, stream=None, sort='cumulative', limit=20):
+    """
+    Print the most expensive functions of a profile dumped by profile
+    :param path: file the stats were dumped to
+    :param stream: file to print to (defaults to stdout)
+    :param sort: pstats sort key
+    :param limit: number of functions printed
+    :return:
+    """
+    pstats.Stats(path, stream=stream).sort_stats(sort).print_stats(limit)
+
+
+class TimedReader(object):
+
+    """ File-like wrapper of a response handle that times reads and counts the bytes read """
+
+    def __init__(self, handle):
+        """
+        :param handle: object with a read method
+        """
+        self.handle = handle
+        self.elapsed = 0.
+        self.bytes = 0
+
+    def read(self, *args):
+        start = time.time()
+        data = self.handle.read(*args)
+        self.elapsed += time.time() - start
+        self.bytes += len(data)
+        return data
+
+    def close(self):
+        self.handle.close()
+
+    def __getattr__(self, name):
+        return getattr(self.handle, name)
@@ -0,0 +1,168 @@
+""" Manifest of scraped partitions, used to fetch only missing or stale (week, position, source) tables """
+
+import hashlib
+import os
+import time
+import ujson as json
+
+
+class Manifest(object):
+
+    """
+    Record of every scraped partition: when it was fetched, a hash of its records and its row count
+
+    For rankings, the manifest also remembers how many sources exist for each (year, week, position), so that
+    later runs can request exactly those sources instead of probing for the first empty one.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: json file holding the manifest (created by save if it does not exist)
+        """
+        self.path = path
+        self.partitions = {}
+        self.source_counts = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                manifest = json.loads(f.read())
+            self.partitions = manifest.get('partitions', {})
+            self.source_counts = manifest.get('source_counts', {})
+
+    def save(self):
+        """
+        Write the manifest to disk
+        :return:
+        """
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open('%s.tmp' % self.path, 'w') as f:
+            f.write(json.dumps({'partitions': self.partitions, 'source_counts': self.source_counts}))
+        os.rename('%s.tmp' % self.path, self.path)
+
+    def get(self, year, week, position, source=None):
+        """
+        Manifest entry of a partition
+        :param year:
+        :param week:
+        :param position:
+        :param source:
+        :return: dict with fetched, hash and rows (None if the partition was never scraped)
+        """
+        return self.partitions.get(_key(year, week, position, source))
+
+    def record(self, year, week, position, source, digest, rows):
+        """
+        Record a scraped partition
+        :param year:
+        :param week:
+        :param position:
+        :param source: ranking source (None for tables without one)
+        :param digest: content hash of the partition's records (see RecordDigest)
+        :param rows: number of records
+        :return: bool indicating whether the partition is new or its content changed
+        """
+        key = _key(year, week, position, source)
+        previous = self.partitions.get(key)
+        self.partitions[key] = {'fetched': time.time(), 'hash': digest, 'rows': rows}
+        return previous is None or previous['hash'] != digest
+
+    def source_count(self, year, week, position):
+        """
+        Known number of sources for a week and position
+        :param year:
+        :param week:
+        :param position:
+        :return: int (None if unknown)
+        """
+        return self.source_counts.get(_key(year, week, position)) or None
+
+    def set_source_count(self, year, week, position, count):
+        """
+        Remember the number of sources for a week and position (0 is not remembered, since sources for weeks
+        not yet played appear later)
+        :param year:
+        :param week:
+        :param position:
+        :param count:
+        :return:
+        """
+        key = _key(year, week, position)
+        if count > 0:
+            self.source_counts[key] = count
+        else:
+            self.source_counts.pop(key, None)
+
+    def is_stale(self, year, week, position, source=None, max_age=None):
+        """
+        Whether a partition needs to be fetched: it was never scraped, had no rows or is older than max_age
+        :param year:
+        :param week:
+        :param position:
+        :param source:
+        :param max_age: seconds after which a scraped partition is stale (None never)
+        :return:
+        """
+        entry = self.get(year, week, position, source)
+        if entry is None or not entry['rows']:
+            return True
+        return max_age is not None and time.time() - entry['fetched'] > max_age
+
+    def plan(self, year, weeks, positions, sources=None, refresh_weeks=(), max_age=None):
+        """
+        Partitions to fetch: those that are missing or stale, plus every partition of refresh_weeks.  With
+        sources, each (week, position) with a known source count plans only those sources; otherwise every
+        source is planned so that the count can be probed.
+        :param year:
+        :param weeks:
+        :param positions:
+        :param sources: candidate sources (None for tables without sources)
+        :param refresh_weeks: weeks to fetch even if already scraped (e.g. the week in progress)
+        :param max_age: seconds after which a scraped partition is stale (None never)
+        :return: list of (week, position, source) tuples, in week/position/source order
+        """
+        planned = []
+        for week in weeks:
+            for position in positions:
+                count = self.source_count(year, week, position) if sources is not None else None
+                if sources is None:
+                    candidates = [None]
+                elif count is None or week in refresh_weeks:
+                    candidates = list(sources)
+                else:
+                    candidates = [source for source in sources if source <= count]
+                for source in candidates:
+                    if week in refresh_weeks or self.is_stale(year, week, position, source, max_age):
+                        planned.append((week, position, source))
+        return planned
+
+
+class RecordDigest(object):
+
+    """ Pass-through iterator over records that computes their count and content hash as they are consumed """
+
+    def __init__(self, records):
+        """
+        :param records: iterable of dict records
+        """
+        self._records = records
+        self._hash = hashlib.sha1()
+        self.rows = 0
+
+    def __iter__(self):
+        for record in self._records:
+            self._hash.update(json.dumps(record, sort_keys=True))
+            self.rows += 1
+            yield record
+
+    @property
+    def hexdigest(self):
+        """
+        Hash of the records consumed so far
+        :return:
+        """
+        return self._hash.hexdigest()
+
+
+def _key(*parts):
+    return '/'.join('' if part is None else str(part) for part in parts)
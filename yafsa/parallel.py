@@ -0,0 +1,187 @@
+""" Concurrent scraping on top of TableScraper: bounded fetch concurrency, per-host rate limiting and retries """
+
+import httplib
+import socket
+import threading
+import time
+from contextlib import closing
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+from urllib2 import URLError, HTTPError
+from urlparse import urlparse
+from yafsa import instrument
+
+
+class TokenBucket(object):
+
+    """ Thread-safe token bucket allowing `rate` acquisitions per second with bursts of up to `capacity` """
+
+    def __init__(self, rate, capacity=1, clock=time.time, sleep=time.sleep):
+        """
+        :param rate: tokens added per second
+        :param capacity: maximum number of tokens held (burst size)
+        :param clock: function returning the current time in seconds
+        :param sleep: function sleeping for a number of seconds
+        """
+        if rate <= 0:
+            raise ValueError('rate must be positive')
+        self.rate = float(rate)
+        self.capacity = max(1, capacity)
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = float(self.capacity)
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take a token, blocking until one is available
+        :return: seconds spent waiting
+        """
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            # reserve the token now and sleep off any deficit outside the lock
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+
+class HostRateLimiter(object):
+
+    """ One token bucket per host """
+
+    def __init__(self, rate, capacity=1):
+        """
+        :param rate: requests per second allowed to each host
+        :param capacity: burst size for each host
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, url):
+        """
+        Block until a request to the host of url is allowed
+        :param url:
+        :return: seconds spent waiting
+        """
+        host = urlparse(url).netloc
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = self._buckets[host] = TokenBucket(self.rate, self.capacity)
+        return bucket.acquire()
+
+
+class ParallelScraper(object):
+
+    """ Scrape many tables with TableScraper, overlapping network waits while respecting per-host rate limits """
+
+    def __init__(self, scraper, max_workers=4, rate=1.0, burst=1, retries=3, backoff=1.0, parse_processes=None):
+        """
+        :param scraper: TableScraper used to parse pages
+        :param max_workers: maximum number of requests in flight
+        :param rate: requests per second allowed to each host
+        :param burst: number of requests that may be sent to a host at once
+        :param retries: number of times to retry a failed request
+        :param backoff: seconds to wait before the first retry, doubled for each subsequent retry
+        :param parse_processes: number of processes for parsing pages (defaults to the number of CPUs,
+            0 parses in the fetching threads)
+        """
+        self.scraper = scraper
+        self.max_workers = max(1, max_workers)
+        self.limiter = HostRateLimiter(rate, burst)
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.parse_processes = parse_processes
+        self._parse_pool = None
+
+    def scrape_tables(self, urls):
+        """
+        Scrape a table from each url
+        :param urls: list of urls
+        :return: list of lists of records, in the order of urls (None for urls that could not be scraped)
+        """
+        if self.parse_processes != 0:
+            self._parse_pool = Pool(self.parse_processes)
+        fetch_pool = ThreadPool(self.max_workers)
+        try:
+            return fetch_pool.map(self.scrape_table, urls, chunksize=1)
+        finally:
+            fetch_pool.close()
+            fetch_pool.join()
+            if self._parse_pool is not None:
+                self._parse_pool.close()
+                self._parse_pool.join()
+                self._parse_pool = None
+
+    def scrape_table(self, url):
+        """
+        Scrape table from url into list of records, one for each row (matches TableScraper.scrape_table)
+        :param url: string
+        :return:
+        """
+        try:
+            page = self.fetch(url)
+        except (URLError, ValueError):
+            print 'Could not open url: %s' % url
+            return None
+        with instrument.timer('scrape.parse'):
+            try:
+                if self._parse_pool is None:
+                    records = self.scraper.parse_page(page)
+                else:
+                    records, parse_instrumentation = self._parse_pool.apply(_parse_page, (self.scraper, page))
+                    # e.g., counts of records rejected by the scraper's schema
+                    instrument.merge(parse_instrumentation)
+            except ValueError:
+                print 'Could not read url: %s' % url
+                return None
+        instrument.count('scrape.tables')
+        instrument.count('scrape.bytes', len(page))
+        instrument.count('scrape.rows', len(records))
+        return records
+
+    def fetch(self, url):
+        """
+        Download a page, retrying with exponential backoff on network errors and server errors
+        :param url: string
+        :return: string of html
+        """
+        cache = self.scraper.cache
+        delay = self.backoff
+        for attempt in xrange(self.retries + 1):
+            # pages served from the cache do not count against the rate limit
+            if cache is None or not cache.is_fresh(url):
+                instrument.record('scrape.rate_limit', self.limiter.acquire(url))
+            try:
+                with instrument.timer('scrape.network'), closing(self.scraper.open(url)) as urlhandle:
+                    return urlhandle.read()
+            except HTTPError as e:
+                # client errors will not be fixed by retrying
+                if e.code < 500 or attempt == self.retries:
+                    raise
+            except URLError:
+                if attempt == self.retries:
+                    raise
+            except (socket.error, httplib.HTTPException) as e:
+                # e.g., socket.timeout while reading, or a connection dropped mid-response
+                if attempt == self.retries:
+                    raise URLError(e)
+            time.sleep(delay)
+            delay *= 2
+
+
+def _parse_page(scraper, page):
+    """
+    Parse a page in a worker process
+    :param scraper: TableScraper
+    :param page: string of html
+    :return: tuple (records, instrumentation recorded while parsing)
+    """
+    return scraper.parse_page(page), instrument.collect()
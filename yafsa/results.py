@@ -0,0 +1,317 @@
+""" SQLite store of expert scores with rollups (season totals, rolling windows) kept up to date as weeks are scored """
+
+import sqlite3
+import numpy as np
+import pandas as pd
+from yafsa import instrument
+
+
+# position of the rollups over every position
+ALL_POSITIONS = 'ALL'
+# metric of the composite ordering (sum of the metric orderings, lower is better)
+COMPOSITE = 'Composite'
+# sizes (in weeks) of the rolling windows of a new store
+DEFAULT_WINDOWS = (4, 8)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scores (
+    year INTEGER NOT NULL,
+    week INTEGER NOT NULL,
+    position TEXT NOT NULL,
+    expert TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    score REAL,
+    rank REAL,
+    PRIMARY KEY (year, week, position, expert, metric)
+);
+CREATE INDEX IF NOT EXISTS scores_position_metric_year ON scores (position, metric, year, week);
+CREATE TABLE IF NOT EXISTS season_totals (
+    year INTEGER NOT NULL,
+    position TEXT NOT NULL,
+    expert TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    weeks INTEGER NOT NULL,
+    score_total REAL,
+    score_squares REAL,
+    rank_total REAL,
+    PRIMARY KEY (position, metric, year, expert)
+);
+CREATE TABLE IF NOT EXISTS rolling_totals (
+    window_weeks INTEGER NOT NULL,
+    year INTEGER NOT NULL,
+    week INTEGER NOT NULL,
+    position TEXT NOT NULL,
+    expert TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    weeks INTEGER NOT NULL,
+    score_total REAL,
+    score_squares REAL,
+    rank_total REAL,
+    PRIMARY KEY (window_weeks, position, metric, year, week, expert)
+);
+CREATE TABLE IF NOT EXISTS windows (
+    window_weeks INTEGER PRIMARY KEY
+);
+"""
+
+# aggregates of the scores shared by the rollups
+TOTALS = 'COUNT(score), SUM(score), SUM(score * score), SUM(rank)'
+
+
+class ResultsStore(object):
+
+    """
+    Scores of every (year, week, position, expert, metric), with rollups for leaderboards
+
+    Each metric of a scored week is stored with the expert's score and position in the week's ordering by that
+    metric (the composite is stored with its sum of orderings as score and the resulting ordering as rank).  Two
+    rollups are maintained as weeks are recorded, for each position and for all positions together: season
+    totals of each expert, and totals over the last N scored weeks ending at each week (for each window N).  Only
+    the rollups touched by the recorded weeks are recomputed, and leaderboards read the rollups only.
+    """
+
+    def __init__(self, path, windows=None):
+        """
+        :param path: database file (created if it does not exist, ':memory:' for an in-memory database)
+        :param windows: sizes (in weeks) of the rolling windows maintained (the rolling totals are rebuilt if they
+            differ from the store's), the store's windows if None (DEFAULT_WINDOWS for a new store)
+        """
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+        self.windows = [window for window, in self.connection.execute('SELECT window_weeks FROM windows '
+                                                                      'ORDER BY window_weeks')]
+        if windows is None and not self.windows:
+            windows = DEFAULT_WINDOWS
+        if windows is not None and sorted(set(int(window) for window in windows)) != self.windows:
+            self.windows = sorted(set(int(window) for window in windows))
+            with self.connection:
+                self.connection.execute('DELETE FROM windows')
+                self.connection.executemany('INSERT INTO windows VALUES (?)', [(window,) for window in self.windows])
+            self.rebuild()
+
+    def close(self):
+        self.connection.close()
+
+    @instrument.timed_method
+    def record(self, results):
+        """
+        Add scored weeks, replacing every score recorded before for the same (year, week, position), and update the
+        rollups they touch, in a single transaction
+        :param results: tidy DataFrame of results (as returned by driver.score_season), with Year, Week, Position and
+            Expert columns, a column of orderings and a column of scores ('<metric>Score') for each metric, and a
+            Composite column
+        :return: number of scores recorded
+        """
+        rows = list(_score_rows(results))
+        keys = set((year, week, position) for year, week, position, _, _, _, _ in rows)
+        with self.connection:
+            # experts and metrics no longer scored in a rescored week are dropped along with the rest of it
+            self.connection.executemany('DELETE FROM scores WHERE year = ? AND week = ? AND position = ?', keys)
+            self.connection.executemany('INSERT INTO scores (year, week, position, expert, metric, score, rank) '
+                                        'VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+            self._update_rollups(keys)
+        instrument.count('results.scores', len(rows))
+        return len(rows)
+
+    def rebuild(self):
+        """
+        Recompute every rollup from the scores (e.g., after changing the windows)
+        :return:
+        """
+        with self.connection:
+            self.connection.execute('DELETE FROM season_totals')
+            self.connection.execute('DELETE FROM rolling_totals')
+            self._update_rollups(set(self.connection.execute('SELECT DISTINCT year, week, position FROM scores')))
+
+    def scores(self, position=None, metric=None, years=None, expert=None):
+        """
+        Recorded scores
+        :param position: position (all if None)
+        :param metric: metric (all if None)
+        :param years: list of seasons (all if None)
+        :param expert: expert (all if None)
+        :return: tidy DataFrame with year, week, position, expert, metric, score and rank columns
+        """
+        where, params = _conditions(position=position, metric=metric, expert=expert, years=years)
+        return pd.read_sql_query('SELECT * FROM scores%s ORDER BY year, week, position, metric, rank' % where,
+                                 self.connection, params=params)
+
+    def seasons(self):
+        """
+        Seasons with recorded scores
+        :return: sorted list of years
+        """
+        return [year for year, in self.connection.execute('SELECT DISTINCT year FROM scores ORDER BY year')]
+
+    def leaderboard(self, metric=COMPOSITE, position=None, years=None, last_seasons=None, window=None, by='score',
+                    min_weeks=1, limit=None):
+        """
+        Experts ordered by their mean score (or mean ordering) over seasons or over a rolling window, read from
+        the rollups
+        :param metric: metric to order experts by
+        :param position: position (all positions together if None)
+        :param years: list of seasons (all if None)
+        :param last_seasons: use only the last N seasons with recorded scores (instead of years)
+        :param window: use the totals of the last window weeks (one of the store's windows) instead of seasons
+        :param by: 'score' to order by mean score, 'rank' by mean position in the weekly orderings
+        :param min_weeks: leave out experts scored in fewer weeks
+        :param limit: number of experts returned (all if None)
+        :return: DataFrame indexed by expert with Weeks, MeanScore, StdScore and MeanRank columns, best first
+        """
+        if by not in ('score', 'rank'):
+            raise ValueError("by must be 'score' or 'rank'")
+        position = position or ALL_POSITIONS
+        if window is not None:
+            if window not in self.windows:
+                raise ValueError('window must be one of %s' % self.windows)
+            # totals of the window ending with the last scored week
+            last = self.connection.execute(
+                'SELECT year, week FROM rolling_totals WHERE window_weeks = ? AND position = ? AND metric = ? '
+                'ORDER BY year DESC, week DESC LIMIT 1', (window, position, metric)).fetchone()
+            if last is None:
+                return _leaderboard(pd.DataFrame(columns=['expert', 'weeks', 'score_total', 'score_squares',
+                                                          'rank_total']), metric, by, min_weeks, limit)
+            totals = pd.read_sql_query(
+                'SELECT expert, weeks, score_total, score_squares, rank_total FROM rolling_totals '
+                'WHERE window_weeks = ? AND position = ? AND metric = ? AND year = ? AND week = ?', self.connection,
+                params=[window, position, metric, last[0], last[1]])
+        else:
+            if last_seasons is not None:
+                years = self.seasons()[-int(last_seasons):]
+            where, params = _conditions(position=position, metric=metric, years=years)
+            totals = pd.read_sql_query(
+                'SELECT expert, SUM(weeks) AS weeks, SUM(score_total) AS score_total, '
+                'SUM(score_squares) AS score_squares, SUM(rank_total) AS rank_total FROM season_totals%s '
+                'GROUP BY expert' % where, self.connection, params=params)
+        return _leaderboard(totals, metric, by, min_weeks, limit)
+
+    def _update_rollups(self, keys):
+        """
+        Recompute the rollups touched by scored weeks, within the current transaction
+        :param keys: set of (year, week, position) of the scored weeks
+        :return:
+        """
+        for year, position in set((year, position) for year, _, position in keys):
+            self.connection.execute('DELETE FROM season_totals WHERE year = ? AND position = ?', (year, position))
+            self.connection.execute(
+                'INSERT INTO season_totals SELECT year, position, expert, metric, %s FROM scores '
+                'WHERE year = ? AND position = ? GROUP BY expert, metric' % TOTALS, (year, position))
+        for year in set(year for year, _, _ in keys):
+            self.connection.execute('DELETE FROM season_totals WHERE year = ? AND position = ?',
+                                    (year, ALL_POSITIONS))
+            self.connection.execute(
+                'INSERT INTO season_totals SELECT year, ?, expert, metric, %s FROM scores WHERE year = ? '
+                'GROUP BY expert, metric' % TOTALS, (ALL_POSITIONS, year))
+
+        weeks_by_position = {}
+        for year, week, position in keys:
+            weeks_by_position.setdefault(position, set()).add((year, week))
+            weeks_by_position.setdefault(ALL_POSITIONS, set()).add((year, week))
+        for position, scored_weeks in weeks_by_position.iteritems():
+            where, params = _conditions(position=None if position == ALL_POSITIONS else position)
+            all_weeks = list(self.connection.execute('SELECT DISTINCT year, week FROM scores%s ORDER BY year, week'
+                                                     % where, params))
+            for window in self.windows:
+                for end in _affected_window_ends(all_weeks, scored_weeks, window):
+                    self._update_window(position, window, all_weeks[max(0, end - window + 1)], all_weeks[end])
+
+    def _update_window(self, position, window, first, last):
+        """
+        Recompute the totals of a window of weeks
+        :param position: position (or ALL_POSITIONS)
+        :param window: window size
+        :param first: (year, week) of the first week of the window
+        :param last: (year, week) of the last week of the window
+        :return:
+        """
+        where = ' AND position = ?' if position != ALL_POSITIONS else ''
+        params = [position] if position != ALL_POSITIONS else []
+        self.connection.execute('DELETE FROM rolling_totals WHERE window_weeks = ? AND position = ? AND year = ? '
+                                'AND week = ?', (window, position) + tuple(last))
+        self.connection.execute(
+            'INSERT INTO rolling_totals SELECT ?, ?, ?, ?, expert, metric, %s FROM scores '
+            'WHERE year * 100 + week BETWEEN ? AND ?%s GROUP BY expert, metric' % (TOTALS, where),
+            [window, last[0], last[1], position, first[0] * 100 + first[1], last[0] * 100 + last[1]] + params)
+
+
+def _score_rows(results):
+    """
+    Rows of the scores table from a tidy DataFrame of results
+    :param results:
+    :return: generator of (year, week, position, expert, metric, score, rank) tuples
+    """
+    metrics = [column[:-len('Score')] for column in results.columns
+               if column.endswith('Score') and column[:-len('Score')] in results.columns]
+    keys = ['Year', 'Week', 'Position']
+    composite_ranks = results.groupby(keys)[COMPOSITE].rank(method='min') if COMPOSITE in results else None
+    for i, row in enumerate(results.itertuples(index=False)):
+        row = dict(zip(results.columns, row))
+        key = (int(row['Year']), int(row['Week']), row['Position'], row['Expert'])
+        for metric in metrics:
+            yield key + (metric, _float_or_none(row['%sScore' % metric]), _float_or_none(row[metric]))
+        if composite_ranks is not None:
+            yield key + (COMPOSITE, _float_or_none(row[COMPOSITE]), _float_or_none(composite_ranks.iloc[i]))
+
+
+def _affected_window_ends(all_weeks, scored_weeks, window):
+    """
+    Indices of the weeks whose window (of the last window weeks) contains a scored week
+    :param all_weeks: sorted list of (year, week) with scores
+    :param scored_weeks: set of (year, week) just scored
+    :param window:
+    :return: sorted list of indices into all_weeks
+    """
+    ends = set()
+    for index, week in enumerate(all_weeks):
+        if week in scored_weeks:
+            ends.update(xrange(index, min(index + window, len(all_weeks))))
+    return sorted(ends)
+
+
+def _leaderboard(totals, metric, by, min_weeks, limit):
+    """
+    Order experts by their mean score or mean ordering from totals
+    :return: DataFrame indexed by expert
+    """
+    weeks = totals['weeks'].astype(float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = totals['score_total'].astype(float) / weeks
+        std = np.sqrt(np.maximum(totals['score_squares'].astype(float) / weeks - mean ** 2, 0))
+        mean_rank = totals['rank_total'].astype(float) / weeks
+    board = pd.DataFrame({'Weeks': totals['weeks'].astype(int).values, 'MeanScore': mean.values,
+                          'StdScore': std.values, 'MeanRank': mean_rank.values},
+                         index=pd.Index(totals['expert'].values, name='Expert'),
+                         columns=['Weeks', 'MeanScore', 'StdScore', 'MeanRank'])
+    board = board[board['Weeks'] >= min_weeks]
+    # orderings are better low, and so is the composite score (a sum of orderings)
+    if by == 'rank':
+        board = board.sort_values(['MeanRank', 'MeanScore'], ascending=[True, metric == COMPOSITE])
+    else:
+        board = board.sort_values(['MeanScore', 'MeanRank'], ascending=[metric == COMPOSITE, True])
+    return board if limit is None else board.iloc[:limit]
+
+
+def _conditions(position=None, metric=None, expert=None, years=None):
+    """
+    WHERE clause and parameters for the given filters (None matches everything)
+    :return: tuple (clause, list of parameters)
+    """
+    clauses, params = [], []
+    for column, value in (('position', position), ('metric', metric), ('expert', expert)):
+        if value is not None:
+            clauses.append('%s = ?' % column)
+            params.append(value)
+    if years is not None:
+        years = [int(year) for year in years]
+        clauses.append('year IN (%s)' % ', '.join('?' * len(years)))
+        params.extend(years)
+    return (' WHERE %s' % ' AND '.join(clauses) if clauses else ''), params
+
+
+def _float_or_none(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if np.isnan(value) else value
@@ -0,0 +1,194 @@
+""" Declarative schemas of scraped tables, applied to records as they are scraped """
+
+import re
+from collections import OrderedDict
+from yafsa import instrument
+from yafsa.clean import _strip_date_from_name, normalize_player_name
+
+
+# numbers as they appear in scraped cells (thousands separators allowed)
+INTEGER_RE = re.compile(r'^[+-]?\d[\d,]*$')
+NUMBER_RE = re.compile(r'^[+-]?(?:\d[\d,]*(?:\.\d*)?|\.\d+)$')
+
+
+class SchemaError(ValueError):
+
+    """ Raised for a scraped record that does not conform to its table schema """
+
+    def __init__(self, reason, message):
+        """
+        :param reason: short name of the kind of error (counted by TableSchema.apply)
+        :param message:
+        """
+        super(SchemaError, self).__init__(message)
+        self.reason = reason
+
+    def __reduce__(self):
+        # pickled with both arguments, e.g., when raised while parsing a page in a worker process
+        return SchemaError, (self.reason, self.args[0])
+
+
+def parse_number(value):
+    """
+    Parse a scraped cell into a number
+    :param value: string (or number, returned as is)
+    :return: int or float, None for an empty cell
+    """
+    if value is None or isinstance(value, (int, long, float)):
+        return value
+    value = value.strip()
+    if not value:
+        return None
+    if INTEGER_RE.match(value):
+        return int(value.replace(',', ''))
+    if NUMBER_RE.match(value):
+        return float(value.replace(',', ''))
+    raise SchemaError('number', 'Not a number: %r' % value)
+
+
+def parse_text(value):
+    """
+    Parse a scraped cell into text
+    :param value:
+    :return: stripped string, None for an empty cell
+    """
+    if value is None:
+        return None
+    return value.strip() or None
+
+
+class TableSchema(object):
+
+    """
+    Schema of a scraped table: which columns are kept, how headers are normalized and how cells are parsed
+
+    Headers are normalized (e.g., trailing dates stripped) and columns are selected once for each distinct header,
+    so applying a schema costs a parse of the kept cells of each row.  Rows whose player is missing, or whose
+    required columns are missing or do not parse, are rejected; other cells that do not parse (e.g., 'NR' in an
+    expert's column) are kept as None.  Both are counted by reason (see errors and the 'schema.*' instrumentation
+    counters, 'cell_<reason>' for cells).
+    """
+
+    def __init__(self, name, player, columns=None, drop=None, parser=parse_number, required=None,
+                 normalize_header=_strip_date_from_name, normalize_player=normalize_player_name):
+        """
+        :param name: name of the schema (used in counter names)
+        :param player: label of the player column (always kept, under the same label)
+        :param columns: dict mapping the normalized label of each kept column to its parser, or None to keep every
+            column not in drop and parse it with parser
+        :param drop: normalized labels of columns dropped when columns is None
+        :param parser: parser of the columns kept when columns is None
+        :param required: normalized labels of columns a record must have a value for (defaults to every column of
+            columns, none when columns is None)
+        :param normalize_header: function normalizing a raw column label (None keeps labels as scraped)
+        :param normalize_player: function normalizing a raw player string (None keeps players as scraped)
+        """
+        self.name = name
+        self.player = player
+        self.columns = columns
+        self.drop = set(drop or [])
+        self.parser = parser
+        self.required = set(required if required is not None else (columns or {}))
+        self.normalize_header = normalize_header
+        self.normalize_player = normalize_player
+        self.errors = {}
+        # tuple of raw labels -> list of (raw label, normalized label, parser)
+        self._projections = {}
+
+    def __getstate__(self):
+        """
+        Pickle without the projections (e.g., to parse pages in worker processes)
+        :return:
+        """
+        state = self.__dict__.copy()
+        state['_projections'] = {}
+        return state
+
+    def projection(self, labels):
+        """
+        Kept columns of a table with the given raw labels
+        :param labels: iterable of raw column labels
+        :return: list of (raw label, normalized label, parser) tuples; when several raw labels normalize to the same
+            label, the last of them is kept
+        """
+        labels = tuple(labels)
+        projection = self._projections.get(labels)
+        if projection is None:
+            kept = OrderedDict()
+            for label in labels:
+                if label == self.player:
+                    continue
+                normalized = self.normalize_header(label) if self.normalize_header else label
+                if self.columns is not None:
+                    parser = self.columns.get(normalized)
+                else:
+                    parser = self.parser if normalized not in self.drop else None
+                if parser is not None:
+                    kept.pop(normalized, None)
+                    kept[normalized] = (label, normalized, parser)
+            projection = self._projections[labels] = kept.values()
+        return projection
+
+    def parse_record(self, record):
+        """
+        Normalize, project and parse a scraped record
+        :param record: dict mapping raw column label to cell text
+        :return: dict mapping normalized label to parsed value (None for a cell of a column that is not required
+            that does not parse, counted as 'cell_<reason>')
+        """
+        player = parse_text(record.get(self.player))
+        if player is None:
+            raise SchemaError('player', 'Record without a player')
+        parsed = {self.player: self.normalize_player(player) if self.normalize_player else player}
+        for label, normalized, parser in self.projection(record):
+            try:
+                parsed[normalized] = parser(record[label])
+            except SchemaError as e:
+                if normalized in self.required:
+                    raise
+                parsed[normalized] = None
+                self._count('cell_%s' % e.reason)
+        for label in self.required:
+            if parsed.get(label) is None:
+                raise SchemaError('missing', 'Record without %s' % label)
+        return parsed
+
+    def apply(self, records):
+        """
+        Parse records, leaving out (and counting) the records that do not conform
+        :param records: iterable of scraped records
+        :return: generator of parsed records, raising SchemaError at the end of a table whose every record was
+            rejected (a table that no longer matches the schema rather than an empty one)
+        """
+        rows = rejected = 0
+        try:
+            for record in records:
+                try:
+                    parsed = self.parse_record(record)
+                except SchemaError as e:
+                    rejected += 1
+                    instrument.count('schema.%s.rejected' % self.name)
+                    self._count(e.reason)
+                    continue
+                rows += 1
+                yield parsed
+        finally:
+            instrument.count('schema.%s.rows' % self.name, rows)
+        if rejected and not rows:
+            raise SchemaError('table', 'Every record of the table was rejected (%i records)' % rejected)
+
+    def _count(self, reason):
+        """
+        Count an error in errors and in the instrumentation registry
+        :param reason: SchemaError reason
+        :return:
+        """
+        self.errors[reason] = self.errors.get(reason, 0) + 1
+        instrument.count('schema.%s.%s' % (self.name, reason))
+
+
+# fantasypros staff rankings: one column of ranks for each expert (empty for players (s)he did not rank)
+RANKINGS_SCHEMA = TableSchema('rankings', 'Player (matchup)', drop=['Rank', 'FantasyProsAll Experts'])
+
+# thehuddle weekly stats: only fantasy points are used
+STATS_SCHEMA = TableSchema('stats', 'PLAYER', columns={'FPTS': parse_number})
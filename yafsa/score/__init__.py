@@ -1 +1,7 @@
-from metrics import DCGScorer, DifferenceScorer
\ No newline at end of file
+from metrics import DCGScorer, DifferenceScorer, OnlineDifferenceScorer
+from batch import BatchDCGScorer
+from fit_cache import FitCache
+from ordering import AveragePrecisionScorer, FootruleScorer, KendallTauScorer, PrecisionScorer, RBOScorer
+from resample import Resampler
+from aggregate import consensus_frames, consensus_ranks, historical_weights
+from sweep import composite_curves, dcg_curves, difference_curves, ordering_changes
\ No newline at end of file
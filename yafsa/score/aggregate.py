@@ -0,0 +1,224 @@
+""" Consensus rankings aggregated from expert rankings: Borda count, median rank and a Markov chain method """
+
+import numpy as np
+import pandas as pd
+
+from batch import players_index, stack_ranks
+
+
+def list_positions(rank_array):
+    """
+    Position (1 for the first player) of each player in each expert's list, NaN for players an expert did not rank
+    :param rank_array: array of ranks with players along the first axis (e.g., players x experts x weeks)
+    :return: tuple (array of positions, array of list lengths with the shape of the trailing axes)
+    """
+    ranked = ~np.isnan(rank_array)
+    order = np.argsort(np.where(ranked, rank_array, np.inf), axis=0, kind='mergesort')
+    positions = np.empty(rank_array.shape)
+    positions[players_index(order, rank_array.shape[1:])] = _along_players(np.arange(1., rank_array.shape[0] + 1),
+                                                                           rank_array.ndim)
+    positions[~ranked] = np.nan
+    return positions, ranked.sum(axis=0)
+
+
+def expert_weights(rank_array, weights=None):
+    """
+    Weight of each expert list, zero for lists without any ranked player
+    :param rank_array: array of ranks (players x experts x ...)
+    :param weights: weights broadcastable to the trailing axes of rank_array, e.g., one for each expert (as a column
+        for trailing week axes) or one for each expert and week (equal weights if None)
+    :return: array with the shape of the trailing axes of rank_array
+    """
+    weights = 1. if weights is None else np.asarray(weights, dtype=float)
+    return np.where(np.any(~np.isnan(rank_array), axis=0), weights, 0.)
+
+
+def borda(rank_array, weights=None):
+    """
+    Borda count: each expert awards (m - p + 1) / m points to the player at position p of a list of m players and no
+    points to players outside the list, so that experts ranking more players do not carry more weight
+    :param rank_array: array of ranks (players x experts x ...)
+    :param weights: expert weights broadcastable to the trailing axes of rank_array (equal weights if None)
+    :return: array of (weighted) points (players x ...), higher is better
+    """
+    positions, lengths = list_positions(rank_array)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        points = np.where(np.isnan(positions), 0., (lengths - positions + 1) / lengths)
+    return (points * expert_weights(rank_array, weights)).sum(axis=1)
+
+
+def median_rank(rank_array, weights=None):
+    """
+    (Weighted, lower) median of each player's positions, a player outside an expert's list of m players being
+    placed at m + 1
+    :param rank_array: array of ranks (players x experts x ...)
+    :param weights: expert weights broadcastable to the trailing axes of rank_array (equal weights if None)
+    :return: array of median positions (players x ...), lower is better
+    """
+    positions, lengths = list_positions(rank_array)
+    positions = np.where(np.isnan(positions), lengths + 1, positions)
+    weights = np.broadcast_to(expert_weights(rank_array, weights), positions.shape)
+    order = np.argsort(positions, axis=1, kind='mergesort')
+    cumulative = np.cumsum(_take_along_experts(weights, order), axis=1)
+    # first expert (in order of position) at which half of the weight is reached
+    median = np.argmax(cumulative >= cumulative[:, -1:] / 2., axis=1)[:, None]
+    return _take_along_experts(_take_along_experts(positions, order), median)[:, 0]
+
+
+def markov_chain(rank_array, weights=None, damping=0.85, tol=1e-10, max_iter=500):
+    """
+    Stationary distribution of the MC4 Markov chain (Dwork et al., Rank aggregation methods for the web): from a
+    player, pick a player uniformly and move there if a (weighted) majority of the experts that distinguish the two
+    players prefer it.  With probability 1 - damping the walk jumps to a random player instead, which makes the
+    stationary distribution unique.  Only players ranked by at least one expert are states of the chain.
+    :param rank_array: array of ranks (players x experts x ...)
+    :param weights: expert weights broadcastable to the trailing axes of rank_array (equal weights if None)
+    :param damping: probability of following the majority walk rather than jumping to a random player
+    :param tol: largest change of any probability at convergence
+    :param max_iter: maximum number of power iterations
+    :return: array of stationary probabilities (players x ...), higher is better
+    """
+    n_players, n_experts = rank_array.shape[:2]
+    batch_shape = rank_array.shape[2:]
+    positions, lengths = list_positions(rank_array)
+    positions = np.where(np.isnan(positions), lengths + 1, positions)
+    # batch (e.g., weeks) first: positions (batch x experts x players), weights (batch x experts)
+    positions = positions.reshape((n_players, n_experts, -1)).transpose(2, 1, 0)
+    weights = expert_weights(rank_array, weights).reshape((n_experts, -1)).T
+    candidates = np.any(~np.isnan(rank_array), axis=1).reshape((n_players, -1)).T
+    n_candidates = np.maximum(candidates.sum(axis=1), 1)[:, None]
+
+    # weighted votes preferring player j to player i, and weighted votes of experts distinguishing the two
+    prefer = np.zeros((positions.shape[0], n_players, n_players))
+    distinguish = np.zeros(prefer.shape)
+    for expert in xrange(n_experts):
+        expert_positions = positions[:, expert, :]
+        expert_weight = weights[:, expert, None, None]
+        prefer += expert_weight * (expert_positions[:, None, :] < expert_positions[:, :, None])
+        distinguish += expert_weight * (expert_positions[:, None, :] != expert_positions[:, :, None])
+
+    pairs = candidates[:, :, None] & candidates[:, None, :]
+    moves = np.where(pairs & (2 * prefer > distinguish), 1. / n_candidates[:, :, None], 0.)
+    diagonal = np.arange(n_players)
+    moves[:, diagonal, diagonal] = np.where(candidates, 1. - moves.sum(axis=2), 0.)
+    jumps = np.where(pairs, 1. / n_candidates[:, :, None], 0.)
+    transitions = damping * moves + (1 - damping) * jumps
+
+    probabilities = np.where(candidates, 1., 0.) / n_candidates
+    for _ in xrange(max_iter):
+        updated = np.einsum('bi,bij->bj', probabilities, transitions)
+        converged = np.abs(updated - probabilities).max() < tol
+        probabilities = updated
+        if converged:
+            break
+    return probabilities.T.reshape((n_players,) + batch_shape)
+
+
+# consensus methods: name -> (function, whether higher values are better)
+METHODS = {
+    'Borda': (borda, True),
+    'Median': (median_rank, False),
+    'Markov': (markov_chain, True),
+}
+
+
+def consensus_ranks(rank_array, method='Borda', weights=None):
+    """
+    Consensus ranking (1 for the first player) of the players ranked by at least one expert
+    :param rank_array: array of ranks (players x experts x ...)
+    :param method: key of METHODS
+    :param weights: expert weights broadcastable to the trailing axes of rank_array (equal weights if None)
+    :return: array of ranks (players x ...), NaN for players no expert ranked; ties are broken by player order
+    """
+    func, higher_is_better = METHODS[method]
+    values = func(rank_array, weights)
+    candidates = np.any(~np.isnan(rank_array), axis=1)
+    keys = np.where(candidates, -values if higher_is_better else values, np.inf)
+    order = np.argsort(keys, axis=0, kind='mergesort')
+    ranks = np.empty(keys.shape)
+    ranks[players_index(order, keys.shape[1:])] = _along_players(np.arange(1., keys.shape[0] + 1), keys.ndim)
+    ranks[~candidates] = np.nan
+    return ranks
+
+
+def historical_weights(scores, temperature=1.):
+    """
+    Expert weights learned from past scores (e.g., weekly DCG or Diff, higher is better): the weight of an expert
+    for a week is exp(z / temperature), z being the standardized mean score of the expert over the previous weeks,
+    so that no week is weighted with its own scores.  Experts without previous scores get the weight of an average
+    expert (1).
+    :param scores: DataFrame (or array) of scores (experts x weeks, in chronological order), NaN if not scored
+    :param temperature: larger temperatures flatten the weights towards equal weights
+    :return: weights of the same type and shape as scores
+    """
+    values = np.asarray(scores, dtype=float)
+    scored = ~np.isnan(values)
+    totals = np.cumsum(np.where(scored, values, 0.), axis=1)
+    counts = np.cumsum(scored, axis=1)
+    # mean over the weeks before each week
+    totals = np.hstack([np.zeros((values.shape[0], 1)), totals[:, :-1]])
+    counts = np.hstack([np.zeros((values.shape[0], 1)), counts[:, :-1]])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = totals / counts
+        has_history = counts > 0
+        center = _nanmean(means, has_history)
+        spread = np.sqrt(_nanmean((means - center) ** 2, has_history))
+        z = np.where(has_history & (spread > 0), (means - center) / spread, 0.)
+    weights = np.exp(z / temperature)
+    if isinstance(scores, pd.DataFrame):
+        return pd.DataFrame(weights, index=scores.index, columns=scores.columns)
+    return weights
+
+
+def consensus_frames(ranks_by_week, methods=('Borda',), weights=None, prefix='Consensus'):
+    """
+    Consensus rankings of every week of a position at once
+    :param ranks_by_week: dict mapping week label to DataFrame of ranks (players x experts)
+    :param methods: keys of METHODS
+    :param weights: DataFrame of expert weights (experts x week labels, e.g., from historical_weights) or Series of
+        weights indexed by expert (equal weights if None); experts without a weight get 1
+    :param prefix: prefix of the consensus column labels
+    :return: dict mapping week label to DataFrame of consensus ranks (players ranked that week x methods)
+    """
+    players = pd.Index([])
+    for ranks in ranks_by_week.values():
+        players = players.append(ranks.index[~ranks.index.isin(players)])
+    rank_array, _, experts, weeks = stack_ranks(ranks_by_week, players)
+    if isinstance(weights, pd.DataFrame):
+        weights = weights.reindex(index=experts, columns=weeks).fillna(1.).values
+    elif weights is not None:
+        weights = weights.reindex(experts).fillna(1.).values[:, None]
+
+    consensus = {method: consensus_ranks(rank_array, method, weights) for method in methods}
+    frames = {}
+    for w, week in enumerate(weeks):
+        frame = pd.DataFrame({'%s%s' % (prefix, method): consensus[method][:, w] for method in methods},
+                             index=players, columns=['%s%s' % (prefix, method) for method in methods])
+        frames[week] = frame.reindex(ranks_by_week[week].index)
+    return frames
+
+
+def _along_players(values, ndim):
+    return values.reshape((-1,) + (1,) * (ndim - 1))
+
+
+def _take_along_experts(values, order):
+    """
+    Gather values (players x experts x ...) along the experts axis by order (players x k x ...)
+    :param values:
+    :param order:
+    :return:
+    """
+    index = list(np.ix_(*[np.arange(n) for n in order.shape]))
+    index[1] = order
+    return values[tuple(index)]
+
+
+def _nanmean(values, valid):
+    """
+    Mean of the valid entries of each column
+    :param values: 2-d array
+    :param valid: boolean array marking the entries averaged
+    :return: array of shape (1, columns)
+    """
+    return np.where(valid, values, 0.).sum(axis=0, keepdims=True) / np.maximum(valid.sum(axis=0, keepdims=True), 1)
@@ -0,0 +1,189 @@
+""" Batched ranking metrics: score every expert for every week in one pass over aligned arrays """
+
+import numpy as np
+import pandas as pd
+
+from yafsa import instrument
+from metrics import TOP_K_MIN_RATIO, DCGScorer, discount_table
+
+
+def stack_ranks(ranks_by_week, players):
+    """
+    Align weekly rank DataFrames into a single (player x expert x week) array
+    :param ranks_by_week: dict mapping week label to DataFrame of ranks (players x experts)
+    :param players: index of players to align to (players missing from it are dropped)
+    :return: tuple (rank_array, position_array, experts, weeks) where position_array holds each player's
+        position in that week's rank DataFrame (-1 if the player is absent)
+    """
+    weeks = list(ranks_by_week.keys())
+    experts = []
+    for week in weeks:
+        experts.extend(col for col in ranks_by_week[week].columns if col not in experts)
+
+    n_players, n_experts, n_weeks = len(players), len(experts), len(weeks)
+    rank_array = np.full((n_players, n_experts, n_weeks), np.nan)
+    position_array = np.full((n_players, n_weeks), -1, dtype=int)
+
+    for w, week in enumerate(weeks):
+        ranks = ranks_by_week[week]
+        # row of each ranked player in the players index
+        rows = players.get_indexer(ranks.index)
+        in_players = rows >= 0
+        rows = rows[in_players]
+        position_array[rows, w] = np.arange(ranks.shape[0])[in_players]
+        cols = [experts.index(col) for col in ranks.columns]
+        rank_array[rows[:, None], np.array(cols)[None, :], w] = ranks.values[in_players].astype(float)
+
+    return rank_array, position_array, pd.Index(experts), pd.Index(weeks)
+
+
+def rank_order_keys(rank_array, valid, position_array=None):
+    """
+    Build sort keys reproducing BaseScorer.sort_points_by_rank: players are ordered by rank, unranked players
+    follow in the order they appear in the rank data, and invalid entries (no points or absent) sort last
+    :param rank_array: array of ranks with players along the first axis
+    :param valid: boolean array (broadcastable to rank_array) marking entries with points that can be scored
+    :param position_array: array (broadcastable to rank_array) of each player's original position, used to
+        break ties; defaults to the player's row
+    :return: float array of keys; invalid entries are np.inf
+    """
+    n_players = rank_array.shape[0]
+    if position_array is None:
+        position_array = np.arange(n_players).reshape((-1,) + (1,) * (rank_array.ndim - 1))
+    ranked = ~np.isnan(rank_array)
+    max_rank = np.nanmax(rank_array) if ranked.any() else 0
+    # unranked players follow all ranked players
+    ranks = np.where(ranked, rank_array, max_rank + 1)
+    keys = ranks * (n_players + 1) + position_array
+    return np.where(valid, keys, np.inf)
+
+
+def order_by_keys(keys, k):
+    """
+    Indices (along the first axis) of the k smallest keys, in order.  When k is well below the number of players,
+    the k smallest keys are selected with a partial sort and only those are sorted (the order of equal keys is then
+    arbitrary, which only affects invalid entries since valid keys are unique).
+    :param keys: array of sort keys with players along the first axis
+    :param k: number of leading entries to keep
+    :return:
+    """
+    k = int(k)
+    if k * TOP_K_MIN_RATIO >= keys.shape[0]:
+        return np.argsort(keys, axis=0, kind='mergesort')[:k]
+    selected = np.argpartition(keys, k - 1, axis=0)[:k]
+    order = np.argsort(take_along_players(keys, selected), axis=0, kind='mergesort')
+    return take_along_players(selected, order)
+
+
+def players_index(order, trailing_shape):
+    """
+    Index selecting, at every entry of order, the player order[...] of an array of shape (players,) + trailing_shape,
+    where trailing_shape must match the last dims of order
+    :param order: array of player indices of shape (k,) + extra
+    :param trailing_shape: shape of the array indexed, without the players axis
+    :return: tuple usable to gather from or scatter into the array
+    """
+    n_trailing = len(trailing_shape)
+    trailing = [np.arange(n).reshape((1,) * (order.ndim - n_trailing + i) + (n,) + (1,) * (n_trailing - 1 - i))
+                for i, n in enumerate(trailing_shape)]
+    return (order,) + tuple(trailing)
+
+
+def take_along_players(values, order):
+    """
+    Gather values by player order: values has shape (players,) + trailing and order has shape (k,) + extra,
+    where the trailing dims of values must match the last dims of order
+    :param values:
+    :param order:
+    :return:
+    """
+    return values[players_index(order, values.shape[1:])]
+
+
+class BatchDCGScorer(DCGScorer):
+
+    """ DCGScorer that fits a (player x week) points table and scores all experts for all weeks at once """
+
+    @instrument.timed_method
+    def fit(self, points, fit_key=None):
+        """
+        Store ground truth points and compute the max possible score for each week
+        :param points: DataFrame of points scored (players x weeks)
+        :param fit_key: identity of points keying the fitted state in the fit cache, None to fit without the cache
+        :return:
+        """
+        self.check_input(points, pd.DataFrame)
+        if self._restore_fit(fit_key):
+            return self
+        self.points_ = points
+        if self.normalize:
+            max_score = self.ideal_dcg(points.values.astype(float))
+            if np.any(max_score <= 0):
+                raise ValueError('Normalization not possible with provided input')
+            self.max_score_ = pd.Series(max_score, index=points.columns)
+        self._store_fit(fit_key)
+        return self
+
+    @instrument.timed_method
+    def score(self, ranks, points=None):
+        """
+        Score projected ranks for every expert and every fitted week
+        :param ranks: dict mapping week label (a column of the fitted points) to DataFrame of ranks
+        :param points: not used, included to conform to BaseScorer API
+        :return: DataFrame of scores (experts x weeks), NaN where an expert has no rankings for a week
+        """
+        self.check_input(ranks, dict)
+        points = self.points_[list(ranks.keys())]
+        rank_array, position_array, experts, weeks = stack_ranks(ranks, points.index)
+        scores = self.score_arrays(rank_array, points.values.astype(float), position_array)
+        if self.normalize:
+            scores /= self.max_score_[weeks].values[None, :]
+        # experts without any rankings in a week are not scored
+        scores[np.all(np.isnan(rank_array), axis=0)] = np.nan
+        return pd.DataFrame(scores, index=experts, columns=weeks)
+
+    def score_arrays(self, rank_array, points_array, position_array=None):
+        """
+        Unnormalized DCG of aligned arrays
+        :param rank_array: array of ranks (players x experts x weeks)
+        :param points_array: array of points (players x weeks)
+        :param position_array: array of player positions in the rank data (players x weeks), -1 if absent; if
+            None, arrays are in the compact form indexed by player ID and players without a rank follow the ranked
+            players in ID order (as in BaseScorer.sort_points_by_rank)
+        :return: array of scores (experts x weeks)
+        """
+        # player IDs are stable, so compact arrays of different lengths align on their common prefix
+        n_players = min(rank_array.shape[0], points_array.shape[0])
+        rank_array, points_array = rank_array[:n_players], points_array[:n_players]
+
+        valid = ~np.isnan(points_array)[:, None, :]
+        if position_array is not None:
+            valid = valid & (position_array >= 0)[:, None, :]
+            position_array = position_array[:, None, :]
+        keys = rank_order_keys(rank_array, valid, position_array)
+        order = order_by_keys(keys, min(self.k, rank_array.shape[0]))
+        gains = take_along_players(points_array, order)
+        scored = np.isfinite(take_along_players(keys, order))
+        return self._batch_dcg(gains, scored)
+
+    def ideal_dcg(self, points_array):
+        """
+        DCG of the perfect ordering of each column of points
+        :param points_array: array of points (players x weeks)
+        :return:
+        """
+        keys = np.where(np.isnan(points_array), np.inf, -points_array)
+        order = order_by_keys(keys, min(self.k, points_array.shape[0]))
+        gains = take_along_players(points_array, order)
+        return self._batch_dcg(gains, ~np.isnan(gains))
+
+    def _batch_dcg(self, gains, scored):
+        """
+        DCG of gains already sorted along the first axis
+        :param gains: array of gains in ranked order
+        :param scored: boolean array marking gains that contribute to the score
+        :return:
+        """
+        numerator = np.where(scored, self.numerator_func(np.where(scored, gains, 0)), 0)
+        denominator = discount_table(gains.shape[0]).reshape((-1,) + (1,) * (gains.ndim - 1))
+        return (numerator / denominator).sum(axis=0)
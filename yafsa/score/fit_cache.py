@@ -0,0 +1,109 @@
+""" Cache of fitted scorer state keyed by an identity of the fitted data and the scorer parameters """
+
+import cPickle as pickle
+import hashlib
+import os
+
+from collections import OrderedDict
+
+
+class FitCache(object):
+
+    """
+    Bounded LRU cache of fitted scorer state, optionally persisted to disk
+
+    Entries are keyed by the fit_key the caller passes to fit, an identity of the fitted data such as
+    (year, position, week), together with the scorer class and its parameters (see BaseScorer.fit_params), so
+    refitting a scorer on data it has already seen restores the fitted attributes instead of recomputing them.
+    The data itself is never hashed, which would cost about as much as the fits it saves: the caller must give
+    different data different keys (including a version of the data when entries are persisted).  With a
+    directory, entries are also pickled to disk, so that repeated runs and worker processes share fitted state.
+    """
+
+    def __init__(self, max_size=128, directory=None):
+        """
+        :param max_size: maximum number of entries held in memory
+        :param directory: optional directory where entries are persisted
+        """
+        self.max_size = max(1, max_size)
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(scorer, fit_key):
+        """
+        Cache key of a scorer fitted to the data identified by fit_key
+        :param scorer: BaseScorer
+        :param fit_key: hashable identity of the data passed to fit (with a stable repr if entries are persisted)
+        :return: tuple
+        """
+        return type(scorer).__name__, tuple(sorted(scorer.fit_params().items())), fit_key
+
+    def restore(self, scorer, fit_key):
+        """
+        Set the fitted attributes of scorer from the cache
+        :param scorer: BaseScorer
+        :param fit_key: identity of the data passed to fit
+        :return: bool indicating whether the fitted state was found
+        """
+        key = self.key(scorer, fit_key)
+        state = self._entries.pop(key, None)
+        if state is None:
+            state = self._read(key)
+        if state is None:
+            self.misses += 1
+            return False
+        self.hits += 1
+        self._insert(key, state)
+        scorer.__dict__.update(state)
+        return True
+
+    def store(self, scorer, fit_key):
+        """
+        Add the fitted attributes (those ending with an underscore) of scorer to the cache
+        :param scorer: fitted BaseScorer
+        :param fit_key: identity of the data passed to fit
+        :return:
+        """
+        key = self.key(scorer, fit_key)
+        state = {name: value for name, value in vars(scorer).iteritems() if name.endswith('_')}
+        self._insert(key, state)
+        self._write(key, state)
+
+    def clear(self):
+        """
+        Remove every entry held in memory (entries persisted to disk are kept)
+        :return:
+        """
+        self._entries.clear()
+
+    def _insert(self, key, state):
+        self._entries[key] = state
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _path(self, key):
+        return os.path.join(self.directory, '%s.pkl' % hashlib.sha1(repr(key)).hexdigest())
+
+    def _read(self, key):
+        if self.directory is None or not os.path.exists(self._path(key)):
+            return None
+        with open(self._path(key), 'rb') as f:
+            return pickle.load(f)
+
+    def _write(self, key, state):
+        if self.directory is None:
+            return
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        # write to a temporary file first so concurrent workers never read a partial entry
+        tmp_path = '%s.%i.tmp' % (self._path(key), os.getpid())
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, self._path(key))
+
@@ -3,6 +3,73 @@
 import numpy as np
 import pandas as pd
 
+from collections import deque
+from yafsa import instrument
+
+
+# selecting the k smallest keys before sorting only pays off for at least this many keys per selected key
+TOP_K_MIN_RATIO = 4
+
+# cache of DCG discount vectors keyed by depth
+_DISCOUNT_CACHE = {}
+
+
+def discount_table(k):
+    """
+    Return the DCG discount vector log2(i+1) for ranks i = 1..k (cached, treat as read-only)
+    :param k: depth of the discount vector
+    :return:
+    """
+    k = int(k)
+    discounts = _DISCOUNT_CACHE.get(k)
+    if discounts is None:
+        discounts = np.log2(np.arange(2, k+2))
+        discounts.flags.writeable = False
+        _DISCOUNT_CACHE[k] = discounts
+    return discounts
+
+
+def top_k_indices(keys, k=None):
+    """
+    Indices of the k smallest keys in ascending order (ties in input order).  When k is well below the number of
+    keys, the k smallest are selected with a partial sort (argpartition) and only those k are sorted.
+    :param keys: 1-d array of sort keys
+    :param k: number of indices to return (all if None)
+    :return:
+    """
+    n = keys.shape[0]
+    if k is None or k * TOP_K_MIN_RATIO >= n:
+        order = np.argsort(keys, kind='mergesort')
+        return order if k is None or k >= n else order[:int(k)]
+    k = int(k)
+    if k <= 0:
+        return np.array([], dtype=int)
+    selected = np.argpartition(keys, k - 1)[:k]
+    threshold = keys[selected].max()
+    # keys tied with the k-th smallest may have been selected arbitrarily, so take the earliest ones
+    below = selected[keys[selected] < threshold]
+    tied = np.flatnonzero(keys == threshold)[:k - below.shape[0]]
+    selected = np.concatenate([below, tied])
+    # restore input order before the stable sort so that ties are broken as by a full stable sort
+    selected.sort()
+    return selected[np.argsort(keys[selected], kind='mergesort')]
+
+
+def _rank_order(ranks, points, k=None):
+    """
+    Positions of the players with points in order of rank, unranked players following the ranked players in the
+    order they appear
+    :param ranks: 1-d array of ranks (NaN if unranked)
+    :param points: 1-d array of points aligned with ranks (NaN if no points)
+    :param k: number of positions to return (all if None)
+    :return: array of positions
+    """
+    rank_values = np.array(ranks, dtype=float)
+    unranked = np.isnan(rank_values)
+    rank_values[unranked] = (rank_values[~unranked].max() + 1) if not unranked.all() else 0
+    scored = np.flatnonzero(~np.isnan(points))
+    return scored[top_k_indices(rank_values[scored], k)]
+
 
 class BaseScorer(object):
 
@@ -24,43 +91,89 @@ class BaseScorer(object):
             if len(input_data.shape) == 2 and input_data.shape[1] > max_columns:
                 raise ValueError('Input must have at most %i columns' % max_columns)
 
+    def fit_params(self):
+        """
+        Parameters that determine the fitted state (used to key fitted scorers in a FitCache)
+        :return: dict
+        """
+        return {}
+
+    def _restore_fit(self, fit_key):
+        """
+        Restore fitted state from the scorer's fit cache
+        :param fit_key: identity of the data passed to fit (None fits without the cache)
+        :return: bool indicating whether the fitted state was restored
+        """
+        fit_cache = getattr(self, 'fit_cache', None)
+        return fit_cache is not None and fit_key is not None and fit_cache.restore(self, fit_key)
+
+    def _store_fit(self, fit_key):
+        """
+        Add fitted state to the scorer's fit cache
+        :param fit_key: identity of the data passed to fit (None fits without the cache)
+        :return:
+        """
+        fit_cache = getattr(self, 'fit_cache', None)
+        if fit_cache is not None and fit_key is not None:
+            fit_cache.store(self, fit_key)
+
+    @instrument.timed_method
     def score(self, ranks, points=None):
         """
         Score projected ranks based on class metric
-        :param ranks: DataFrame or Series of ranks for a position indexed by "expert ranker"
-        :param points: Series of points scored for a position
-        :return:
+        :param ranks: DataFrame or Series of ranks for a position indexed by "expert ranker", or the compact form:
+            array of ranks indexed by player ID (players x experts, or a single ranking)
+        :param points: Series of points scored for a position (array indexed by player ID for compact input)
+        :return: Series of scores indexed by expert (array of scores for compact input)
         """
-        self.check_input(ranks, (pd.Series, pd.DataFrame))
+        self.check_input(ranks, (pd.Series, pd.DataFrame, np.ndarray))
+        if isinstance(ranks, np.ndarray):
+            ranks = ranks.reshape((ranks.shape[0], -1))
+            return np.array([self.metric(ranks[:, j], points=points) for j in xrange(ranks.shape[1])])
         if isinstance(ranks, pd.Series):
             return ranks.to_frame().apply(self.metric, points=points)
         return ranks.apply(self.metric, points=points)
 
     @staticmethod
-    def sort_points_by_rank(ranks, points):
+    def sort_points_by_rank(ranks, points, k=None):
         """
         Sort points in order of projected rankings
-        :param ranks: Series of projected rankings indexed by player
-        :param points: Series of actual points scored indexed by player
+        :param ranks: Series of projected rankings indexed by player, or array indexed by player ID (players
+            without a rank follow the ranked players, in the order they appear in the Series or in ID order)
+        :param points: Series of actual points scored indexed by player, or array indexed by player ID
+        :param k: return only the points of the first k ranked players with points, selected without sorting
+            every ranking (all if None)
         :return:
         """
-        rank_idx = ranks.sort_values().index
-        return points.loc[rank_idx].dropna()
+        if isinstance(ranks, np.ndarray):
+            # IDs are stable, so arrays of different lengths align on their common prefix
+            n_players = min(ranks.shape[0], points.shape[0])
+            return points[:n_players][_rank_order(ranks[:n_players], points[:n_players], k)]
+        if ranks.dtype.kind not in 'biuf':
+            # non-numeric ranks keep the ordering of a full sort
+            points_by_rank = points.loc[ranks.sort_values().index].dropna()
+            return points_by_rank if k is None else points_by_rank.iloc[:int(min(k, points_by_rank.shape[0]))]
+        points_values = points.reindex(ranks.index).values.astype(float)
+        order = _rank_order(ranks.values, points_values, k)
+        return pd.Series(points_values[order], index=ranks.index[order], name=points.name)
 
 
 class DCGScorer(BaseScorer):
 
     """ Discounted cumulative gain (see https://en.wikipedia.org/wiki/Discounted_cumulative_gain) """
 
-    def __init__(self, k=None, numerator='rel', normalize=True):
+    def __init__(self, k=None, numerator='rel', normalize=True, fit_cache=None):
         """
 
         :param k: score only the first k rankings
         :param numerator: use relevance scores ('rel') or 2^relevance_scores - 1 ('exp') in numerator of dcg calculation
         :param normalize: boolean indicating whether to normalize by maximum possible dcg
+        :param fit_cache: optional FitCache for reusing fitted state
         """
         self.k = k if k else np.inf
         self.normalize = normalize
+        self.numerator = numerator
+        self.fit_cache = fit_cache
         self.numerator_func = {
             'rel': self._rel_numerator,
             'exp': self._exp_numerator
@@ -72,32 +185,45 @@ class DCGScorer(BaseScorer):
         self.points_ = None
         self.max_score_ = None
 
-    def fit(self, points):
+    def fit_params(self):
+        return {'k': self.k, 'numerator': self.numerator, 'normalize': self.normalize}
+
+    @instrument.timed_method
+    def fit(self, points, fit_key=None):
         """
         Store ground truth points to be used to obtain true ordering
-        :param points: Single column DataFrame or Series with points scored by each player
+        :param points: Single column DataFrame or Series with points scored by each player, or array of points
+            indexed by player ID
+        :param fit_key: identity of points (e.g., (year, position, week)) keying the fitted state in the fit cache,
+            None to fit without the cache
         :return:
         """
-        self.check_input(points, (pd.DataFrame, pd.Series), max_columns=1)
+        self.check_input(points, (pd.DataFrame, pd.Series, np.ndarray), max_columns=1)
+        if self._restore_fit(fit_key):
+            return self
 
-        # format input to a pd.Series with name 'points'
-        # (this implementation handles both Series and DataFrame input)
-        self.points_ = pd.Series(points.values.ravel(), index=points.index, name='points')
+        if isinstance(points, np.ndarray):
+            self.points_ = points.astype(float).ravel()
+        else:
+            # format input to a pd.Series with name 'points'
+            # (this implementation handles both Series and DataFrame input)
+            self.points_ = pd.Series(points.values.ravel(), index=points.index, name='points')
 
         if self.normalize:
             # compute max possible score obtained by perfect ordering
-            sorted_idx = self.points_.sort_values(ascending=False).index
-            optimal_ranks = pd.Series(np.arange(len(sorted_idx)) + 1, index=sorted_idx)
-            max_score = self._metric(optimal_ranks, normalize=False)
+            points_values = np.asarray(self.points_, dtype=float)
+            valid_points = points_values[~np.isnan(points_values)]
+            max_score = self._dcg(valid_points[top_k_indices(-valid_points, self.k)])
             if max_score <= 0:
                 raise ValueError('Normalization not possible with provided input')
             self.max_score_ = max_score
+        self._store_fit(fit_key)
         return self
 
     def metric(self, ranks, points=None):
         """
 
-        :param ranks: Series of projected rankings indexed by player
+        :param ranks: Series of projected rankings indexed by player (or array indexed by player ID)
         :param points: not used, included to conform to BaseScorer API
         :return:
         """
@@ -106,22 +232,29 @@ class DCGScorer(BaseScorer):
     def _metric(self, ranks, normalize):
         """
         Computes DCG
-        :param ranks: Series of projected rankings indexed by player
+        :param ranks: Series of projected rankings indexed by player (or array indexed by player ID)
         :param normalize: boolean
         :return:
         """
         # sort points by rank
-        points_by_rank = self.sort_points_by_rank(ranks, self.points_)
-        # ensure k does not exceed length of points_by_rank
-        k = min(self.k, points_by_rank.shape[0])
-        # DCG calculation
-        numerator = self.numerator_func(points_by_rank.iloc[:k])
-        denominator = np.log2(np.arange(2, k+2))
-        score = sum(numerator / denominator)
+        points_by_rank = self.sort_points_by_rank(ranks, self.points_, self.k)
+        score = self._dcg(points_by_rank)
         if normalize:
             score /= self.max_score_
         return score
 
+    def _dcg(self, points_by_rank):
+        """
+        DCG of points sorted by rank
+        :param points_by_rank: Series or array of points in ranked order
+        :return:
+        """
+        # ensure k does not exceed length of points_by_rank
+        k = min(self.k, points_by_rank.shape[0])
+        numerator = self.numerator_func(np.asarray(points_by_rank)[:k])
+        denominator = discount_table(k)
+        return sum(numerator / denominator)
+
     @staticmethod
     def _rel_numerator(x):
         return x
@@ -135,48 +268,67 @@ class DifferenceScorer(BaseScorer):
 
     """ Score based on difference from mean points for a given rank """
 
-    def __init__(self, k=None, standardize=False):
+    def __init__(self, k=None, standardize=False, fit_cache=None):
         """
 
         :param k: score only the first k rankings
         :param standardize: return standardized z-scores
+        :param fit_cache: optional FitCache for reusing fitted state
         """
         self.k = k if k else np.inf
         self.standardize = standardize
+        self.fit_cache = fit_cache
         # populated by fit
         self.n_fitted_points_ = None
         self.points_mean_by_rank_ = None
         self.points_std_by_rank_ = None
 
-    def fit(self, points_by_week):
+    def fit_params(self):
+        return {'standardize': self.standardize}
+
+    @instrument.timed_method
+    def fit(self, points_by_week, fit_key=None):
         """
         Compute statistics from historical points
-        :param points_by_week: DataFrame of weekly points
+        :param points_by_week: DataFrame of weekly points, or array of weekly points indexed by player ID
+        :param fit_key: identity of points_by_week (e.g., (year, position)) keying the fitted state in the fit
+            cache, None to fit without the cache
         :return:
         """
-        self.check_input(points_by_week, pd.DataFrame)
+        self.check_input(points_by_week, (pd.DataFrame, np.ndarray))
+        if self._restore_fit(fit_key):
+            return self
         # sort each column's (week's) points
-        sorted_points = -np.sort(-points_by_week.values, axis=0)
+        sorted_points = -np.sort(-np.asarray(points_by_week, dtype=float), axis=0)
         sorted_points = sorted_points[~np.all(np.isnan(sorted_points), axis=1)]
-        self.n_fitted_points_ = sorted_points.shape[0]
-        # compute mean for each rank
-        self.points_mean_by_rank_ = np.nan_to_num(np.nanmean(sorted_points, axis=1))
+        # compute mean and standard deviation for each rank
+        self._set_profiles(np.nanmean(sorted_points, axis=1), np.nanstd(sorted_points, axis=1))
+        self._store_fit(fit_key)
+        return self
+
+    def _set_profiles(self, mean_by_rank, std_by_rank):
+        """
+        Set the fitted per-rank statistics
+        :param mean_by_rank: array of mean points for each rank
+        :param std_by_rank: array of standard deviation of points for each rank
+        :return:
+        """
+        self.n_fitted_points_ = mean_by_rank.shape[0]
+        self.points_mean_by_rank_ = np.nan_to_num(mean_by_rank)
         if self.standardize:
-            # standard deviation for each rank
-            self.points_std_by_rank_ = np.nan_to_num(np.nanstd(sorted_points, axis=1))
+            self.points_std_by_rank_ = np.nan_to_num(std_by_rank)
             # replace zeros with the median std to avoid division by zero
             zero_fill_val = np.median(self.points_std_by_rank_[self.points_std_by_rank_ > 0])
             self.points_std_by_rank_[self.points_std_by_rank_ == 0] = zero_fill_val
-        return self
 
     def metric(self, ranks, points):
         """
         Compute score as the average of the difference of the underperforming ranks
-        :param ranks: Series of projected rankings indexed by player
-        :param points: Series of actual points scored indexed by player
+        :param ranks: Series of projected rankings indexed by player (or array indexed by player ID)
+        :param points: Series of actual points scored indexed by player (or array indexed by player ID)
         :return:
         """
-        points_by_rank = self.sort_points_by_rank(ranks, points)
+        points_by_rank = np.asarray(self.sort_points_by_rank(ranks, points, min(self.n_fitted_points_, self.k)))
         max_idx = min(points_by_rank.shape[0], self.n_fitted_points_, self.k)
         # compute difference between points scored by ith ranked player and the
         # average points scored by ith ranked player
@@ -185,3 +337,142 @@ class DifferenceScorer(BaseScorer):
             point_differences /= self.points_std_by_rank_[:max_idx]
         # return aggregated point difference of underperforming ranks
         return np.average(point_differences, weights=point_differences < 0)
+
+
+class OnlineDifferenceScorer(DifferenceScorer):
+
+    """
+    DifferenceScorer whose per-rank statistics are updated one week at a time
+
+    Running weight/mean/M2 accumulators (Welford) are kept for every rank, so adding a week sorts only that week's
+    points and updates the statistics in O(ranks).  Profiles can cover all weeks seen, a rolling window of the
+    most recent weeks, or weight weeks exponentially by recency.
+    """
+
+    def __init__(self, k=None, standardize=False, window=None, halflife=None):
+        """
+
+        :param k: score only the first k rankings
+        :param standardize: return standardized z-scores
+        :param window: use only the most recent window weeks (all weeks if None)
+        :param halflife: number of weeks after which a week's weight is halved (equal weights if None)
+        """
+        super(OnlineDifferenceScorer, self).__init__(k=k, standardize=standardize)
+        if window is not None and halflife is not None:
+            raise ValueError('Specify at most one of window and halflife')
+        if window is not None and window < 1:
+            raise ValueError('window must be at least 1')
+        if halflife is not None and halflife <= 0:
+            raise ValueError('halflife must be positive')
+        self.window = window
+        self.halflife = halflife
+        self.decay = 0.5 ** (1. / halflife) if halflife else 1.
+        self.reset()
+
+    def reset(self):
+        """
+        Clear all accumulated statistics
+        :return:
+        """
+        self.n_weeks_ = 0
+        self.weights_ = np.zeros(0)
+        self.means_ = np.zeros(0)
+        self.m2_ = np.zeros(0)
+        # sorted points of the weeks in the rolling window
+        self.window_weeks_ = deque()
+        self.n_fitted_points_ = None
+        self.points_mean_by_rank_ = None
+        self.points_std_by_rank_ = None
+        return self
+
+    @instrument.timed_method
+    def fit(self, points_by_week):
+        """
+        Compute statistics from historical points, adding weeks (columns) in order
+        :param points_by_week: DataFrame of weekly points, or array of weekly points indexed by player ID
+        :return:
+        """
+        self.check_input(points_by_week, (pd.DataFrame, np.ndarray))
+        return self.reset().partial_fit(points_by_week)
+
+    @instrument.timed_method
+    def partial_fit(self, week_points):
+        """
+        Update statistics with one or more new weeks of points
+        :param week_points: Series or 1-d array of one week's points, or DataFrame or 2-d array with one week per
+            column (in chronological order)
+        :return:
+        """
+        self.check_input(week_points, (pd.Series, pd.DataFrame, np.ndarray))
+        week_points = np.asarray(week_points, dtype=float)
+        for week in week_points.reshape((week_points.shape[0], -1)).T:
+            self._add_week(-np.sort(-week[~np.isnan(week)]))
+        if self.n_weeks_:
+            self._set_profiles_from_accumulators()
+        return self
+
+    def _add_week(self, sorted_points):
+        """
+        Add one week of points sorted in descending order to the accumulators
+        :param sorted_points: array
+        :return:
+        """
+        self._grow(sorted_points.shape[0])
+        if self.decay < 1:
+            self.weights_ *= self.decay
+            self.m2_ *= self.decay
+        n = sorted_points.shape[0]
+        self.weights_[:n] += 1
+        delta = sorted_points - self.means_[:n]
+        self.means_[:n] += delta / self.weights_[:n]
+        self.m2_[:n] += delta * (sorted_points - self.means_[:n])
+        self.n_weeks_ += 1
+
+        if self.window is not None:
+            self.window_weeks_.append(sorted_points)
+            if len(self.window_weeks_) > self.window:
+                self._remove_week(self.window_weeks_.popleft())
+
+    def _remove_week(self, sorted_points):
+        """
+        Remove a week previously added to the accumulators (inverse Welford update)
+        :param sorted_points: array
+        :return:
+        """
+        n = sorted_points.shape[0]
+        weights = self.weights_[:n] - 1
+        emptied = weights <= 0
+        safe_weights = np.where(emptied, 1, weights)
+        old_means = (self.weights_[:n] * self.means_[:n] - sorted_points) / safe_weights
+        self.m2_[:n] -= (sorted_points - old_means) * (sorted_points - self.means_[:n])
+        self.means_[:n] = np.where(emptied, 0, old_means)
+        # a rank left with a single week has no spread (not the rounding residue of the inverse update, which
+        # standardize would divide by)
+        self.m2_[:n] = np.where(emptied | (weights == 1), 0, np.maximum(self.m2_[:n], 0))
+        self.weights_[:n] = np.where(emptied, 0, weights)
+        self.n_weeks_ -= 1
+
+    def _grow(self, n_ranks):
+        """
+        Extend the accumulators to cover n_ranks ranks
+        :param n_ranks:
+        :return:
+        """
+        extra = n_ranks - self.weights_.shape[0]
+        if extra > 0:
+            self.weights_ = np.concatenate([self.weights_, np.zeros(extra)])
+            self.means_ = np.concatenate([self.means_, np.zeros(extra)])
+            self.m2_ = np.concatenate([self.m2_, np.zeros(extra)])
+
+    def _set_profiles_from_accumulators(self):
+        """
+        Set the fitted per-rank statistics from the accumulators
+        :return:
+        """
+        observed = np.flatnonzero(self.weights_ > 0)
+        n_ranks = observed[-1] + 1 if observed.shape[0] else 0
+        weights = self.weights_[:n_ranks]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.where(weights > 0, self.means_[:n_ranks], np.nan)
+            stds = np.sqrt(np.maximum(self.m2_[:n_ranks], 0) / weights)
+        self._set_profiles(means, stds)
@@ -0,0 +1,293 @@
+""" Ranking metrics comparing each expert's ordering of players with their ordering by points scored """
+
+import abc
+import numpy as np
+import pandas as pd
+
+from yafsa import instrument
+from batch import order_by_keys, players_index, rank_order_keys, take_along_players
+from metrics import BaseScorer
+
+
+def count_inversions(values):
+    """
+    Number of pairs i < j with values[i] > values[j] in each column, counted by a bottom-up merge sort whose merge
+    levels are vectorized across columns (O(n log n) comparisons rather than comparing every pair)
+    :param values: array with the sequence along the first axis
+    :return: array of counts with the shape of the trailing axes of values
+    """
+    n = values.shape[0]
+    columns = values.reshape((n, -1)).T
+    n_columns = columns.shape[0]
+    rows = np.arange(n_columns)[:, None]
+
+    # replace values by dense ranks, so that sorted blocks can be offset into a single sorted array
+    order = np.argsort(columns, axis=1, kind='mergesort')
+    sorted_values = columns[rows, order]
+    new_value = np.ones(sorted_values.shape, dtype=bool)
+    new_value[:, 1:] = sorted_values[:, 1:] != sorted_values[:, :-1]
+    blocks = np.empty(columns.shape, dtype=int)
+    blocks[rows, order] = np.cumsum(new_value, axis=1) - 1
+
+    # pad to a power of two with a value larger than any rank (padding at the end adds no inversions)
+    width = 1 << max(0, n - 1).bit_length()
+    n_values = n + 1
+    blocks = np.hstack([blocks, np.full((n_columns, width - n), n, dtype=int)])
+
+    inversions = np.zeros(n_columns, dtype=int)
+    run = 1
+    while run < width:
+        pairs = blocks.reshape((-1, 2, run))
+        n_pairs = pairs.shape[0]
+        left, right = pairs[:, 0, :], pairs[:, 1, :]
+        offsets = (np.arange(n_pairs) * n_values)[:, None]
+        starts = (np.arange(n_pairs) * run)[:, None]
+        # for each element, the number of elements of the other run that precede it once merged
+        left_not_above = np.searchsorted((left + offsets).ravel(), (right + offsets).ravel(), 'right')
+        left_not_above = left_not_above.reshape((n_pairs, run)) - starts
+        right_below = np.searchsorted((right + offsets).ravel(), (left + offsets).ravel(), 'left')
+        right_below = right_below.reshape((n_pairs, run)) - starts
+        inversions += (run - left_not_above).sum(axis=1).reshape((n_columns, -1)).sum(axis=1)
+
+        merged = np.empty((n_pairs, 2 * run), dtype=int)
+        pair_rows, positions = np.arange(n_pairs)[:, None], np.arange(run)[None, :]
+        merged[pair_rows, positions + right_below] = left
+        merged[pair_rows, positions + left_not_above] = right
+        blocks = merged.reshape((n_columns, width))
+        run *= 2
+
+    return inversions.reshape(values.shape[1:])
+
+
+def count_ties(values, valid):
+    """
+    Number of pairs of equal valid values in each column
+    :param values: array with the sequence along the first axis
+    :param valid: boolean array marking the entries to count (invalid entries must be np.inf)
+    :return: array of counts with the shape of the trailing axes of values
+    """
+    sorted_values = np.sort(np.where(valid, values, np.inf), axis=0)
+    index = np.arange(values.shape[0]).reshape((-1,) + (1,) * (values.ndim - 1))
+    new_value = np.ones(values.shape, dtype=bool)
+    new_value[1:] = sorted_values[1:] != sorted_values[:-1]
+    # each value is tied with every preceding entry of its run
+    run_start = np.maximum.accumulate(np.where(new_value, index, 0), axis=0)
+    return np.where(np.isfinite(sorted_values), index - run_start, 0).sum(axis=0)
+
+
+class OrderScorer(BaseScorer):
+
+    """
+    Base class for metrics comparing each expert's top k players with the top k players by points
+
+    Only players with points are ordered: an expert's list holds the players (s)he ranked, and the true list holds
+    every player with points, ordered by points with ties broken by the order of the players.  Lists are cut at
+    k, or at the number of players with points if that is smaller.  Experts are scored together as columns of aligned
+    arrays (see score_arrays), for single weeks and whole seasons alike.  Subclasses implement _score_lists.
+    """
+
+    __metaclass__ = abc.ABCMeta
+
+    def __init__(self, k=None):
+        """
+
+        :param k: compare only the first k rankings
+        """
+        self.k = k if k else np.inf
+        # populated by fit
+        self.points_ = None
+
+    def fit_params(self):
+        return {'k': self.k}
+
+    @instrument.timed_method
+    def fit(self, points):
+        """
+        Store ground truth points to be used to obtain true ordering
+        :param points: Single column DataFrame or Series with points scored by each player, or array of points
+            indexed by player ID
+        :return:
+        """
+        self.check_input(points, (pd.DataFrame, pd.Series, np.ndarray), max_columns=1)
+        if isinstance(points, np.ndarray):
+            self.points_ = points.astype(float).ravel()
+        else:
+            self.points_ = pd.Series(points.values.ravel(), index=points.index, name='points')
+        return self
+
+    @instrument.timed_method
+    def score(self, ranks, points=None):
+        """
+        Score projected ranks of every expert at once
+        :param ranks: DataFrame or Series of ranks for a position indexed by player, or the compact form: array of
+            ranks indexed by player ID (players x experts, or a single ranking)
+        :param points: not used, included to conform to BaseScorer API
+        :return: Series of scores indexed by expert (array of scores for compact input)
+        """
+        self.check_input(ranks, (pd.Series, pd.DataFrame, np.ndarray))
+        if isinstance(ranks, np.ndarray):
+            ranks = ranks.reshape((ranks.shape[0], -1)).astype(float)
+            return self.score_arrays(ranks[:, :, None], self.points_[:, None])[:, 0]
+        if isinstance(ranks, pd.Series):
+            ranks = ranks.to_frame()
+        # players with points but without ranks still belong to the true ordering
+        players = ranks.index.append(self.points_.index[~self.points_.index.isin(ranks.index)])
+        rank_array = ranks.reindex(players).values.astype(float)
+        points_array = self.points_.reindex(players).values.astype(float)
+        return pd.Series(self.score_arrays(rank_array[:, :, None], points_array[:, None])[:, 0], index=ranks.columns)
+
+    def metric(self, ranks, points=None):
+        """
+
+        :param ranks: Series of projected rankings indexed by player (or array indexed by player ID)
+        :param points: not used, included to conform to BaseScorer API
+        :return:
+        """
+        return np.asarray(self.score(ranks))[0]
+
+    def score_arrays(self, rank_array, points_array):
+        """
+        Score aligned arrays in the compact form indexed by player ID
+        :param rank_array: array of ranks (players x experts x weeks)
+        :param points_array: array of points (players x weeks)
+        :return: array of scores (experts x weeks)
+        """
+        # player IDs are stable: players beyond the end of the rank array are unranked, and players beyond the end
+        # of the points array have no points and cannot be scored
+        n_players = points_array.shape[0]
+        if rank_array.shape[0] < n_players:
+            padding = np.full((n_players - rank_array.shape[0],) + rank_array.shape[1:], np.nan)
+            rank_array = np.concatenate([rank_array, padding])
+        rank_array = rank_array[:n_players]
+        has_points = ~np.isnan(points_array)
+        depth = int(min(self.k, n_players))
+        # length of the lists compared in each week
+        list_length = np.minimum(depth, has_points.sum(axis=0))
+
+        expert_keys = rank_order_keys(rank_array, has_points[:, None, :] & ~np.isnan(rank_array))
+        expert_order = order_by_keys(expert_keys, depth)
+        in_list = (np.isfinite(take_along_players(expert_keys, expert_order)) &
+                   (np.arange(depth)[:, None, None] < list_length))
+
+        # position of each player in the true ordering (the sort is shared by every expert)
+        true_order = np.argsort(np.where(has_points, -points_array, np.inf), axis=0, kind='mergesort')
+        true_positions = np.empty(true_order.shape, dtype=int)
+        true_positions[players_index(true_order, true_order.shape[1:])] = np.arange(n_players)[:, None]
+        true_positions[~has_points] = n_players
+
+        return self._score_lists(expert_order, in_list, true_positions, points_array, list_length)
+
+    @abc.abstractmethod
+    def _score_lists(self, expert_order, in_list, true_positions, points_array, list_length):
+        """
+        Metric of each expert's list
+        :param expert_order: array of the players in each expert's list, in order (depth x experts x weeks)
+        :param in_list: boolean array marking the entries of expert_order that belong to the list
+        :param true_positions: array of each player's position in the true ordering (players x weeks)
+        :param points_array: array of points (players x weeks)
+        :param list_length: array of the length of the lists compared in each week
+        :return: array of scores (experts x weeks)
+        """
+
+
+class PrecisionScorer(OrderScorer):
+
+    """ Precision at k: the fraction of an expert's top k players that are among the top k players by points """
+
+    def _score_lists(self, expert_order, in_list, true_positions, points_array, list_length):
+        hits = in_list & (take_along_players(true_positions, expert_order) < list_length)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return hits.sum(axis=0) / list_length.astype(float)
+
+
+class AveragePrecisionScorer(OrderScorer):
+
+    """
+    Average precision at k: the mean of the precision at each depth where an expert's list holds one of the top k
+    players by points (its mean over weeks is MAP@k)
+    """
+
+    def _score_lists(self, expert_order, in_list, true_positions, points_array, list_length):
+        hits = in_list & (take_along_players(true_positions, expert_order) < list_length)
+        depths = np.arange(1, hits.shape[0] + 1).reshape((-1, 1, 1))
+        precision = np.cumsum(hits, axis=0) / depths.astype(float)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(hits, precision, 0).sum(axis=0) / list_length
+
+
+class RBOScorer(OrderScorer):
+
+    """
+    Rank-biased overlap (Webber, Moffat and Zobel, 2010): overlap of the expert's list with the true list at every
+    depth, weighted geometrically by p^depth (extrapolated to the full depth of the lists)
+    """
+
+    def __init__(self, k=None, p=0.9):
+        """
+
+        :param k: compare only the first k rankings
+        :param p: persistence, the weight of each depth relative to the previous one (0 < p < 1)
+        """
+        super(RBOScorer, self).__init__(k=k)
+        if not 0 < p < 1:
+            raise ValueError('p must be between 0 and 1')
+        self.p = p
+
+    def fit_params(self):
+        return {'k': self.k, 'p': self.p}
+
+    def _score_lists(self, expert_order, in_list, true_positions, points_array, list_length):
+        n_depths = expert_order.shape[0]
+        # a player of the expert's list at position i adds to the overlap from depth max(i, true position) + 1
+        first_depth = np.maximum(np.arange(n_depths).reshape((-1, 1, 1)),
+                                 take_along_players(true_positions, expert_order))
+        first_depth = np.where(in_list & (first_depth < list_length), first_depth, n_depths)
+        depths = np.arange(1, n_depths + 1)
+        overlap = (first_depth[:, None] < depths[None, :, None, None]).sum(axis=0)
+
+        weights = (1 - self.p) / self.p * self.p ** depths / depths
+        in_depth = depths[:, None] <= list_length
+        overlap_sum = np.where(in_depth[:, None, :], overlap * weights[:, None, None], 0).sum(axis=0)
+        # overlap at the full depth of the lists is extrapolated to every deeper depth
+        last = np.maximum(list_length - 1, 0)
+        overlap_last = overlap[last, np.arange(overlap.shape[1])[:, None], np.arange(overlap.shape[2])]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            score = overlap_sum + overlap_last / list_length.astype(float) * self.p ** list_length
+        return np.where(list_length > 0, score, np.nan)
+
+
+class FootruleScorer(OrderScorer):
+
+    """
+    Spearman's footrule distance between top k lists (Fagin, Kumar and Sivakumar, 2003), with players missing from
+    a list placed at position k+1, reported as a similarity: 1 - distance / maximum distance
+    """
+
+    def _score_lists(self, expert_order, in_list, true_positions, points_array, list_length):
+        n_players = true_positions.shape[0]
+        expert_positions = np.empty(true_positions.shape[:1] + in_list.shape[1:], dtype=int)
+        expert_positions.fill(n_players)
+        expert_positions[players_index(expert_order, in_list.shape[1:])] = np.where(
+            in_list, np.arange(in_list.shape[0]).reshape((-1, 1, 1)), n_players)
+        distance = np.abs(np.minimum(expert_positions, list_length) -
+                          np.minimum(true_positions, list_length)[:, None, :]).sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return 1 - distance / (list_length * (list_length + 1.))
+
+
+class KendallTauScorer(OrderScorer):
+
+    """
+    Kendall's tau-b between the order of the players in an expert's list and their points: +1 if every player ranked
+    higher scored at least as many points, -1 if the order is reversed
+    """
+
+    def _score_lists(self, expert_order, in_list, true_positions, points_array, list_length):
+        # points in the expert's order, negated so that discordant pairs are inversions
+        negated_points = np.where(in_list, -take_along_players(points_array, expert_order), np.inf)
+        n_listed = in_list.sum(axis=0)
+        n_pairs = n_listed * (n_listed - 1) / 2.
+        tied_pairs = count_ties(negated_points, in_list)
+        discordant = count_inversions(negated_points)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return (n_pairs - tied_pairs - 2 * discordant) / np.sqrt(n_pairs * (n_pairs - tied_pairs))
@@ -0,0 +1,227 @@
+""" Bootstrap confidence intervals, permutation tests and pairwise win probabilities for expert scores """
+
+import numpy as np
+import pandas as pd
+
+from multiprocessing import Pool
+from batch import BatchDCGScorer, order_by_keys, rank_order_keys, take_along_players
+from metrics import DCGScorer, DifferenceScorer
+
+
+class Resampler(object):
+
+    """
+    Resample the players of a week to measure the uncertainty of each expert's score
+
+    Resample indices for a whole shard of resamples are drawn as one (players x resamples) array and every expert
+    is scored on every resample of the shard in one batched pass (no per-resample calls to score).  Each resample
+    draws from its own random stream seeded by (seed, resample), so results depend neither on the number of
+    processes nor on the shard size.
+    """
+
+    def __init__(self, scorer, n_resamples=1000, seed=0, shard_size=100, processes=1):
+        """
+        :param scorer: fitted DCGScorer or DifferenceScorer
+        :param n_resamples: number of resamples
+        :param seed: seed of the random streams
+        :param shard_size: number of resamples scored at once (bounds memory use)
+        :param processes: number of processes scoring shards (None for the number of CPUs)
+        """
+        if not isinstance(scorer, (DCGScorer, DifferenceScorer)):
+            raise TypeError('Resampling is supported for DCGScorer and DifferenceScorer')
+        self.scorer = scorer
+        self.n_resamples = n_resamples
+        self.seed = seed
+        self.shard_size = max(1, shard_size)
+        self.processes = processes
+
+    def bootstrap(self, ranks, points=None):
+        """
+        Scores of every expert on player resamples drawn with replacement
+        :param ranks: DataFrame of ranks for a position indexed by player
+        :param points: Series of points scored indexed by player (the fitted points for DCGScorer)
+        :return: DataFrame of scores (resamples x experts)
+        """
+        return self._resample_scores(ranks, points, 'bootstrap')
+
+    def permutation(self, ranks, points=None):
+        """
+        Scores of every expert after randomly permuting points among players (the null of uninformed rankings)
+        :param ranks: DataFrame of ranks for a position indexed by player
+        :param points: Series of points scored indexed by player (the fitted points for DCGScorer)
+        :return: DataFrame of scores (resamples x experts)
+        """
+        return self._resample_scores(ranks, points, 'permutation')
+
+    def confidence_intervals(self, ranks, points=None, alpha=0.05):
+        """
+        Percentile bootstrap confidence intervals of each expert's score
+        :param ranks: DataFrame of ranks for a position indexed by player
+        :param points: Series of points scored indexed by player (the fitted points for DCGScorer)
+        :param alpha: intervals cover 1 - alpha
+        :return: DataFrame indexed by expert with columns Score, Lower and Upper
+        """
+        resampled = self.bootstrap(ranks, points)
+        lower, upper = np.nanpercentile(resampled.values, [50. * alpha, 100 - 50. * alpha], axis=0)
+        return pd.DataFrame({'Score': self.score(ranks, points), 'Lower': lower, 'Upper': upper},
+                            index=resampled.columns, columns=['Score', 'Lower', 'Upper'])
+
+    def win_probabilities(self, ranks, points=None):
+        """
+        Probability that each expert scores better than each other expert over bootstrap resamples (ties count
+        as half a win)
+        :param ranks: DataFrame of ranks for a position indexed by player
+        :param points: Series of points scored indexed by player (the fitted points for DCGScorer)
+        :return: DataFrame (experts x experts) of P(row expert beats column expert)
+        """
+        resampled = self.bootstrap(ranks, points)
+        scores = resampled.values
+        wins = (scores[:, :, None] > scores[:, None, :]).mean(axis=0)
+        ties = (scores[:, :, None] == scores[:, None, :]).mean(axis=0)
+        return pd.DataFrame(wins + 0.5 * ties, index=resampled.columns, columns=resampled.columns)
+
+    def p_values(self, ranks, points=None):
+        """
+        Permutation p-values of each expert's score against rankings uninformed of the points scored
+        :param ranks: DataFrame of ranks for a position indexed by player
+        :param points: Series of points scored indexed by player (the fitted points for DCGScorer)
+        :return: Series indexed by expert
+        """
+        null_scores = self.permutation(ranks, points)
+        observed = self.score(ranks, points)
+        at_least = (null_scores.values >= observed[None, :]).sum(axis=0)
+        return pd.Series((1. + at_least) / (1. + self.n_resamples), index=null_scores.columns)
+
+    def score(self, ranks, points=None):
+        """
+        Score of each expert on the players as observed (equal to scorer.score for numeric ranks)
+        :param ranks: DataFrame of ranks for a position indexed by player
+        :param points: Series of points scored indexed by player (the fitted points for DCGScorer)
+        :return: array of scores, one for each expert
+        """
+        rank_array, points_array, position_array = self._align(ranks, points)
+        identity = np.arange(rank_array.shape[0])[:, None]
+        return _score_shard((_metric_spec(self.scorer), rank_array, points_array, position_array,
+                             identity, 'bootstrap'))[:, 0]
+
+    def _resample_scores(self, ranks, points, method):
+        rank_array, points_array, position_array = self._align(ranks, points)
+        spec = _metric_spec(self.scorer)
+        sizes = _shard_sizes(self.n_resamples, self.shard_size)
+        firsts = np.cumsum([0] + sizes[:-1])
+        shards = [(spec, rank_array, points_array, position_array, (self.seed, first, size), method)
+                  for first, size in zip(firsts, sizes)]
+        if self.processes == 1 or len(shards) == 1:
+            scores = [_score_shard(shard) for shard in shards]
+        else:
+            pool = Pool(self.processes)
+            try:
+                scores = pool.map(_score_shard, shards)
+            finally:
+                pool.close()
+                pool.join()
+        return pd.DataFrame(np.concatenate(scores, axis=1).T, columns=ranks.columns)
+
+    def _align(self, ranks, points):
+        """
+        Align ranks and points on the players of either: ranked players first (in the order of ranks), then
+        players that only have points
+        :param ranks: DataFrame of ranks
+        :param points: Series of points (the fitted points for DCGScorer)
+        :return: tuple (rank_array, points_array, position_array) where position_array holds each player's
+            position in ranks (-1 if absent)
+        """
+        if isinstance(self.scorer, DCGScorer):
+            points = self.scorer.points_
+        if points is None:
+            raise ValueError('Points must be provided for DifferenceScorer')
+        players = ranks.index.append(points.index[~points.index.isin(ranks.index)])
+        # ranks are compared as numbers, even if scraped as strings
+        rank_array = ranks.reindex(players).values.astype(float)
+        points_array = points.reindex(players).values.astype(float)
+        position_array = np.where(np.arange(len(players)) < ranks.shape[0], np.arange(len(players)), -1)
+        return rank_array, points_array, position_array
+
+
+def _shard_sizes(n_resamples, shard_size):
+    """
+    Number of resamples in each shard
+    :param n_resamples:
+    :param shard_size:
+    :return:
+    """
+    n_full, remainder = divmod(n_resamples, shard_size)
+    return [shard_size] * n_full + ([remainder] if remainder else [])
+
+
+def _metric_spec(scorer):
+    """
+    Picklable description of a fitted scorer's metric for scoring shards in worker processes
+    :param scorer: fitted DCGScorer or DifferenceScorer
+    :return: tuple
+    """
+    if isinstance(scorer, DCGScorer):
+        return 'dcg', scorer.k, scorer.numerator, scorer.normalize
+    return ('diff', scorer.k, scorer.n_fitted_points_, scorer.points_mean_by_rank_,
+            scorer.points_std_by_rank_ if scorer.standardize else None)
+
+
+def _resample_indices(n_players, draw, method):
+    """
+    Player indices of a shard of resamples
+    :param n_players:
+    :param draw: array of indices, or tuple (seed, first, size) of the resamples first to first + size - 1, each
+        drawn from the random stream seeded by (seed, resample)
+    :param method: 'bootstrap' (with replacement) or 'permutation'
+    :return: array (players x resamples)
+    """
+    if isinstance(draw, np.ndarray):
+        return draw
+    seed, first, size = draw
+    streams = [np.random.RandomState([seed, resample]) for resample in xrange(first, first + size)]
+    if method == 'bootstrap':
+        return np.column_stack([stream.randint(0, n_players, size=n_players) for stream in streams])
+    return np.column_stack([stream.permutation(n_players) for stream in streams])
+
+
+def _score_shard(shard):
+    """
+    Score every expert on a shard of resamples
+    :param shard: tuple (metric spec, rank_array, points_array, position_array, draw, method)
+    :return: array of scores (experts x resamples)
+    """
+    spec, rank_array, points_array, position_array, draw, method = shard
+    idx = _resample_indices(rank_array.shape[0], draw, method)
+    points = points_array[idx]
+    if method == 'bootstrap':
+        ranks = rank_array[idx].transpose((0, 2, 1))
+        positions = position_array[idx][:, None, :]
+    else:
+        # rankings stay with their players, only the points move
+        ranks = rank_array[:, :, None]
+        positions = position_array[:, None, None]
+
+    valid = ~np.isnan(points)[:, None, :] & (positions >= 0)
+    keys = rank_order_keys(ranks, valid, positions)
+    if spec[0] == 'dcg':
+        _, k, numerator, normalize = spec
+        dcg = BatchDCGScorer(k=k, numerator=numerator, normalize=False)
+        order = order_by_keys(keys, min(k, keys.shape[0]))
+        gains = take_along_players(points, order)
+        scores = dcg._batch_dcg(gains, np.isfinite(take_along_players(keys, order)))
+        if normalize:
+            scores /= dcg.ideal_dcg(points)[None, :]
+        return scores
+
+    _, k, n_fitted, mean_by_rank, std_by_rank = spec
+    depth = int(min(k, n_fitted, keys.shape[0]))
+    order = order_by_keys(keys, depth)
+    gains = take_along_players(points, order)
+    scored = np.isfinite(take_along_players(keys, order))
+    differences = gains - mean_by_rank[:depth].reshape((-1, 1, 1))
+    if std_by_rank is not None:
+        differences /= std_by_rank[:depth].reshape((-1, 1, 1))
+    # average difference of the underperforming ranks
+    with np.errstate(invalid='ignore', divide='ignore'):
+        underperforming = scored & (differences < 0)
+        return np.where(underperforming, differences, 0).sum(axis=0) / underperforming.sum(axis=0)
@@ -0,0 +1,117 @@
+""" Sweeps of the scoring depth k: the scores at every depth from 1 to K from cumulative sums over one sort """
+
+import numpy as np
+import pandas as pd
+
+from metrics import BaseScorer, discount_table
+
+
+def points_by_rank(ranks, points, max_k):
+    """
+    Points of the first max_k ranked players of each expert (players are ordered as by the scorers)
+    :param ranks: DataFrame of ranks (players x experts)
+    :param points: Series of points scored indexed by player
+    :param max_k: depth
+    :return: array (max_k x experts), NaN past the end of an expert's scored players
+    """
+    matrix = np.full((max_k, ranks.shape[1]), np.nan)
+    for j, expert in enumerate(ranks.columns):
+        ordered = np.asarray(BaseScorer.sort_points_by_rank(ranks[expert], points, max_k), dtype=float)
+        matrix[:ordered.shape[0], j] = ordered
+    return matrix
+
+
+def dcg_curves(scorer, ranks, max_k):
+    """
+    Scores of a fitted DCGScorer at every depth k = 1..max_k (the scorer's own k is ignored): the DCG at depth k is
+    the cumulative sum of the discounted gains of the first k players, and so is the ideal DCG normalizing it
+    :param scorer: DCGScorer fitted to a week's points
+    :param ranks: DataFrame of ranks (players x experts)
+    :param max_k: deepest depth
+    :return: DataFrame of scores (depths 1..max_k x experts), NaN where the ideal DCG is not positive
+    """
+    discounts = discount_table(max_k)[:, None]
+    curves = np.cumsum(_gains(scorer, points_by_rank(ranks, scorer.points_, max_k)) / discounts, axis=0)
+    if scorer.normalize:
+        points = np.asarray(scorer.points_, dtype=float)
+        ideal = np.full((max_k, 1), np.nan)
+        best = -np.sort(-points[~np.isnan(points)])[:max_k]
+        ideal[:best.shape[0], 0] = best
+        ideal = np.cumsum(_gains(scorer, ideal) / discounts, axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            curves = np.where(ideal > 0, curves / ideal, np.nan)
+    return _curve_frame(curves, ranks.columns)
+
+
+def difference_curves(scorer, ranks, points, max_k):
+    """
+    Scores of a fitted DifferenceScorer at every depth k = 1..max_k (the scorer's own k is ignored): the mean of
+    the underperforming differences of the first k players, from the cumulative sums of the differences and of
+    their count
+    :param scorer: DifferenceScorer fitted to weekly points
+    :param ranks: DataFrame of ranks (players x experts)
+    :param points: Series of points scored indexed by player
+    :param max_k: deepest depth
+    :return: DataFrame of scores (depths 1..max_k x experts), NaN at depths without underperforming players
+    """
+    # depths beyond the fitted ranks score the fitted ranks only, as the scorer does
+    depth = min(max_k, scorer.n_fitted_points_)
+    differences = points_by_rank(ranks, points, depth) - scorer.points_mean_by_rank_[:depth, None]
+    if scorer.standardize:
+        differences /= scorer.points_std_by_rank_[:depth, None]
+    with np.errstate(invalid='ignore'):
+        under = differences < 0
+    totals = np.cumsum(np.where(under, differences, 0.), axis=0)
+    counts = np.cumsum(under, axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        curves = np.where(counts > 0, totals / counts, np.nan)
+    curves = np.vstack([curves, np.repeat(curves[-1:], max_k - depth, axis=0)])
+    return _curve_frame(curves, ranks.columns)
+
+
+def orderings(curves):
+    """
+    Ordering of the experts (1 for the highest score) at every depth
+    :param curves: DataFrame of scores (depths x experts), higher is better
+    :return: DataFrame of orderings (depths x experts); experts without a score come last, ties in column order
+    """
+    keys = np.where(np.isnan(curves.values), np.inf, -curves.values)
+    order = np.argsort(keys, axis=1, kind='mergesort')
+    positions = np.empty(keys.shape)
+    positions[np.arange(keys.shape[0])[:, None], order] = np.arange(1., keys.shape[1] + 1)
+    return pd.DataFrame(positions, index=curves.index, columns=curves.columns)
+
+
+def composite_curves(curves_by_metric):
+    """
+    Composite of the experts at every depth: the sum of their orderings by each metric, as in the driver
+    :param curves_by_metric: dict mapping metric to DataFrame of scores (depths x experts)
+    :return: DataFrame of composites (depths x experts), lower is better
+    """
+    return sum(orderings(curves) for curves in curves_by_metric.values())
+
+
+def ordering_changes(composite):
+    """
+    Depths at which the ordering of the experts by composite differs from the ordering at the previous depth
+    :param composite: DataFrame of composites (depths x experts), lower is better
+    :return: list of depths
+    """
+    order = np.argsort(composite.values, axis=1, kind='mergesort')
+    changed = np.any(order[1:] != order[:-1], axis=1)
+    return list(composite.index[1:][changed])
+
+
+def _gains(scorer, points):
+    """
+    Gains (numerators of the DCG) of points by rank, zero past the end of the ranked players
+    :param scorer: DCGScorer
+    :param points: array of points by rank, NaN past the end of the ranked players
+    :return:
+    """
+    scored = ~np.isnan(points)
+    return np.where(scored, scorer.numerator_func(np.where(scored, points, 0.)), 0.)
+
+
+def _curve_frame(curves, experts):
+    return pd.DataFrame(curves, index=pd.Index(np.arange(1, curves.shape[0] + 1), name='k'), columns=experts)
@@ -1,52 +1,207 @@
 """ Class for scraping tables from HTML using BeautifulSoup """
 
+import codecs
 import os
+import re
+import time
 import ujson as json
+from collections import deque
 from contextlib import closing
-from bs4 import BeautifulSoup
+from cStringIO import StringIO
+from htmlentitydefs import name2codepoint
+from HTMLParser import HTMLParser
+from bs4 import BeautifulSoup, CData, NavigableString
+from bs4.builder import builder_registry
 from urllib2 import urlopen, URLError
+from yafsa import instrument
+
+
+# number of bytes read at a time when streaming a table without a chunk_size
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# parser backends: BeautifulSoup tree builders, or 'table', a minimal tokenizer for <table>/<tr>/<th>/<td>
+PARSERS = ('html.parser', 'lxml', 'table')
+
+# tags understood by the 'table' tokenizer (span is needed to emulate replace_span_tag)
+TABLE_TOKEN_RE = re.compile(r'<(/?)(table|tr|th|td|span)\b[^>]*>|<!--.*?-->', re.IGNORECASE | re.DOTALL)
+TAG_RE = re.compile(r'<[^>]*>')
+# character and entity references in cell text
+REFERENCE_RE = re.compile(r'&(#[xX][0-9a-fA-F]+|#\d+|[A-Za-z][A-Za-z0-9]*);')
 
 
 # TODO: move away from urllib2 to requests
 
 
+class ScrapeError(IOError):
+
+    """ Raised by TableScraper.iter_table for a page that could not be fetched or read """
+
+
 class TableScraper(object):
 
     """ Class for scraping tables from HTML using BeautifulSoup """
 
-    def __init__(self, header_rows_to_skip=0, chunk_size=None, replace_span_tag=True):
+    def __init__(self, header_rows_to_skip=0, chunk_size=None, replace_span_tag=True, parser='html.parser',
+                 cache=None, schema=None, transport=None):
         """
         :param header_rows_to_skip: number of leading rows of scraped table to skip
-        :param chunk_size: number of rows to read at a time
+        :param chunk_size: number of bytes to read at a time (tables are then parsed incrementally)
         :param replace_span_tag: bool indicating whether to replace </span> with </th> for processing header labels
+        :param parser: parser backend for whole-page parsing, one of PARSERS ('lxml' requires lxml)
+        :param cache: optional ResponseCache through which pages are fetched
+        :param schema: optional TableSchema (see yafsa.schema) normalizing, projecting and parsing records as they
+            are scraped, leaving out records that do not conform
+        :param transport: optional transport through which pages are opened instead of urllib2.urlopen, e.g., an
+            HTTPTransport reusing connections or a FakeTransport (see yafsa.transport)
         """
+        if parser not in PARSERS:
+            raise ValueError('Specify parser as one of %s' % ', '.join(PARSERS))
+        if parser != 'table' and builder_registry.lookup(parser) is None:
+            raise ValueError('Parser backend \'%s\' is not installed' % parser)
         self.header_rows_to_skip = int(header_rows_to_skip)
         self.chunk_size = max(0, chunk_size)
         self.replace_span_tag = replace_span_tag
+        self.parser = parser
+        self.cache = cache
+        self.schema = schema
+        self.transport = transport
 
     def scrape_table(self, url):
         """
         Scrape table from url into list of records, one for each row
         :param url: string
-        :return:
+        :return: list of records (empty for a page without rows), None if the page could not be fetched or read
+            (e.g., a network error, or a schema rejecting every record), so that failures are not mistaken for
+            empty tables
         """
-        if self.chunk_size > 0:
-            table_parser = self._parse_table_chunked
-        else:
-            table_parser = self._parse_table
-
         try:
+            start = time.time()
             # urllib2 doesn't implement 'with' so need to use contextlib
-            with closing(urlopen(url)) as urlhandle:
-                records = table_parser(urlhandle)
+            with closing(instrument.TimedReader(self.open(url))) as urlhandle:
+                open_seconds = time.time() - start
+                records = self.parse(urlhandle)
         except (URLError, ValueError):
             print 'Could not open url: %s' % url
-            return []
+            return None
         except IndexError as e:
             print e.message
             return []
+        _record_table(open_seconds, time.time() - start - open_seconds, urlhandle, len(records))
         return records
 
+    def __getstate__(self):
+        """
+        Pickle without the response cache (caches are not shared with worker processes)
+        :return:
+        """
+        state = self.__dict__.copy()
+        state['cache'] = None
+        return state
+
+    def open(self, url):
+        """
+        Open url for reading, through the response cache if there is one and then through the transport
+        :param url: string
+        :return: file-like handle
+        """
+        if self.cache is not None:
+            return self.cache.open(url)
+        if self.transport is not None:
+            return self.transport.open(url)
+        return urlopen(url)
+
+    def iter_table(self, url):
+        """
+        Stream table from url as records, one for each row, yielded while the page is being read
+        :param url: string
+        :return: generator of records, raising ScrapeError (after any records already yielded) if the page could not
+            be fetched or read
+        """
+        try:
+            start = time.time()
+            with closing(instrument.TimedReader(self.open(url))) as urlhandle:
+                open_seconds = time.time() - start
+                # time spent by the consumer between records is not part of scraping
+                busy_seconds, rows, resumed = 0., 0, time.time()
+                for record in self._apply_schema(self.iter_records(urlhandle)):
+                    busy_seconds += time.time() - resumed
+                    rows += 1
+                    yield record
+                    resumed = time.time()
+                busy_seconds += time.time() - resumed
+            _record_table(open_seconds, busy_seconds, urlhandle, rows)
+        except (URLError, ValueError) as e:
+            raise ScrapeError('Could not open url: %s (%s)' % (url, e))
+        except IndexError as e:
+            print e.message
+
+    def iter_records(self, urlhandle):
+        """
+        Incrementally parse the first table read from a file-like handle, yielding records as rows complete
+        :param urlhandle: object with a read method
+        :return: generator of records
+        """
+        chunk_size = self.chunk_size or STREAM_CHUNK_SIZE
+        decoder = codecs.getincrementaldecoder(_charset(urlhandle))('replace')
+        parser = _TableEventParser(self.replace_span_tag)
+
+        rows_to_skip = self.header_rows_to_skip
+        column_labels = None
+        while True:
+            chunk = urlhandle.read(chunk_size)
+            if chunk:
+                parser.feed(decoder.decode(chunk))
+            else:
+                parser.feed(decoder.decode('', final=True))
+                parser.close()
+
+            while parser.rows:
+                row = parser.rows.popleft()
+                if rows_to_skip > 0:
+                    rows_to_skip -= 1
+                elif column_labels is None:
+                    column_labels = [text for tag, text in row if tag == 'th']
+                else:
+                    yield self._row_record(row, column_labels)
+
+            if not chunk or parser.done:
+                break
+
+        if column_labels is None:
+            raise IndexError('No rows to process: try reducing header_rows_to_skip')
+
+    def parse(self, urlhandle):
+        """
+        Parse table from an open file-like handle into list of records, one for each row
+        :param urlhandle: object with a read method
+        :return:
+        """
+        if self.chunk_size > 0:
+            records = self._parse_table_chunked(urlhandle)
+        else:
+            records = self._parse_table(urlhandle)
+        return records if self.schema is None else list(self.schema.apply(records))
+
+    def parse_page(self, page):
+        """
+        Parse table from an already downloaded page into list of records, one for each row
+        :param page: string of html
+        :return:
+        """
+        try:
+            return self.parse(StringIO(page))
+        except IndexError as e:
+            print e.message
+            return []
+
+    def _apply_schema(self, records):
+        """
+        Records parsed by the scraper's schema (as they are, without a schema)
+        :param records: iterable of records
+        :return: iterable of records
+        """
+        return records if self.schema is None else self.schema.apply(records)
+
     @staticmethod
     def _parse_columns(row):
         """
@@ -63,12 +218,32 @@ class TableScraper(object):
         :return:
         """
         if self.replace_span_tag:
-            # there is likely a more efficient way to find/replace
-            header_soup = BeautifulSoup(str(header_row).replace('</span>', '</th>'), 'html.parser')
-        else:
-            header_soup = header_row
-        column_labels = [h.text.strip() for h in header_soup.find_all('th')]
-        return column_labels
+            return [self._header_text(h).strip() for h in header_row.find_all('th')]
+        return [h.text.strip() for h in header_row.find_all('th')]
+
+    @staticmethod
+    def _header_text(header):
+        """
+        Text of a header cell up to its first </span>, which is what remains when </span> is replaced by </th>
+        (without re-parsing the header)
+        :param header: th element
+        :return:
+        """
+        span = header.find('span')
+        if span is None:
+            return header.text
+        # the first </span> closes the innermost of the leading nested spans
+        inner = span.find('span')
+        while inner is not None:
+            span, inner = inner, inner.find('span')
+        texts = []
+        for node in header.descendants:
+            if node is span:
+                texts.append(span.text)
+                break
+            if type(node) in (NavigableString, CData):
+                texts.append(node)
+        return u''.join(texts)
 
     def _prepare_rows(self, rows):
         """
@@ -97,7 +272,9 @@ class TableScraper(object):
         :return:
         """
         page = urlhandle.read()
-        soup = BeautifulSoup(page, 'html.parser')
+        if self.parser == 'table':
+            return self._parse_table_tokens(page)
+        soup = BeautifulSoup(page, self.parser)
         # get table and rows
         table = soup.find('table')
         rows = table.find_all('tr')
@@ -109,71 +286,239 @@ class TableScraper(object):
         records = self._parse_rows(rows, column_labels)
         return records
 
+    def _parse_table_tokens(self, page):
+        """
+        Parse table into row records with the minimal table tokenizer
+        :param page: string of html
+        :return:
+        """
+        rows = _tokenize_table(page.decode('utf-8', 'replace'), self.replace_span_tag)
+        rows = self._prepare_rows(rows)
+        column_labels = [text for tag, text in rows.pop(0) if tag == 'th']
+        return [self._row_record(row, column_labels) for row in rows]
+
+    @staticmethod
+    def _row_record(row, labels):
+        """
+        Build a dict record from the (tag, text) cells of a row, using its td cells
+        :param row: list of (tag, text) tuples
+        :param labels: column labels to be used as keys
+        :return:
+        """
+        return {label: text for label, text in zip(labels, (text for tag, text in row if tag == 'td'))}
+
     def _parse_table_chunked(self, urlhandle):
         """
         Parse table into row records, reading from the url in chunks
         :param urlhandle:
         :return:
         """
-        all_records = []
+        return list(self.iter_records(urlhandle))
 
-        # initially column labels have not been parsed
-        n_columns = 0
-        column_labels = None
-        # initially there is no split row to reconcile between chunks
-        reconcile_split_row = False
-        split_row_part1 = None
-        joined_record = None
 
-        while True:
-            # read chunk of data, break out of loop if no chunks remain
-            chunk = urlhandle.read(self.chunk_size)
-            if not chunk:
-                break
+class _TableEventParser(HTMLParser):
+
+    """
+    Event-driven parser collecting the rows of the first table in a document
+
+    Completed rows are appended to `rows` as lists of (tag, text) cells as soon as they close, so rows split
+    across fed chunks are simply completed by a later feed.  With replace_span_tag, a </span> closes the
+    enclosing header cell, mirroring the </span> -> </th> replacement used for BeautifulSoup header parsing.
+    Rows and cells can also be built directly (start_row, start_cell, add_text, end_cell, end_row), e.g., by a
+    tokenizer that does not feed the parser.
+    """
+
+    def __init__(self, replace_span_tag=True):
+        HTMLParser.__init__(self)
+        self.replace_span_tag = replace_span_tag
+        self.rows = deque()
+        self.done = False
+        self._table_depth = 0
+        self._row = None
+        self._cell = None
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if tag == 'table':
+            self._table_depth += 1
+        elif self._table_depth != 1:
+            return
+        elif tag == 'tr':
+            self.start_row()
+        elif tag in ('td', 'th'):
+            self.start_cell(tag)
+
+    def handle_endtag(self, tag):
+        if self.done or self._table_depth == 0:
+            return
+        if tag == 'table':
+            self._table_depth -= 1
+            if self._table_depth == 0:
+                self.end_row()
+                self.done = True
+        elif self._table_depth != 1:
+            return
+        elif tag == 'tr':
+            self.end_row()
+        elif tag in ('td', 'th'):
+            self.end_cell()
+        elif tag == 'span' and self.replace_span_tag and self._cell and self._cell[0] == 'th':
+            self.end_cell()
+
+    def handle_data(self, data):
+        self.add_text(data)
 
-            # read current chunk and extract rows
-            soup = BeautifulSoup(chunk, 'html.parser')
-            rows = soup.find_all('tr')
-
-            # extract header information if it has not yet been parsed
-            # (should be when the current chunk is the first chunk)
-            if column_labels is None:
-                rows = self._prepare_rows(rows)
-                header = rows.pop(0)
-                column_labels = self._get_column_labels(header)
-                n_columns = len(column_labels)
-
-            # if previous chunk's last row extends into current chunk,
-            # join the two parts of the split row and parse the joined row
-            if reconcile_split_row and split_row_part1:
-                (split_row_part2, _, _) = chunk.partition('</tr>')
-                joined_soup = BeautifulSoup('<tr>%s%s</tr>' % (split_row_part1, split_row_part2),
-                                            'html.parser')
-                joined_row = joined_soup.find_all('tr')
-                joined_record = self._parse_rows(joined_row, column_labels)
-
-            # parse rows and combine with reconciled row if necessary
-            records = self._parse_rows(rows, column_labels)
-            if reconcile_split_row and joined_record:
-                records = joined_record + records
-
-            # check if last record is incomplete (split between two chunks)
-            reconcile_split_row = (len(records[-1]) < n_columns)
-            # if yes, remove last (incomplete) record and save off the incomplete
-            # row data to be reconciled in the next iteration
-            if reconcile_split_row:
-                records.pop()
-                (_, _, split_row_part1) = chunk.rpartition('<tr>')
-
-            all_records.extend(records)
-
-        return all_records
+    def handle_entityref(self, name):
+        self.add_text(_reference_text(name))
+
+    def handle_charref(self, name):
+        self.add_text(_reference_text('#%s' % name))
+
+    @property
+    def in_cell(self):
+        """
+        Whether a cell is open (text added now belongs to it)
+        :return:
+        """
+        return self._cell is not None
+
+    def start_row(self):
+        """
+        Open a row, ending the open row if any
+        :return:
+        """
+        self.end_row()
+        self._row = []
+
+    def start_cell(self, tag):
+        """
+        Open a cell, ending the open cell if any (and opening a row if none is open)
+        :param tag: 'td' or 'th'
+        :return:
+        """
+        self.end_cell()
+        if self._row is None:
+            self._row = []
+        self._cell = (tag, [])
+
+    def add_text(self, text):
+        """
+        Add text to the open cell (text outside cells is ignored)
+        :param text: unicode string, already unescaped
+        :return:
+        """
+        if self._cell is not None:
+            self._cell[1].append(text)
+
+    def end_cell(self):
+        """
+        Close the open cell, adding it to its row
+        :return:
+        """
+        if self._cell is not None:
+            tag, texts = self._cell
+            self._row.append((tag, u''.join(texts).strip()))
+            self._cell = None
+
+    def end_row(self):
+        """
+        Close the open cell and row, adding the row to rows
+        :return:
+        """
+        self.end_cell()
+        if self._row is not None:
+            self.rows.append(self._row)
+            self._row = None
+
+
+def _tokenize_table(page, replace_span_tag=True):
+    """
+    Split the first table of a page into rows of (tag, text) cells, looking only at table, row, cell and
+    span tags and stripping any other markup from cell text
+    :param page: unicode string of html
+    :param replace_span_tag: bool indicating whether </span> closes an enclosing header cell
+    :return: list of rows
+    """
+    collector = _TableEventParser(replace_span_tag)
+    position = 0
+    for match in TABLE_TOKEN_RE.finditer(page):
+        if collector.done:
+            break
+        if collector.in_cell and match.start() > position:
+            collector.add_text(_unescape(TAG_RE.sub('', page[position:match.start()])))
+        position = match.end()
+        if match.group(2) is None:  # comment
+            continue
+        tag = match.group(2).lower()
+        if match.group(1):
+            collector.handle_endtag(tag)
+        else:
+            collector.handle_starttag(tag, [])
+    collector.end_row()
+    return list(collector.rows)
+
+
+def _reference_text(name):
+    """
+    Text of a character or entity reference (the reference itself if it is not known)
+    :param name: entity name, or '#' followed by a decimal or 'x' and a hexadecimal code point
+    :return: unicode string
+    """
+    if name[:1] == '#':
+        try:
+            return unichr(int(name[2:], 16) if name[1:2] in ('x', 'X') else int(name[1:]))
+        except ValueError:
+            return u'&%s;' % name
+    codepoint = name2codepoint.get(name)
+    return unichr(codepoint) if codepoint else u'&%s;' % name
+
+
+def _unescape(text):
+    """
+    Replace the character and entity references of text
+    :param text: unicode string
+    :return:
+    """
+    if '&' not in text:
+        return text
+    return REFERENCE_RE.sub(lambda match: _reference_text(match.group(1)), text)
+
+
+def _record_table(open_seconds, read_and_parse_seconds, urlhandle, rows):
+    """
+    Add the timings and counters of a scraped table to the instrumentation registry
+    :param open_seconds: time spent opening the url
+    :param read_and_parse_seconds: time spent reading and parsing the page
+    :param urlhandle: TimedReader the page was read through
+    :param rows: number of records parsed
+    :return:
+    """
+    instrument.record('scrape.network', open_seconds + urlhandle.elapsed)
+    instrument.record('scrape.parse', read_and_parse_seconds - urlhandle.elapsed)
+    instrument.count('scrape.tables')
+    instrument.count('scrape.bytes', urlhandle.bytes)
+    instrument.count('scrape.rows', rows)
+
+
+def _charset(urlhandle):
+    """
+    Character set declared by the response headers of a url handle (utf-8 if not declared)
+    :param urlhandle:
+    :return:
+    """
+    try:
+        charset = urlhandle.info().getparam('charset')
+        codecs.lookup(charset)
+        return charset
+    except (AttributeError, TypeError, LookupError):
+        return 'utf-8'
 
 
 def write_to_file(records, outdir, outfile):
     """
-    Write records to json file
-    :param records:
+    Write records to json file, one record at a time so that streamed records are never held in memory
+    :param records: iterable of records
     :param outdir:
     :param outfile:
     :return:
@@ -183,5 +528,8 @@ def write_to_file(records, outdir, outfile):
     outfile = '%s.%s' % (os.path.splitext(outfile)[0], 'json')  # ensure file has extension
     full_file_name = os.path.join(outdir, outfile)
     with open(full_file_name, 'w') as f:
-        f.write(json.dumps(records))
+        f.write('[')
+        for i, record in enumerate(records):
+            f.write('%s%s' % (',' if i else '', json.dumps(record)))
+        f.write(']')
     return full_file_name
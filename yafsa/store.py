@@ -0,0 +1,289 @@
+""" Columnar, compressed on-disk store for scraped records: one file per season, partitioned by week/position/source """
+
+import gzip
+import os
+import re
+import ujson as json
+import numpy as np
+import pandas as pd
+
+
+PARTITION_KEYS = ('week', 'position', 'source')
+
+# largest value stored as int16 by typed reads
+INT16_MAX = np.iinfo(np.int16).max
+
+# file names written by write_to_file in the per-file JSON layout
+LEGACY_FILE_PATTERN = re.compile(r'^(?P<year>\d+)_week=(?P<week>\d+)_pos(?:ition)?=(?P<position>[A-Z]+)'
+                                 r'(?:_source=(?P<source>\d+))?\.json$')
+
+
+class SeasonStore(object):
+
+    """
+    Store of scraped tables in one gzipped columnar JSON file per season
+
+    Each season file holds a list of partitions, one per scraped table, keyed by week, position and source
+    (None for tables without a source).  Columns of a partition are stored as lists, in the order in which
+    they first appear in the scraped records.  Season files are read at most once and kept in memory, so
+    loading every partition of a season costs a single file read.
+    """
+
+    def __init__(self, directory):
+        """
+        :param directory: directory holding the season files
+        """
+        self.directory = directory
+        # year -> {partition key tuple -> partition}, populated lazily
+        self._seasons = {}
+        self._dirty = set()
+
+    def path(self, year):
+        """
+        Path of the file for a season
+        :param year:
+        :return:
+        """
+        return os.path.join(self.directory, '%s.json.gz' % year)
+
+    def write(self, records, year, week, position, source=None):
+        """
+        Add (or replace) the partition for a scraped table; call flush to persist
+        :param records: iterable of dict records, one for each row
+        :param year:
+        :param week:
+        :param position:
+        :param source: ranking source (None for sources without one)
+        :return: number of records written
+        """
+        year = int(year)
+        labels = []
+        columns = {}
+        n_rows = 0
+        for row, record in enumerate(records):
+            for label, value in record.iteritems():
+                if label not in columns:
+                    labels.append(label)
+                    columns[label] = [None] * row
+                columns[label].append(value)
+            n_rows = row + 1
+            # pad columns missing from this record
+            for label in labels:
+                if len(columns[label]) < n_rows:
+                    columns[label].append(None)
+
+        partition = {'week': int(week), 'position': position, 'source': _int_or_none(source),
+                     'labels': labels, 'columns': [columns[label] for label in labels], 'rows': n_rows}
+        self._season(year)[_partition_key(partition)] = partition
+        self._dirty.add(year)
+        return n_rows
+
+    def flush(self):
+        """
+        Write every modified season to disk
+        :return: list of file names written
+        """
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        written = []
+        for year in sorted(self._dirty):
+            partitions = sorted(self._seasons[year].values(), key=_partition_sort_key)
+            full_file_name = self.path(year)
+            tmp_file_name = '%s.tmp' % full_file_name
+            with _open_gzip(tmp_file_name, 'wb') as f:
+                f.write(json.dumps({'year': year, 'partitions': partitions}))
+            os.rename(tmp_file_name, full_file_name)
+            written.append(full_file_name)
+        self._dirty.clear()
+        return written
+
+    def partitions(self, year, week=None, position=None, source=None):
+        """
+        Keys of the stored partitions matching the predicates
+        :param year:
+        :param week: week or collection of weeks (all if None)
+        :param position: position or collection of positions (all if None)
+        :param source: source or collection of sources (all if None)
+        :return: sorted list of (week, position, source) tuples
+        """
+        return [_partition_key(p) for p in self._select(year, week, position, source)]
+
+    def read_partitions(self, year, week=None, position=None, source=None, columns=None, exclude=None, typed=False):
+        """
+        Read the partitions matching the predicates, filtering before any DataFrame is built
+        :param year:
+        :param week: week or collection of weeks (all if None)
+        :param position: position or collection of positions (all if None)
+        :param source: source or collection of sources (all if None)
+        :param columns: labels of the columns to read (all if None)
+        :param exclude: labels of columns not to read
+        :param typed: parse columns of numbers and empty strings into compact dtypes (int16 for complete integer
+            columns, float32 with NaN for missing values otherwise) instead of leaving any column with an empty
+            string as text
+        :return: generator of ((week, position, source), DataFrame) tuples
+        """
+        for partition in self._select(year, week, position, source):
+            yield _partition_key(partition), _to_frame(partition, columns, exclude, typed)
+
+    def read(self, year, week=None, position=None, source=None, columns=None, exclude=None, typed=False):
+        """
+        Read the partitions matching the predicates into a single DataFrame with partition key columns
+        :param year:
+        :param week: week or collection of weeks (all if None)
+        :param position: position or collection of positions (all if None)
+        :param source: source or collection of sources (all if None)
+        :param columns: labels of the columns to read (all if None)
+        :param exclude: labels of columns not to read
+        :param typed: parse numeric columns into compact dtypes (see read_partitions)
+        :return:
+        """
+        frames = []
+        for (wk, pos, src), df in self.read_partitions(year, week, position, source, columns, exclude, typed):
+            frames.append(df.assign(year=int(year), week=wk, position=pos, source=src))
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
+
+    def _select(self, year, week, position, source):
+        """
+        Partitions of a season matching the predicates
+        :return:
+        """
+        predicates = [_as_predicate(week), _as_predicate(position), _as_predicate(source)]
+        season = self._season(year)
+        return [season[key] for key in sorted(season, key=_key_sort_key)
+                if all(predicate(value) for predicate, value in zip(predicates, key))]
+
+    def _season(self, year):
+        """
+        Partitions of a season, reading the season file on first access
+        :param year:
+        :return: dict mapping partition key to partition
+        """
+        year = int(year)
+        if year not in self._seasons:
+            season = {}
+            if os.path.exists(self.path(year)):
+                with _open_gzip(self.path(year), 'rb') as f:
+                    for partition in json.loads(f.read())['partitions']:
+                        season[_partition_key(partition)] = partition
+            self._seasons[year] = season
+        return self._seasons[year]
+
+
+def import_legacy_files(store, directory):
+    """
+    Load files written by write_to_file (one JSON file per table) into a store; call store.flush to persist
+    :param store: SeasonStore
+    :param directory: directory holding the JSON files
+    :return: number of files imported
+    """
+    n_files = 0
+    for file_name in sorted(os.listdir(directory)):
+        match = LEGACY_FILE_PATTERN.match(file_name)
+        if not match:
+            continue
+        with open(os.path.join(directory, file_name)) as f:
+            records = json.loads(f.read())
+        store.write(records, match.group('year'), match.group('week'), match.group('position'),
+                    match.group('source'))
+        n_files += 1
+    return n_files
+
+
+def _open_gzip(file_name, mode):
+    """
+    Open a gzip file (gzip.open supports 'with' on Python 2.7)
+    :param file_name:
+    :param mode:
+    :return:
+    """
+    return gzip.open(file_name, mode, 6)
+
+
+def _to_frame(partition, columns=None, exclude=None, typed=False):
+    """
+    Build a DataFrame from a stored partition, keeping only the requested columns
+    :param partition:
+    :param columns: labels of the columns to keep (all if None)
+    :param exclude: labels of columns to leave out
+    :param typed: parse numeric columns into compact dtypes
+    :return:
+    """
+    columns = _as_label_set(columns)
+    exclude = _as_label_set(exclude) or set()
+    labels = [label for label in partition['labels']
+              if (columns is None or label in columns) and label not in exclude]
+    convert = _convert_column_compact if typed else _convert_column
+    data = {label: convert(values) for label, values in zip(partition['labels'], partition['columns'])
+            if label in labels}
+    return pd.DataFrame(data, index=range(partition['rows']), columns=labels)
+
+
+def _as_label_set(labels):
+    if labels is None:
+        return None
+    return set(labels if isinstance(labels, (list, tuple, set)) else [labels])
+
+
+def _convert_column(values):
+    """
+    Convert a column of scraped strings to floats if every value parses, as pd.read_json does
+    :param values: list of values
+    :return:
+    """
+    try:
+        return np.array(values, dtype=float)
+    except (TypeError, ValueError):
+        return values
+
+
+def _convert_column_compact(values):
+    """
+    Convert a column of scraped strings to a compact numeric array if every value parses or is empty: int16 if
+    every value is an integer in range, float32 (NaN for empty values) otherwise
+    :param values: list of values
+    :return:
+    """
+    try:
+        array = np.array(values, dtype=float)
+    except (TypeError, ValueError):
+        try:
+            array = np.array([np.nan if value in ('', None) else value for value in values], dtype=float)
+        except (TypeError, ValueError):
+            return values
+    if not np.isnan(array).any() and (array == np.round(array)).all() and (np.abs(array) <= INT16_MAX).all():
+        return array.astype(np.int16)
+    return array.astype(np.float32)
+
+
+def _as_predicate(value):
+    """
+    Build a membership predicate from a scalar, collection or None (matches everything)
+    :param value:
+    :return:
+    """
+    if value is None:
+        return lambda x: True
+    if isinstance(value, (list, tuple, set, frozenset, xrange)):
+        allowed = set(str(v) for v in value)
+    else:
+        allowed = {str(value)}
+    return lambda x: str(x) in allowed
+
+
+def _int_or_none(value):
+    return None if value is None else int(value)
+
+
+def _partition_key(partition):
+    return tuple(partition[key] for key in PARTITION_KEYS)
+
+
+def _key_sort_key(key):
+    week, position, source = key
+    return week, position, source or 0
+
+
+def _partition_sort_key(partition):
+    return _key_sort_key(_partition_key(partition))
@@ -0,0 +1,421 @@
+""" HTTP transports for TableScraper: keep-alive connection pools with compressed responses, and an in-memory fake """
+
+import httplib
+import socket
+import threading
+import time
+import zlib
+from collections import deque, namedtuple
+from cStringIO import StringIO
+from urllib2 import HTTPError, Request, URLError
+from urlparse import urljoin, urlsplit
+from yafsa import instrument
+
+
+# statuses followed to the Location header
+REDIRECT_CODES = (301, 302, 303, 307)
+
+# number of bytes read from the socket at a time
+READ_SIZE = 64 * 1024
+
+# one request (redirects are separate requests): bytes on the wire, bytes after decoding, seconds until the
+# response headers and until the end of the body, whether the connection was reused
+RequestStats = namedtuple('RequestStats', ['url', 'code', 'bytes_received', 'bytes_decoded', 'latency', 'seconds',
+                                           'reused'])
+
+
+class HTTPTransport(object):
+
+    """
+    Opens urls over persistent connections, one pool of idle keep-alive connections per host
+
+    A response returns its connection to the pool once its body has been read to the end (a response closed
+    early closes its connection instead).  Responses are requested with gzip/deflate compression and decoded as
+    they are read.  Statuses and errors are raised as by urllib2.urlopen (HTTPError, URLError), so a transport's
+    open can be used wherever urlopen is, e.g., as the opener of a ResponseCache.  Transports are thread-safe and
+    are pickled without their connections.
+    """
+
+    def __init__(self, timeout=30., max_idle_per_host=4, compress=True, headers=None, max_redirects=5,
+                 history=1000):
+        """
+        :param timeout: seconds to wait for a connection or for data on a socket
+        :param max_idle_per_host: number of idle connections kept open for each host
+        :param compress: request gzip/deflate compressed responses
+        :param headers: dict of headers sent with every request
+        :param max_redirects: number of redirects followed for a url
+        :param history: number of RequestStats kept in log
+        """
+        self.timeout = timeout
+        self.max_idle_per_host = max(0, max_idle_per_host)
+        self.compress = compress
+        self.headers = dict(headers or {})
+        self.max_redirects = max_redirects
+        self.history = history
+        self._init_state()
+
+    def _init_state(self):
+        # (scheme, host) -> list of idle connections
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.log = deque(maxlen=self.history)
+        self.totals = {'requests': 0, 'reused': 0, 'bytes_received': 0, 'bytes_decoded': 0, 'seconds': 0.}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ('_idle', '_lock', 'log', 'totals'):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_state()
+
+    @property
+    def stats(self):
+        """
+        Totals of the requests made: requests, reused (connections), bytes_received (on the wire), bytes_decoded,
+        seconds, and the number of idle connections
+        :return: dict
+        """
+        with self._lock:
+            stats = dict(self.totals)
+            stats['idle'] = sum(len(connections) for connections in self._idle.itervalues())
+        return stats
+
+    def open(self, request):
+        """
+        Open a url
+        :param request: url or urllib2 Request (its headers are sent, and its data with a POST)
+        :return: file-like response with read, close, info, geturl and getcode (and code)
+        """
+        if not isinstance(request, Request):
+            request = Request(request)
+        url = request.get_full_url()
+        headers = dict(self.headers)
+        if self.compress:
+            headers['Accept-Encoding'] = 'gzip, deflate'
+        headers.update(request.header_items())
+        for _ in xrange(self.max_redirects + 1):
+            response = self._send(url, headers, request.get_data())
+            location = response.info().getheader('Location')
+            if response.code not in REDIRECT_CODES or not location:
+                break
+            response.read()
+            url = urljoin(url, location)
+        if not 200 <= response.code < 300:
+            # read the body so that the connection can be reused
+            raise HTTPError(url, response.code, response.msg, response.info(), StringIO(response.read()))
+        return response
+
+    def close(self):
+        """
+        Close every idle connection
+        :return:
+        """
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.itervalues():
+            for connection in connections:
+                connection.close()
+
+    def _send(self, url, headers, data=None):
+        """
+        Send a request over a pooled connection, retrying a GET on another connection if a reused one was closed
+        by the server (a POST is not retried, since the server may have acted on it before closing)
+        :param url:
+        :param headers: dict
+        :param data: request body (POST), None for a GET
+        :return: _Response
+        """
+        scheme, host, path, query, _ = urlsplit(url)
+        if scheme not in ('http', 'https') or not host:
+            raise URLError('unknown url type: %s' % url)
+        selector = '%s%s' % (path or '/', '?%s' % query if query else '')
+        key = (scheme, host)
+        while True:
+            connection, reused = self._acquire(key)
+            start = time.time()
+            try:
+                connection.request('POST' if data is not None else 'GET', selector, data, headers)
+                raw = connection.getresponse()
+            except (httplib.HTTPException, socket.error) as e:
+                connection.close()
+                if reused and data is None:
+                    # idle keep-alive connections may have been closed by the server
+                    continue
+                raise URLError(e)
+            return _Response(self, key, connection, raw, url, reused, start)
+
+    def _acquire(self, key):
+        """
+        Take an idle connection to a host, or open a new one
+        :param key: (scheme, host)
+        :return: tuple (connection, whether it was reused)
+        """
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+        connection_class = httplib.HTTPSConnection if key[0] == 'https' else httplib.HTTPConnection
+        return connection_class(key[1], timeout=self.timeout), False
+
+    def _release(self, key, connection, stats):
+        """
+        Return a connection whose response was read to the end to the pool, and record the request
+        :param key: (scheme, host)
+        :param connection: connection to pool, None if it was closed
+        :param stats: RequestStats
+        :return:
+        """
+        with self._lock:
+            if connection is not None:
+                idle = self._idle.setdefault(key, [])
+                if len(idle) < self.max_idle_per_host:
+                    idle.append(connection)
+                    connection = None
+            _add_stats(self.log, self.totals, stats)
+        if connection is not None:
+            connection.close()
+        _record_request(stats)
+
+
+class FakeTransport(object):
+
+    """
+    In-memory transport serving fixed pages (e.g., for tests or offline runs), with the interface of HTTPTransport
+    """
+
+    def __init__(self, pages, headers=None, history=1000):
+        """
+        :param pages: dict mapping url to page body, or to a tuple (status code, body); urls not in pages are 404s
+        :param headers: dict of response headers (defaults to an html content type)
+        :param history: number of RequestStats kept in log
+        """
+        self.pages = pages
+        self.headers = headers or {'Content-Type': 'text/html; charset=utf-8'}
+        self.requests = []
+        self.log = deque(maxlen=history)
+        self.totals = {'requests': 0, 'reused': 0, 'bytes_received': 0, 'bytes_decoded': 0, 'seconds': 0.}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def stats(self):
+        """
+        Totals of the requests made, as for HTTPTransport
+        :return: dict
+        """
+        with self._lock:
+            stats = dict(self.totals)
+        stats['idle'] = 0
+        return stats
+
+    def open(self, request):
+        """
+        Open a url
+        :param request: url or urllib2 Request
+        :return: file-like response
+        """
+        url = request.get_full_url() if isinstance(request, Request) else request
+        page = self.pages.get(url, (404, ''))
+        code, body = page if isinstance(page, tuple) else (200, page)
+        headers = httplib.HTTPMessage(StringIO(''.join('%s: %s\r\n' % item for item in self.headers.iteritems())))
+        with self._lock:
+            self.requests.append(url)
+            _add_stats(self.log, self.totals, RequestStats(url, code, len(body), len(body), 0., 0., False))
+        if not 200 <= code < 300:
+            raise HTTPError(url, code, httplib.responses.get(code, ''), headers, StringIO(body))
+        return _FakeResponse(url, code, body, headers)
+
+    def close(self):
+        pass
+
+
+class _Response(object):
+
+    """ Response read from a pooled connection, decoded as it is read """
+
+    def __init__(self, transport, key, connection, raw, url, reused, start):
+        self.transport = transport
+        self.key = key
+        self.connection = connection
+        self.raw = raw
+        self.url = url
+        self.code = raw.status
+        self.msg = raw.reason
+        self.reused = reused
+        self.start = start
+        self.latency = time.time() - start
+        self.bytes_received = 0
+        self.bytes_decoded = 0
+        self._decoder = _decoder(raw.getheader('Content-Encoding', ''))
+        self._buffer = ''
+        self._finished = False
+
+    def info(self):
+        return self.raw.msg
+
+    def geturl(self):
+        return self.url
+
+    def getcode(self):
+        return self.code
+
+    def read(self, size=-1):
+        """
+        Read decoded bytes
+        :param size: number of bytes (to the end of the body if negative)
+        :return: string
+        """
+        while (size < 0 or len(self._buffer) < size) and not self._finished:
+            self._fill(whole=size < 0)
+        if size < 0 or size >= len(self._buffer):
+            data, self._buffer = self._buffer, ''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def close(self):
+        """
+        Close the response; a response not read to the end closes its connection
+        :return:
+        """
+        self._finish(reusable=False)
+
+    def _fill(self, whole):
+        """
+        Read from the socket into the buffer of decoded bytes, releasing the connection at the end of the body
+        :param whole: read the rest of the body at once
+        :return:
+        """
+        try:
+            chunk = self.raw.read(None if whole else READ_SIZE)
+            if not chunk and self.raw.length:
+                # httplib returns a body cut short by a closed connection as if it were complete
+                raise httplib.IncompleteRead('', self.raw.length)
+            self.bytes_received += len(chunk)
+            if self._decoder is None:
+                decoded = chunk
+            else:
+                decoded = self._decoder.decompress(chunk) if chunk else self._decoder.flush()
+        except (httplib.HTTPException, socket.error, zlib.error) as e:
+            self._finish(reusable=False)
+            raise URLError(e)
+        self.bytes_decoded += len(decoded)
+        self._buffer += decoded
+        if not chunk:
+            self._finish(reusable=True)
+
+    def _finish(self, reusable):
+        """
+        Release the connection (to the pool if the body was read to the end) and record the request, once
+        :param reusable: whether the body was read to the end
+        :return:
+        """
+        if self._finished:
+            return
+        self._finished = True
+        connection, self.connection = self.connection, None
+        if not reusable or self.raw.will_close:
+            connection.close()
+            connection = None
+        self.transport._release(self.key, connection, RequestStats(
+            self.url, self.code, self.bytes_received, self.bytes_decoded, self.latency, time.time() - self.start,
+            self.reused))
+
+
+class _FakeResponse(object):
+
+    """ Response of a FakeTransport """
+
+    def __init__(self, url, code, body, headers):
+        self.url = url
+        self.code = code
+        self.msg = httplib.responses.get(code, '')
+        self.headers = headers
+        self._body = StringIO(body)
+
+    def info(self):
+        return self.headers
+
+    def geturl(self):
+        return self.url
+
+    def getcode(self):
+        return self.code
+
+    def read(self, size=-1):
+        return self._body.read(size)
+
+    def close(self):
+        self._body.close()
+
+
+class _DeflateDecoder(object):
+
+    """ Decoder of deflate content, which servers send with or without the zlib wrapper """
+
+    def __init__(self):
+        self._decoder = zlib.decompressobj()
+        self._started = False
+
+    def decompress(self, chunk):
+        if not self._started:
+            self._started = True
+            try:
+                return self._decoder.decompress(chunk)
+            except zlib.error:
+                self._decoder = zlib.decompressobj(-zlib.MAX_WBITS)
+        return self._decoder.decompress(chunk)
+
+    def flush(self):
+        return self._decoder.flush()
+
+
+def _decoder(content_encoding):
+    """
+    Incremental decoder of a content encoding
+    :param content_encoding: value of the Content-Encoding header
+    :return: object with decompress and flush methods, None for content that is not encoded
+    """
+    content_encoding = content_encoding.strip().lower()
+    if content_encoding in ('gzip', 'x-gzip'):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if content_encoding == 'deflate':
+        return _DeflateDecoder()
+    return None
+
+
+def _add_stats(log, totals, stats):
+    """
+    Add a request to a transport's log and totals (call with the transport's lock held)
+    :return:
+    """
+    log.append(stats)
+    totals['requests'] += 1
+    totals['reused'] += int(stats.reused)
+    totals['bytes_received'] += stats.bytes_received
+    totals['bytes_decoded'] += stats.bytes_decoded
+    totals['seconds'] += stats.seconds
+
+
+def _record_request(stats):
+    """
+    Add a request to the instrumentation registry
+    :param stats: RequestStats
+    :return:
+    """
+    instrument.record('transport.request', stats.seconds)
+    instrument.count('transport.requests')
+    instrument.count('transport.reused', int(stats.reused))
+    instrument.count('transport.bytes_received', stats.bytes_received)
+    instrument.count('transport.bytes_decoded', stats.bytes_decoded)